@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks of the pmx/pmd/vmd parsers and the pmx cleaner.
+
+Blender is not needed. Synthetic files are generated in a temporary folder
+and each benchmark runs in its own process, so that its peak memory can be
+measured. The results are written as JSON to compare them between changes:
+
+    python -m benchmarks.run [--vertices N] [--repeat N] [-o results.json] [BENCHMARK...]
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None # not available on Windows
+
+from mmd_tools.core import pmd
+from mmd_tools.core import pmx
+from mmd_tools.core import vmd
+try:
+    from mmd_tools.core.pmx.cleaner import PMXCleaner
+except ImportError:
+    PMXCleaner = None # older versions clean models in the importer, which needs Blender
+
+from benchmarks import synthetic
+
+
+def _peakRSS():
+    """ Return the peak resident set size of this process in MB, or None. """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / (1024.0 * 1024.0) # bytes
+    return rss / 1024.0 # kilobytes
+
+def _time(func, setup=None, repeat=3):
+    times = []
+    for i in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _pmxLoad(files, repeat):
+    path = files['pmx']
+    return _time(lambda x: pmx.load(path), repeat=repeat), os.path.getsize(path)
+
+def _pmxSave(files, repeat):
+    path = files['pmx']
+    model = pmx.load(path)
+    out = path + '.out.pmx'
+    uvs = model.header.additional_uvs
+    times = _time(lambda x: pmx.save(out, model, add_uv_count=uvs), repeat=repeat)
+    return times, os.path.getsize(out)
+
+def _pmdLoad(files, repeat):
+    path = files['pmd']
+    return _time(lambda x: pmd.load(path), repeat=repeat), os.path.getsize(path)
+
+def _vmdLoad(files, repeat):
+    path = files['vmd']
+    return _time(lambda x: vmd.File().load(filepath=path), repeat=repeat), os.path.getsize(path)
+
+def _vmdSave(files, repeat):
+    path = files['vmd']
+    f = vmd.File()
+    f.load(filepath=path)
+    out = path + '.out.vmd'
+    times = _time(lambda x: f.save(filepath=out), repeat=repeat)
+    return times, os.path.getsize(out)
+
+def _pmxClean(files, repeat):
+    path = files['pmx']
+    times = _time(lambda model: PMXCleaner.clean(model, False), lambda: pmx.load(path), repeat=repeat)
+    return times, os.path.getsize(path)
+
+def _pmxRemoveDoubles(files, repeat):
+    path = files['pmx']
+    def setup():
+        model = pmx.load(path)
+        PMXCleaner.clean(model, False)
+        return model
+    times = _time(lambda model: PMXCleaner.remove_doubles(model, False), setup, repeat=repeat)
+    return times, os.path.getsize(path)
+
+# name: (function, input file, the unit of the items of the input)
+BENCHMARKS = collections.OrderedDict([
+    ('pmx.load', (_pmxLoad, 'pmx', 'vertices')),
+    ('pmx.save', (_pmxSave, 'pmx', 'vertices')),
+    ('pmd.load', (_pmdLoad, 'pmd', 'vertices')),
+    ('vmd.load', (_vmdLoad, 'vmd', 'keys')),
+    ('vmd.save', (_vmdSave, 'vmd', 'keys')),
+    ('pmx.clean', (_pmxClean, 'pmx', 'vertices')),
+    ('pmx.remove_doubles', (_pmxRemoveDoubles, 'pmx', 'vertices')),
+    ])
+if PMXCleaner is None:
+    del BENCHMARKS['pmx.clean'], BENCHMARKS['pmx.remove_doubles']
+
+
+def _generate(folder, options):
+    files = {}
+    counts = {}
+    files['pmx'] = os.path.join(folder, 'synthetic.pmx')
+    synthetic.write_pmx(files['pmx'], **options['pmx'])
+    counts['pmx'] = options['pmx']['vertices']
+    files['pmd'] = os.path.join(folder, 'synthetic.pmd')
+    synthetic.write_pmd(files['pmd'], **options['pmd'])
+    counts['pmd'] = options['pmd']['vertices']
+    files['vmd'] = os.path.join(folder, 'synthetic.vmd')
+    synthetic.write_vmd(files['vmd'], **options['vmd'])
+    counts['vmd'] = options['vmd']['frames'] * (options['vmd']['bones'] + options['vmd']['morphs'])
+    return files, counts
+
+def _run(name, files, repeat):
+    func = BENCHMARKS[name][0]
+    # warnings of the cleaner would flood the output
+    logging.getLogger().setLevel(logging.ERROR)
+    base_rss = _peakRSS()
+    times, size = func(files, repeat)
+    return times, size, base_rss, _peakRSS()
+
+def _result(name, times, size, count, base_rss, peak_rss):
+    unit = BENCHMARKS[name][2]
+    best = min(times)
+    result = collections.OrderedDict()
+    result['name'] = name
+    result['repeat'] = len(times)
+    result['times'] = times
+    result['best'] = best
+    result['mean'] = sum(times) / len(times)
+    result['bytes'] = size
+    result['mb_per_s'] = size / (1024.0 * 1024.0) / best if best > 0 else None
+    result[unit] = count
+    result[unit + '_per_s'] = count / best if best > 0 else None
+    result['base_rss_mb'] = base_rss
+    result['peak_rss_mb'] = peak_rss
+    return result
+
+
+def run(names=None, options=None, repeat=3, folder=None):
+    """ Run the benchmarks of names (default: all) and return the report as a dict.
+
+    options has the keyword arguments of synthetic.write_pmx(), write_pmd()
+    and write_vmd() under the keys 'pmx', 'pmd' and 'vmd'. The files are
+    generated in folder, or in a temporary folder which is removed after.
+    """
+    names = list(names or BENCHMARKS.keys())
+    options = options or {}
+    options = {i:dict(options.get(i, {})) for i in ('pmx', 'pmd', 'vmd')}
+    options['pmx'].setdefault('vertices', 100000)
+    options['pmd'].setdefault('vertices', min(options['pmx']['vertices'], 0xffff))
+    options['vmd'].setdefault('bones', 100)
+    options['vmd'].setdefault('frames', 1000)
+    options['vmd'].setdefault('morphs', 0)
+
+    temp_folder = None
+    if folder is None:
+        folder = temp_folder = tempfile.mkdtemp(prefix='mmd_tools_benchmark_')
+    try:
+        # every step runs in a new process, so the memory of one step does
+        # not count for the next one
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            files, counts = executor.submit(_generate, folder, options).result()
+        results = []
+        for name in names:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                times, size, base_rss, peak_rss = executor.submit(_run, name, files, repeat).result()
+            results.append(_result(name, times, size, counts[BENCHMARKS[name][1]], base_rss, peak_rss))
+    finally:
+        if temp_folder is not None:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    report = collections.OrderedDict()
+    report['version'] = 1
+    report['time'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    report['python'] = platform.python_version()
+    report['numpy'] = np.__version__
+    report['platform'] = platform.platform()
+    report['options'] = options
+    report['benchmarks'] = results
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description='Benchmark the pmx/pmd/vmd parsers with synthetic files.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='benchmarks to run (default: all): %s'%', '.join(BENCHMARKS.keys()))
+    parser.add_argument('-o', '--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of runs of each benchmark')
+    parser.add_argument('--folder', help='generate the files in this folder and keep them')
+    parser.add_argument('--seed', type=int, default=0)
+
+    group = parser.add_argument_group('pmx/pmd model')
+    group.add_argument('--vertices', type=int, default=100000)
+    group.add_argument('--faces', type=int, default=None, help='default: twice the number of vertices')
+    group.add_argument('--weight-mix', default='0.3,0.4,0.2,0.1',
+                       help='fractions of BDEF1, BDEF2, BDEF4 and SDEF vertices')
+    group.add_argument('--additional-uvs', type=int, default=0, choices=range(5))
+    group.add_argument('--duplicates', type=float, default=0.1, help='fraction of vertices at the position of another one')
+    group.add_argument('--materials', type=int, default=10)
+    group.add_argument('--bones', type=int, default=100)
+    group.add_argument('--morphs', type=int, default=20)
+    group.add_argument('--morph-offsets', type=int, default=500, help='number of offsets of each morph')
+    group.add_argument('--rigids', type=int, default=50)
+    group.add_argument('--joints', type=int, default=None, help='default: the number of rigid bodies - 1')
+
+    group = parser.add_argument_group('vmd motion')
+    group.add_argument('--vmd-bones', type=int, default=100)
+    group.add_argument('--vmd-frames', type=int, default=1000)
+    group.add_argument('--vmd-morphs', type=int, default=0)
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s'%name)
+
+    model = dict(
+        vertices=args.vertices,
+        faces=args.faces,
+        materials=args.materials,
+        bones=args.bones,
+        morphs=args.morphs,
+        morph_offsets=args.morph_offsets,
+        rigids=args.rigids,
+        joints=args.joints,
+        seed=args.seed,
+        )
+    options = {
+        'pmx': dict(model,
+                    weight_mix=tuple(float(i) for i in args.weight_mix.split(',')),
+                    additional_uvs=args.additional_uvs,
+                    duplicates=args.duplicates),
+        'pmd': dict(model, vertices=min(args.vertices, 0xffff)),
+        'vmd': dict(bones=args.vmd_bones, frames=args.vmd_frames, morphs=args.vmd_morphs, seed=args.seed),
+        }
+    if args.folder and not os.path.isdir(args.folder):
+        os.makedirs(args.folder)
+    report = run(args.benchmarks, options, args.repeat, args.folder)
+
+    for r in report['benchmarks']:
+        unit = BENCHMARKS[r['name']][2]
+        sys.stderr.write('%-20s %9.4fs %9.1f MB/s %12.0f %s/s%s\n'%(
+            r['name'], r['best'], r['mb_per_s'] or 0, r[unit + '_per_s'] or 0, unit,
+            '' if r['peak_rss_mb'] is None else '  peak RSS %.1f MB'%r['peak_rss_mb']))
+
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
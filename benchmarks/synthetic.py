@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+""" Generators of synthetic pmx/pmd/vmd files for the benchmarks.
+
+The data is random, but deterministic for a given seed, and it is built
+with NumPy where the files are large, so generating big models is fast.
+The files are packed with struct and NumPy only, without mmd_tools, so the
+same files can be generated to benchmark any version of the parsers.
+"""
+import struct
+
+import numpy as np
+
+# the fractions of BDEF1, BDEF2, BDEF4 and SDEF vertices
+DEFAULT_WEIGHT_MIX = (0.3, 0.4, 0.2, 0.1)
+
+BDEF1, BDEF2, BDEF4, SDEF = range(4)
+
+
+def _faceArray(rng, num_vertices, num_faces):
+    return rng.randint(0, num_vertices, (num_faces, 3))
+
+def _splitCounts(total, parts):
+    counts = [total // parts] * parts
+    counts[-1] += total - sum(counts)
+    return counts
+
+
+class _Packer:
+    """ Collects little endian data of a file. """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def pack(self, fmt, *values):
+        self.data.extend(struct.pack('<' + fmt, *values))
+
+    def array(self, array):
+        self.data.extend(np.ascontiguousarray(array).tobytes())
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+def _indexFormat(count, signed):
+    """ Return the struct format of pmx indices of count items, as pmx.Header chooses it. """
+    s = 2 if signed else 1
+    if (1<<8)/s > count:
+        return 'b' if signed else 'B'
+    elif (1<<16)/s > count:
+        return 'h' if signed else 'H'
+    return 'i'
+
+def _pmxVertexDtype(weight_type, additional_uvs, bone_format):
+    fields = [('co', '<f4', (3,)), ('normal', '<f4', (3,)), ('uv', '<f4', (2,))]
+    if additional_uvs:
+        fields.append(('additional_uvs', '<f4', (additional_uvs, 4)))
+    fields.append(('weight_type', 'u1'))
+    fields.append(('bones', '<' + bone_format, (4 if weight_type == BDEF4 else 2 if weight_type != BDEF1 else 1,)))
+    if weight_type == BDEF4:
+        fields.append(('weights', '<f4', (4,)))
+    elif weight_type != BDEF1:
+        fields.append(('weights', '<f4', (1,)))
+    if weight_type == SDEF:
+        fields.append(('sdef', '<f4', (9,)))
+    fields.append(('edge_scale', '<f4'))
+    return np.dtype(fields)
+
+def _pmxVertices(rng, vertices, weight_mix, additional_uvs, bones, duplicates, bone_format):
+    """ Return the vertex records of a pmx file as bytes. """
+    co = rng.uniform(-10.0, 10.0, (vertices, 3))
+    if vertices > 0:
+        dup = rng.rand(vertices) < duplicates
+        co[dup] = co[rng.randint(0, vertices, int(dup.sum()))]
+    normal = rng.normal(size=(vertices, 3))
+    normal /= np.maximum(np.linalg.norm(normal, axis=1), 1e-6)[:, None]
+    uv = rng.rand(vertices, 2)
+    add_uv = rng.rand(vertices, additional_uvs, 4)
+
+    p = np.asarray(weight_mix, dtype=np.float64)
+    weight_type = rng.choice(4, vertices, p=p/p.sum())
+    bone_indices = rng.randint(0, bones, (vertices, 4))
+    w = rng.rand(vertices, 4)
+    weights = w / w.sum(axis=1)[:, None]
+    sdef = rng.uniform(-1.0, 1.0, (vertices, 9))
+
+    dtypes = [_pmxVertexDtype(t, additional_uvs, bone_format) for t in range(4)]
+    sizes = np.array([d.itemsize for d in dtypes])[weight_type]
+    starts = np.cumsum(sizes) - sizes
+    data = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for t, dtype in enumerate(dtypes):
+        rows = np.flatnonzero(weight_type == t)
+        records = np.zeros(len(rows), dtype)
+        records['co'] = co[rows]
+        records['normal'] = normal[rows]
+        records['uv'] = uv[rows]
+        if additional_uvs:
+            records['additional_uvs'] = add_uv[rows]
+        records['weight_type'] = t
+        records['bones'] = bone_indices[rows, :dtype['bones'].shape[0]]
+        if t == BDEF4:
+            records['weights'] = weights[rows]
+        elif t != BDEF1:
+            records['weights'] = weights[rows, :1]
+        if t == SDEF:
+            records['sdef'] = sdef[rows]
+        records['edge_scale'] = 1.0
+        positions = starts[rows][:, None] + np.arange(dtype.itemsize)
+        data[positions] = records.view(np.uint8).reshape(-1, dtype.itemsize)
+    return data
+
+def write_pmx(path, vertices=10000, faces=None, weight_mix=DEFAULT_WEIGHT_MIX, additional_uvs=0,
+              materials=10, bones=100, morphs=20, morph_offsets=500, rigids=50, joints=None,
+              duplicates=0.1, seed=0):
+    """ Write a pmx file filled with random data.
+
+    faces defaults to twice the number of vertices. weight_mix is the
+    fraction of BDEF1, BDEF2, BDEF4 and SDEF vertices. A fraction duplicates
+    of the vertices copies the position of another vertex, so remove_doubles
+    has work to do. Three quarters of the morphs are vertex morphs and the
+    rest uv morphs, each with morph_offsets offsets. joints defaults to one
+    joint between each pair of consecutive rigid bodies.
+    """
+    rng = np.random.RandomState(seed)
+    if faces is None:
+        faces = vertices * 2
+    if vertices == 0:
+        faces = 0
+    if joints is None:
+        joints = max(0, rigids - 1)
+    bones = max(1, bones)
+    materials = max(1, materials)
+    additional_uvs = max(0, min(4, additional_uvs))
+
+    vertex_format = _indexFormat(vertices, False)
+    texture_format = _indexFormat(materials, True)
+    material_format = _indexFormat(materials, True)
+    bone_format = _indexFormat(bones, True)
+    morph_format = _indexFormat(morphs, True)
+    rigid_format = _indexFormat(rigids, True)
+
+    out = _Packer()
+    def text(value):
+        data = value.encode('utf-16-le')
+        out.pack('i', len(data))
+        out.data.extend(data)
+
+    out.data += b'PMX '
+    out.pack('fB', 2.0, 8)
+    out.pack('8B', 0, additional_uvs, *[struct.calcsize(i) for i in (vertex_format, texture_format,
+        material_format, bone_format, morph_format, rigid_format)])
+    comment = 'vertices %d, faces %d, seed %d'%(vertices, faces, seed)
+    text('合成モデル')
+    text('synthetic model')
+    text(comment)
+    text(comment)
+
+    out.pack('i', vertices)
+    out.array(_pmxVertices(rng, vertices, weight_mix, additional_uvs, bones, duplicates, bone_format))
+
+    out.pack('i', faces * 3)
+    out.array(_faceArray(rng, max(1, vertices), faces).astype('<' + vertex_format))
+
+    out.pack('i', materials)
+    for i in range(materials):
+        text('tex%d.png'%i)
+
+    out.pack('i', materials)
+    for i, count in enumerate(_splitCounts(faces, materials)):
+        text('材質%d'%i)
+        text('material%d'%i)
+        out.pack('4f3ff3fB4ff', 0.8, 0.8, 0.8, 1.0, 0.1, 0.1, 0.1, 5.0, 0.4, 0.4, 0.4, 0,
+                 0.0, 0.0, 0.0, 1.0, 1.0)
+        out.pack(texture_format * 2 + 'bbb', i, -1, 0, 1, 0) # shared toon 0
+        text('')
+        out.pack('i', count * 3)
+
+    out.pack('i', bones)
+    for i in range(bones):
+        ik = i % 10 == 9
+        additional = i % 10 == 5
+        text('ボーン%d'%i)
+        text('bone%d'%i)
+        out.pack('3f', *rng.uniform(-10.0, 10.0, 3).tolist())
+        # connected to a bone, rotatable, movable, visible, controllable
+        flags = 0x001f | (0x0020 if ik else 0) | (0x0100 if additional else 0)
+        out.pack(bone_format + 'iH' + bone_format, i - 1, 0, flags, i + 1 if i + 1 < bones else -1)
+        if additional:
+            out.pack(bone_format + 'f', i - 1, 0.5)
+        if ik:
+            out.pack(bone_format + 'ifi', i - 1, 40, 1.0, 2)
+            out.pack(bone_format + 'B6f', max(0, i - 2), 1, -3.14, 0.0, 0.0, -0.01, 0.0, 0.0)
+            out.pack(bone_format + 'B', max(0, i - 3), 0)
+
+    vertex_offset = np.dtype([('index', '<' + vertex_format), ('offset', '<f4', (3,))])
+    uv_offset = np.dtype([('index', '<' + vertex_format), ('offset', '<f4', (4,))])
+    num_uv_morphs = morphs // 4
+    out.pack('i', morphs)
+    for i in range(morphs):
+        text('モーフ%d'%i)
+        text('morph%d'%i)
+        if i < morphs - num_uv_morphs:
+            out.pack('bb', 1 + i % 4, 1)
+            dtype = vertex_offset
+        else:
+            out.pack('bb', 4, 3)
+            dtype = uv_offset
+        count = min(vertices, morph_offsets)
+        offsets = np.zeros(count, dtype)
+        if count:
+            offsets['index'] = rng.choice(vertices, count, replace=False)
+        offsets['offset'] = rng.uniform(-0.1, 0.1, offsets['offset'].shape)
+        out.pack('i', count)
+        out.array(offsets)
+
+    out.pack('i', 2)
+    text('Root')
+    text('Root')
+    out.pack('Bi', 1, 1)
+    out.pack('B' + bone_format, 0, 0)
+    text('表情')
+    text('Facial')
+    out.pack('Bi', 1, morphs)
+    for i in range(morphs):
+        out.pack('B' + morph_format, 1, i)
+
+    out.pack('i', rigids)
+    for i in range(rigids):
+        text('剛体%d'%i)
+        text('rigid%d'%i)
+        out.pack(bone_format + 'bHB', i % bones, i % 16, 0xffff, i % 3)
+        out.pack('3f', *rng.uniform(0.1, 1.0, 3).tolist())
+        out.pack('3f', *rng.uniform(-10.0, 10.0, 3).tolist())
+        out.pack('3f', *rng.uniform(-3.14, 3.14, 3).tolist())
+        out.pack('5fB', 1.0, 0.5, 0.5, 0.0, 0.5, 1 if i else 0)
+
+    out.pack('i', joints)
+    for i in range(joints):
+        text('ジョイント%d'%i)
+        text('joint%d'%i)
+        out.pack('B' + rigid_format * 2, 0, i % max(1, rigids), (i + 1) % max(1, rigids))
+        out.pack('3f', *rng.uniform(-10.0, 10.0, 3).tolist())
+        out.pack('21f', 0.0, 0.0, 0.0, # rotation
+                 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, # minimum/maximum location
+                 -0.5, -0.5, -0.5, 0.5, 0.5, 0.5, # minimum/maximum rotation
+                 0.0, 0.0, 0.0, 10.0, 10.0, 10.0) # spring constants
+
+    out.write(path)
+
+
+_PMD_VERTEX = np.dtype([
+    ('co', '<f4', (3,)),
+    ('normal', '<f4', (3,)),
+    ('uv', '<f4', (2,)),
+    ('bones', '<u2', (2,)),
+    ('weight', 'u1'),
+    ('enable_edge', 'u1'),
+    ])
+
+def _fixedStr(size, text):
+    data = text.encode('shift_jis')[:size]
+    return data + b'\0' * (size - len(data))
+
+def write_pmd(path, vertices=10000, faces=None, materials=10, bones=100, morphs=20,
+              morph_offsets=500, rigids=50, joints=None, seed=0):
+    """ Write a pmd file filled with random data.
+
+    The arguments are the same as of write_pmx(). pmd stores vertex indices
+    as 16 bit values, so vertices must be less than 65536.
+    """
+    if vertices >= 0x10000:
+        raise ValueError('pmd files have less than 65536 vertices')
+    rng = np.random.RandomState(seed)
+    if faces is None:
+        faces = vertices * 2
+    if joints is None:
+        joints = max(0, rigids - 1)
+    bones = max(1, bones)
+    morph_offsets = min(vertices, morph_offsets)
+
+    out = _Packer()
+    pack = out.pack
+    out.data += b'Pmd'
+    pack('f', 1.0)
+    out.data += _fixedStr(20, '合成モデル')
+    out.data += _fixedStr(256, 'vertices %d, faces %d, seed %d'%(vertices, faces, seed))
+
+    v = np.zeros(vertices, _PMD_VERTEX)
+    v['co'] = rng.uniform(-10.0, 10.0, (vertices, 3))
+    v['normal'] = rng.uniform(-1.0, 1.0, (vertices, 3))
+    v['uv'] = rng.rand(vertices, 2)
+    v['bones'] = rng.randint(0, bones, (vertices, 2))
+    v['weight'] = rng.randint(0, 101, vertices)
+    v['enable_edge'] = rng.randint(0, 2, vertices)
+    pack('I', vertices)
+    out.array(v)
+
+    face_indices = _faceArray(rng, max(1, vertices), faces if vertices else 0).astype('<u2')
+    pack('I', face_indices.size)
+    out.array(face_indices)
+
+    counts = _splitCounts(len(face_indices), max(1, materials))
+    pack('I', len(counts))
+    for i, count in enumerate(counts):
+        pack('4ff3f3fbBI', 0.8, 0.8, 0.8, 1.0, 5.0, 0.1, 0.1, 0.1, 0.4, 0.4, 0.4, i % 10, 1, count * 3)
+        out.data += _fixedStr(20, 'tex%d.png'%i)
+
+    ik_bones = [i for i in range(bones) if i % 10 == 9]
+    pack('H', bones)
+    for i in range(bones):
+        out.data += _fixedStr(20, 'ボーン%d'%i)
+        pack('HHB', 0xffff if i == 0 else i - 1, 0xffff if i + 1 == bones else i + 1, 2 if i in ik_bones else 0)
+        pack('H', 0)
+        pack('3f', *rng.uniform(-10.0, 10.0, 3).tolist())
+    pack('H', len(ik_bones))
+    for i in ik_bones:
+        pack('HHBHf', i, i - 1, 2, 15, 0.5)
+        pack('HH', max(0, i - 2), max(0, i - 3))
+
+    pack('H', morphs + 1 if morphs else 0)
+    if morphs:
+        base = np.sort(rng.choice(max(1, vertices), morph_offsets, replace=False))
+        out.data += _fixedStr(20, 'base')
+        pack('IB', morph_offsets, 0)
+        for index, offset in zip(base.tolist(), rng.uniform(-10.0, 10.0, (morph_offsets, 3)).tolist()):
+            pack('I3f', index, *offset)
+        for i in range(morphs):
+            out.data += _fixedStr(20, 'モーフ%d'%i)
+            pack('IB', morph_offsets, 1 + i % 4)
+            offsets = rng.uniform(-0.1, 0.1, (morph_offsets, 3)).tolist()
+            for index, offset in zip(range(morph_offsets), offsets):
+                pack('I3f', index, *offset)
+    pack('B', morphs)
+    for i in range(morphs):
+        pack('H', i + 1)
+    pack('B', 1)
+    out.data += _fixedStr(50, '枠')
+    pack('I', min(bones - 1, 10))
+    for i in range(1, min(bones, 11)):
+        pack('HB', i, 1)
+
+    pack('B', 1)
+    out.data += _fixedStr(20, 'synthetic model')
+    out.data += _fixedStr(256, 'english comment')
+    for i in range(bones):
+        out.data += _fixedStr(20, 'bone%d'%i)
+    for i in range(morphs):
+        out.data += _fixedStr(20, 'morph%d'%i)
+    out.data += _fixedStr(50, 'frame')
+    for i in range(10):
+        out.data += _fixedStr(100, 'toon%02d.bmp'%(i + 1))
+
+    pack('I', rigids)
+    for i in range(rigids):
+        out.data += _fixedStr(20, '剛体%d'%i)
+        pack('HBHB', i % bones, i % 16, 0xffff, i % 3)
+        pack('3f3f3f', *rng.uniform(0.1, 1.0, 9).tolist())
+        pack('5fB', 1.0, 0.5, 0.5, 0.0, 0.5, 1 if i else 0)
+    pack('I', joints)
+    for i in range(joints):
+        out.data += _fixedStr(20, 'joint%d'%i)
+        pack('II', i % max(1, rigids), (i + 1) % max(1, rigids))
+        pack('24f', *rng.uniform(-1.0, 1.0, 24).tolist())
+
+    out.write(path)
+
+
+_VMD_BONE_KEY = np.dtype([
+    ('name', 'S15'),
+    ('frame_number', '<u4'),
+    ('location', '<f4', (3,)),
+    ('rotation', '<f4', (4,)),
+    ('interp', 'i1', (64,)),
+    ])
+
+_VMD_SHAPE_KEY = np.dtype([
+    ('name', 'S15'),
+    ('frame_number', '<u4'),
+    ('weight', '<f4'),
+    ])
+
+def write_vmd(path, bones=100, frames=1000, morphs=0, camera_frames=0, seed=0):
+    """ Write a vmd file with a key at every frame of frames for each bone and morph. """
+    rng = np.random.RandomState(seed)
+    out = _Packer()
+    out.data += _fixedStr(30, 'Vocaloid Motion Data 0002')
+    out.data += _fixedStr(20, '合成モデル')
+
+    out.pack('I', bones * frames)
+    for i in range(bones):
+        keys = np.zeros(frames, _VMD_BONE_KEY)
+        keys['name'] = _fixedStr(15, 'ボーン%d'%i)
+        keys['frame_number'] = np.arange(frames)
+        keys['location'] = rng.uniform(-1.0, 1.0, (frames, 3))
+        keys['rotation'] = rng.uniform(-1.0, 1.0, (frames, 4))
+        keys['interp'] = rng.randint(0, 128, (frames, 64))
+        out.array(keys)
+
+    out.pack('I', morphs * frames)
+    for i in range(morphs):
+        keys = np.zeros(frames, _VMD_SHAPE_KEY)
+        keys['name'] = _fixedStr(15, 'モーフ%d'%i)
+        keys['frame_number'] = np.arange(frames)
+        keys['weight'] = rng.rand(frames)
+        out.array(keys)
+
+    out.pack('I', camera_frames)
+    for i in range(camera_frames):
+        out.pack('If3f3f', i, -45.0, *(rng.uniform(-10.0, 10.0, 3).tolist() + rng.uniform(-3.14, 3.14, 3).tolist()))
+        out.pack('24b', *rng.randint(0, 128, 24).tolist())
+        out.pack('Ib', 30, 0) # perspective
+    out.pack('I', 0) # lamp keys
+
+    out.write(path)
@@ -19,47 +19,76 @@ if "bpy" in locals():
     importlib.reload(operators)
     importlib.reload(panels)
 else:
-    import bpy
     import logging
-    from bpy.types import AddonPreferences
-    from bpy.props import StringProperty
-    
-    from . import properties
-    from . import operators
-    from . import panels
+    try:
+        import bpy
+    except ImportError:
+        # outside of Blender only mmd_tools.core can be used (see mmd_tools.core.batch)
+        bpy = None
+
+    if bpy is not None:
+        from bpy.types import AddonPreferences
+        from bpy.props import StringProperty
+        from bpy.props import IntProperty
+
+        from . import properties
+        from . import operators
+        from . import panels
 
 
 logging.basicConfig(format='%(message)s')
 
 
-class MMDToolsAddonPreferences(AddonPreferences):
-    # this must match the addon name, use '__package__'
-    # when defining this in a submodule of a python package.
-    bl_idname = __name__
-
-    shared_toon_folder = StringProperty(
-            name="Shared Toon Texture Folder",
-            description=('Directory path to toon textures. This is normally the ' +
-                         '"Data" directory within of your MikuMikuDance directory'),
-            subtype='DIR_PATH',
-            )
-    base_texture_folder = StringProperty(
-            name='Base Texture Folder',
-            description='Path for textures shared between models',
-            subtype='DIR_PATH',
-            )
-    dictionary_folder = StringProperty(
-            name='Dictionary Folder',
-            description='Path for searching csv dictionaries',
-            subtype='DIR_PATH',
-            default=__file__[:-11],
-            )
-
-    def draw(self, context):
-        layout = self.layout
-        layout.prop(self, "shared_toon_folder")
-        layout.prop(self, "base_texture_folder")
-        layout.prop(self, "dictionary_folder")
+if bpy is not None:
+    class MMDToolsAddonPreferences(AddonPreferences):
+        # this must match the addon name, use '__package__'
+        # when defining this in a submodule of a python package.
+        bl_idname = __name__
+
+        shared_toon_folder = StringProperty(
+                name="Shared Toon Texture Folder",
+                description=('Directory path to toon textures. This is normally the ' +
+                             '"Data" directory within of your MikuMikuDance directory'),
+                subtype='DIR_PATH',
+                )
+        base_texture_folder = StringProperty(
+                name='Base Texture Folder',
+                description='Path for textures shared between models',
+                subtype='DIR_PATH',
+                )
+        dictionary_folder = StringProperty(
+                name='Dictionary Folder',
+                description='Path for searching csv dictionaries',
+                subtype='DIR_PATH',
+                default=__file__[:-11],
+                )
+        model_cache_folder = StringProperty(
+                name='Model Cache Folder',
+                description=('Path for caching imported models to speed up importing them again ' +
+                             '(leave empty to disable the cache)'),
+                subtype='DIR_PATH',
+                )
+        model_cache_size = IntProperty(
+                name='Model Cache Size (MB)',
+                description='Maximum size of the model cache folder',
+                min=1,
+                default=1024,
+                )
+        export_cache_size = IntProperty(
+                name='Export Cache Size (MB)',
+                description='Maximum memory of the meshes kept for incremental exports',
+                min=1,
+                default=256,
+                )
+
+        def draw(self, context):
+            layout = self.layout
+            layout.prop(self, "shared_toon_folder")
+            layout.prop(self, "base_texture_folder")
+            layout.prop(self, "dictionary_folder")
+            layout.prop(self, "model_cache_folder")
+            layout.prop(self, "model_cache_size")
+            layout.prop(self, "export_cache_size")
 
 
 def menu_func_import(self, context):
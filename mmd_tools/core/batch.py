@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+""" Load many PMX/PMD files in parallel.
+
+Each file is parsed in a worker process. This module can also be used from
+the command line outside of Blender to validate a set of models:
+
+    python -m mmd_tools.core.batch [-j JOBS] [-v] FILE_OR_DIRECTORY...
+"""
+import argparse
+import collections
+import concurrent.futures
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from mmd_tools.core import pmd
+from mmd_tools.core import pmx
+
+LOADERS = {
+    '.pmx': pmx.load,
+    '.pmd': pmd.load,
+    }
+
+
+class Result:
+    """ The outcome of loading one file.
+
+    loaded is False if the file could not be loaded. errors has the messages
+    logged as errors while loading, e.g. ' * Corrupted file: ...' for a
+    truncated file whose model was only partially loaded. counts has the
+    number of items of each section of the model.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.loaded = False
+        self.errors = []
+        self.elapsed = 0.0
+        self.counts = collections.OrderedDict()
+        self.__model = None
+        self.__packed = False
+
+    @property
+    def ok(self):
+        return self.loaded and len(self.errors) == 0
+
+    @property
+    def model(self):
+        """ The loaded pmx.Model or pmd.Model, or None. """
+        if self.__packed:
+            _unpackModel(self.__model)
+            self.__packed = False
+        return self.__model
+
+    @model.setter
+    def model(self, model):
+        self.__model = model
+        self.__packed = False
+
+    def pack(self):
+        """ Replace the large lists of the model with arrays to pickle it quickly. """
+        if self.__model is not None and not self.__packed:
+            _packModel(self.__model)
+            self.__packed = True
+
+    def __repr__(self):
+        return '<Result path %s, ok %s, errors %s>'%(self.path, str(self.ok), str(self.errors))
+
+
+class _ErrorHandler(logging.Handler):
+    def __init__(self, errors):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.errors = errors
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+
+def _packModel(model):
+    # long lists of tuples or small objects are slow to pickle, so faces and
+    # pmd vertices are sent as arrays (pmx vertices are already arrays)
+    model.faces = np.array(model.faces, dtype=np.int64).reshape(-1, 3)
+    if isinstance(model, pmd.Model):
+        model.vertices = pmd.Vertex.toRecords(model.vertices)
+
+def _unpackModel(model):
+    model.faces = list(zip(*model.faces.T.tolist()))
+    if isinstance(model, pmd.Model):
+        model.vertices = pmd.RecordList(pmd.Vertex, model.vertices)
+
+
+def _counts(model):
+    rigids = model.rigids if isinstance(model, pmx.Model) else model.rigid_bodies
+    return collections.OrderedDict([
+        ('vertices', len(model.vertices)),
+        ('faces', len(model.faces)),
+        ('materials', len(model.materials)),
+        ('bones', len(model.bones)),
+        ('morphs', len(model.morphs)),
+        ('rigids', len(rigids)),
+        ('joints', len(model.joints)),
+        ])
+
+
+def _load(path, log_level=None):
+    result = Result(path)
+    handler = _ErrorHandler(result.errors)
+    logger = logging.getLogger()
+    level = logger.level
+    # errors have to pass the logger to be captured
+    logger.setLevel(min(logging.ERROR, level if log_level is None else log_level))
+    logger.addHandler(handler)
+    start = time.time()
+    try:
+        loader = LOADERS.get(os.path.splitext(path)[1].lower(), None)
+        if loader is None:
+            raise ValueError('unsupported file type: %s'%path)
+        result.model = loader(path)
+        result.loaded = True
+        result.counts = _counts(result.model)
+    except Exception as e:
+        logging.error(' * Failed to load %s: %s', path, e)
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+    result.elapsed = time.time() - start
+    return result
+
+def _loadInWorker(path, log_level, keep_models):
+    result = _load(path, log_level)
+    if keep_models:
+        result.pack()
+    else:
+        result.model = None
+    return result
+
+
+def load(paths, max_workers=None, log_level=None, keep_models=True):
+    """ Load the pmx/pmd files of paths in a pool of worker processes.
+
+    Returns a list of Result in the order of paths. A file which fails to
+    load does not stop the others; its error is kept in its Result.
+    log_level sets the level of the root logger while loading, also in the
+    worker processes. If keep_models is False, only the counts of the models
+    are returned, which saves sending the models back from the workers.
+    """
+    paths = list(paths)
+    if max_workers == 1 or len(paths) < 2:
+        results = [_load(i, log_level) for i in paths]
+        if not keep_models:
+            for r in results:
+                r.model = None
+        return results
+
+    num = len(paths)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_loadInWorker, paths, [log_level]*num, [keep_models]*num))
+
+
+def find_files(paths):
+    """ Expand directories of paths to the pmx/pmd files they contain. """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in LOADERS:
+                    yield os.path.join(root, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mmd_tools.core.batch',
+                                     description='Load pmx/pmd files in parallel and report the result of each file.')
+    parser.add_argument('paths', nargs='+', metavar='FILE_OR_DIRECTORY')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the info log of the loaders')
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    log_level = logging.INFO if args.verbose else logging.ERROR
+    results = load(find_files(args.paths), args.jobs, log_level, keep_models=False)
+    failed = 0
+    for r in results:
+        if not r.loaded:
+            status = 'FAILED'
+        elif r.errors:
+            status = 'CORRUPTED'
+        else:
+            status = 'OK'
+        if not r.ok:
+            failed += 1
+        print('%-9s %s (%.3fs)'%(status, r.path, r.elapsed))
+        if r.loaded:
+            print('          %s'%', '.join('%s %d'%i for i in r.counts.items()))
+        for msg in r.errors:
+            print('          %s'%msg.strip())
+    print('%d files, %d failed, %.3fs'%(len(results), failed, time.time() - start))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
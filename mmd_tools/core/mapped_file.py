@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+class MappedFile:
+    """ A read-only memory mapped file with a read position.
+
+    read() behaves like the read() of a binary file object. unpack() and
+    read_array() decode directly from the mapping without copying the data
+    into intermediate bytes objects.
+    """
+    def __init__(self, path):
+        self.__file = open(path, 'rb')
+        self.__pos = 0
+        self.__mmap = None
+        if os.fstat(self.__file.fileno()).st_size > 0:
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__mmap)
+        else:
+            self.__view = memoryview(b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def size(self):
+        return len(self.__view)
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, pos):
+        self.__pos = pos
+
+    def read(self, size=-1):
+        start = self.__pos
+        end = len(self.__view) if size < 0 else min(start + size, len(self.__view))
+        self.__pos = max(start, end)
+        return self.__view[start:end].tobytes()
+
+    def read_view(self, size):
+        """ Same as read(), but returns a memoryview of the mapping. """
+        start = self.__pos
+        end = min(start + size, len(self.__view))
+        self.__pos = max(start, end)
+        return self.__view[start:end]
+
+    def unpack(self, fmt):
+        """ Unpack a struct.Struct at the current position and advance. """
+        v = fmt.unpack_from(self.__view, self.__pos)
+        self.__pos += fmt.size
+        return v
+
+    def unpack_from(self, fmt, offset):
+        """ Unpack a struct.Struct at the given offset. """
+        return fmt.unpack_from(self.__view, offset)
+
+    def read_array(self, dtype, count):
+        """ Return the next count items of dtype as a read-only array.
+
+        The array shares memory with the mapping, so it is only valid until
+        the file is closed. Copy it to keep the data.
+        """
+        dtype = np.dtype(dtype)
+        size = dtype.itemsize * count
+        if self.__pos + size > len(self.__view):
+            raise struct.error('read_array requires a buffer of %d bytes'%size)
+        a = np.frombuffer(self.__view, dtype=dtype, count=count, offset=self.__pos)
+        self.__pos += size
+        return a
+
+    def close(self):
+        if self.__file is None:
+            return
+        try:
+            self.__view.release()
+            if self.__mmap is not None:
+                self.__mmap.close()
+        except BufferError:
+            # arrays from read_array() are still alive; the mapping is
+            # released when they are garbage collected
+            logging.debug('keep the mapping of "%s" open for live arrays', self.__file.name)
+        self.__file.close()
+        self.__file = None
@@ -1,17 +1,63 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
 import os
 
 import bpy
 from mmd_tools.bpyutils import addon_preferences, select_object
 from mmd_tools.core.exceptions import MaterialNotFoundError
+from mmd_tools.core.texture import ImageIndex, resolve_ncase
 
 SPHERE_MODE_OFF    = 0
 SPHERE_MODE_MULT   = 1
 SPHERE_MODE_ADD    = 2
 SPHERE_MODE_SUBTEX = 3
 
+
+class BatchUpdate:
+    """ Defer the updates of mmd_material properties.
+
+    While it is active (with BatchUpdate(): ...), setting a property of
+    mmd_material only records its FnMaterial update method. When it exits,
+    each recorded method runs once per material, in the order they were
+    first recorded, so setting many properties does not rebuild the state
+    of the material again and again. Nested batches are applied by the
+    outermost one.
+    """
+    __current = None
+
+    def __init__(self):
+        self.__materials = collections.OrderedDict()
+        self.__previous = None
+
+    @classmethod
+    def defer(cls, material, update_name):
+        """ Record the update of material if a batch is active. Returns False if not. """
+        batch = cls.__current
+        if batch is None:
+            return False
+        key = material.as_pointer()
+        if key not in batch.__materials:
+            batch.__materials[key] = (material, collections.OrderedDict())
+        batch.__materials[key][1][update_name] = None
+        return True
+
+    def __enter__(self):
+        self.__previous = BatchUpdate.__current
+        BatchUpdate.__current = self
+        return self
+
+    def __exit__(self, type, value, traceback):
+        BatchUpdate.__current = self.__previous
+        self.__previous = None
+        materials = self.__materials
+        self.__materials = collections.OrderedDict()
+        for material, update_names in materials.values():
+            for name in update_names:
+                if not BatchUpdate.defer(material, name):
+                    getattr(FnMaterial(material), name)()
+
 class FnMaterial(object):
     __BASE_TEX_SLOT = 0
     __TOON_TEX_SLOT = 1
@@ -98,27 +144,50 @@ class FnMaterial(object):
                 pass
         return False
 
-    def __load_image(self, filepath):
+    def __find_image(self, filepath):
+        index = ImageIndex.current()
+        if index is not None:
+            return index.findImage(filepath)
         for i in bpy.data.images:
             if self.__same_image_file(i, filepath):
                 return i
+        return None
+
+    def __load_image(self, filepath):
+        img = self.__find_image(filepath)
+        if img:
+            return img
 
         try:
-            return bpy.data.images.load(filepath)
+            img = bpy.data.images.load(filepath)
         except:
             logging.warning('Cannot create a texture for %s. No such file.', filepath)
-
-        img = bpy.data.images.new(os.path.basename(filepath), 1, 1)
-        img.source = 'FILE'
-        img.filepath = filepath
+            img = bpy.data.images.new(os.path.basename(filepath), 1, 1)
+            img.source = 'FILE'
+            img.filepath = filepath
+        index = ImageIndex.current()
+        if index is not None:
+            index.addImage(img)
         return img
 
-    def __load_texture(self, filepath):
+    def __find_texture(self, filepath):
+        index = ImageIndex.current()
+        if index is not None:
+            return index.findTexture(filepath)
         for t in bpy.data.textures:
             if t.type == 'IMAGE' and self.__same_image_file(t.image, filepath):
                 return t
+        return None
+
+    def __load_texture(self, filepath):
+        tex = self.__find_texture(filepath)
+        if tex:
+            return tex
         tex = bpy.data.textures.new(name=bpy.path.display_name_from_filepath(filepath), type='IMAGE')
         tex.image = self.__load_image(filepath)
+        index = ImageIndex.current()
+        if index is not None:
+            index.addTexture(tex)
         return tex
 
 
@@ -168,6 +237,9 @@ class FnMaterial(object):
                 if img and img.users < 1:
                     #print('    - remove image: '+img.name)
                     bpy.data.images.remove(img)
+                index = ImageIndex.current()
+                if index is not None:
+                    index.invalidate()
 
 
     def get_sphere_texture(self):
@@ -246,7 +318,7 @@ class FnMaterial(object):
         if mmd_mat.is_shared_toon_texture:
             shared_toon_folder = addon_preferences('shared_toon_folder', '')
             toon_path = os.path.join(shared_toon_folder, 'toon%02d.bmp'%(mmd_mat.shared_toon_texture+1))
-            self.create_toon_texture(bpy.path.resolve_ncase(path=toon_path))
+            self.create_toon_texture(resolve_ncase(toon_path))
         elif mmd_mat.toon_texture != '':
             self.create_toon_texture(mmd_mat.toon_texture)
         else:
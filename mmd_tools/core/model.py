@@ -4,6 +4,7 @@ import bpy
 import mathutils
 
 from mmd_tools import bpyutils
+from mmd_tools.core import profiler
 from mmd_tools.core import rigid_body
 from mmd_tools.core.bone import FnBone
 
@@ -536,10 +537,15 @@ class Model:
         logging.info(' Build rig')
         logging.info('****************************************')
         start_time = time.time()
-        self.__preBuild()
-        self.buildRigids()
-        self.buildJoints()
-        self.__postBuild()
+        with profiler.phase('build'):
+            with profiler.phase('pre_build'):
+                self.__preBuild()
+            with profiler.phase('rigids'):
+                self.buildRigids()
+            with profiler.phase('joints'):
+                self.buildJoints()
+            with profiler.phase('post_build'):
+                self.__postBuild()
         logging.info(' Finished building in %f seconds.', time.time() - start_time)
         rigid_body.setRigidBodyWorldEnabled(rigidbody_world_enabled)
 
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+""" Prepare the next items of a sequence in the background.
+
+Importing many models is a loop of two steps: parsing and cleaning a file,
+which does not touch Blender data, and building the Blender data, which
+has to run in the main thread. Pipeline runs the first step for the next
+files in worker threads while the main thread builds the current one.
+"""
+import collections
+import concurrent.futures
+import logging
+import threading
+
+
+class _LogCollector(logging.Filter):
+    """ Hold back the log records of worker threads, to replay them in order. """
+
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self.__records = {}
+
+    def start(self):
+        self.__records[threading.get_ident()] = []
+
+    def stop(self):
+        return self.__records.pop(threading.get_ident(), [])
+
+    def filter(self, record):
+        records = self.__records.get(threading.get_ident(), None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+
+class Prepared:
+    """ The pending result of prepare(item). """
+
+    def __init__(self, future):
+        self.__future = future
+
+    def result(self):
+        """ Log the records of prepare(item) and return its result, or raise its exception. """
+        value, error, records = self.__future.result()
+        for record in records:
+            logging.getLogger(record.name).handle(record)
+        if error is not None:
+            raise error
+        return value
+
+
+class Pipeline:
+    """ Iterate over (item, Prepared) while prepare(item) runs ahead in worker threads.
+
+    At most max_pending items are prepared ahead of the current one, so the
+    memory of the prepared data stays bounded. The log records of prepare()
+    are held back and logged by Prepared.result(), so they end up with the
+    records of the item in the main thread, e.g. in its log file.
+
+        with Pipeline(prepare, items) as pipeline:
+            for item, prepared in pipeline:
+                build(prepared.result())
+    """
+
+    def __init__(self, prepare, items, max_pending=1, max_workers=1):
+        self.__prepare = prepare
+        self.__items = iter(items)
+        self.__max_pending = max(1, max_pending)
+        self.__max_workers = max_workers
+        self.__pending = collections.deque()
+        self.__executor = None
+        self.__collector = _LogCollector()
+
+    def __enter__(self):
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.__max_workers)
+        # mmd_tools logs with the root logger, so its records pass this filter
+        logging.getLogger().addFilter(self.__collector)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        for item, future in self.__pending:
+            future.cancel()
+        self.__pending.clear()
+        self.__executor.shutdown(wait=True)
+        self.__executor = None
+        logging.getLogger().removeFilter(self.__collector)
+
+    def __run(self, item):
+        collector = self.__collector
+        collector.start()
+        value = error = None
+        try:
+            value = self.__prepare(item)
+        except Exception as e:
+            error = e
+        finally:
+            records = collector.stop()
+        return value, error, records
+
+    def __fill(self):
+        while len(self.__pending) < self.__max_pending:
+            try:
+                item = next(self.__items)
+            except StopIteration:
+                break
+            self.__pending.append((item, self.__executor.submit(self.__run, item)))
+
+    def __iter__(self):
+        if self.__executor is None:
+            raise RuntimeError('Pipeline has to be used in a with statement')
+        self.__fill()
+        while self.__pending:
+            item, future = self.__pending.popleft()
+            self.__fill() # the next items are prepared while this one is used
+            yield item, Prepared(future)
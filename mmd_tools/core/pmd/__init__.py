@@ -4,6 +4,11 @@ import os
 import re
 import logging
 import collections
+import collections.abc
+
+import numpy as np
+
+from mmd_tools.core.mapped_file import MappedFile
 
 class InvalidFileError(Exception):
     pass
@@ -41,26 +46,35 @@ class FileStream:
 
 
 class  FileReadStream(FileStream):
+    __INT = struct.Struct('<i')
+    __UNSIGNED_INT = struct.Struct('<I')
+    __SHORT = struct.Struct('<h')
+    __UNSIGNED_SHORT = struct.Struct('<H')
+    __FLOAT = struct.Struct('<f')
+    __BYTE = struct.Struct('<B')
+    __SIGNED_BYTE = struct.Struct('<b')
+    __VECTOR = {i:struct.Struct('<%df'%i) for i in range(1, 5)}
+
     def __init__(self, path, pmx_header=None):
-        self.__fin = open(path, 'rb')
+        self.__fin = MappedFile(path)
         FileStream.__init__(self, path, self.__fin)
 
 
     # READ / WRITE methods for general types
     def readInt(self):
-        v, = struct.unpack('<i', self.__fin.read(4))
+        v, = self.__fin.unpack(self.__INT)
         return v
 
     def readUnsignedInt(self):
-        v, = struct.unpack('<I', self.__fin.read(4))
+        v, = self.__fin.unpack(self.__UNSIGNED_INT)
         return v
 
     def readShort(self):
-        v, = struct.unpack('<h', self.__fin.read(2))
+        v, = self.__fin.unpack(self.__SHORT)
         return v
 
     def readUnsignedShort(self):
-        v, = struct.unpack('<H', self.__fin.read(2))
+        v, = self.__fin.unpack(self.__UNSIGNED_SHORT)
         return v
 
     def readStr(self, size):
@@ -79,27 +93,62 @@ class  FileReadStream(FileStream):
                 return ''
 
     def readFloat(self):
-        v, = struct.unpack('<f', self.__fin.read(4))
+        v, = self.__fin.unpack(self.__FLOAT)
         return v
 
     def readVector(self, size):
-        fmt = '<'
-        for i in range(size):
-            fmt += 'f'
-        return list(struct.unpack(fmt, self.__fin.read(4*size)))
+        fmt = self.__VECTOR.get(size, None) or struct.Struct('<%df'%size)
+        return list(self.__fin.unpack(fmt))
 
     def readByte(self):
-        v, = struct.unpack('<B', self.__fin.read(1))
+        v, = self.__fin.unpack(self.__BYTE)
         return v
 
     def readBytes(self, length):
         return self.__fin.read(length)
 
+    def readArray(self, dtype, count):
+        return self.__fin.read_array(dtype, count)
+
+    def size(self):
+        return self.__fin.size()
+
+    def tell(self):
+        return self.__fin.tell()
+
+    def seek(self, pos):
+        self.__fin.seek(pos)
+
     def readSignedByte(self):
-        v, = struct.unpack('<b', self.__fin.read(1))
+        v, = self.__fin.unpack(self.__SIGNED_BYTE)
         return v
 
 
+class RecordList(collections.abc.Sequence):
+    """ A read-only list of item_class objects backed by a structured array.
+
+    The objects are created from the records on access, so a section can
+    be loaded and converted as an array without creating them.
+    """
+    def __init__(self, item_class, records):
+        self.item_class = item_class
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.item_class.fromRecords(self.records[index])
+        return self.item_class.fromRecords(self.records[index:index+1 or None])[0]
+
+    def __iter__(self):
+        return iter(self.item_class.fromRecords(self.records))
+
+    def __repr__(self):
+        return '<RecordList %d %s>'%(len(self), self.item_class.__name__)
+
+
 class Header:
     PMD_SIGN = b'Pmd'
     VERSION = 1.0
@@ -122,6 +171,15 @@ class Header:
         self.comment = fs.readStr(256)
 
 class Vertex:
+    DTYPE = np.dtype([
+        ('position', '<f4', (3,)),
+        ('normal', '<f4', (3,)),
+        ('uv', '<f4', (2,)),
+        ('bones', '<u2', (2,)),
+        ('weight', 'u1'),
+        ('enable_edge', 'u1'),
+        ])
+
     def __init__(self):
         self.position = [0.0, 0.0, 0.0]
         self.normal = [1.0, 0.0, 0.0]
@@ -139,6 +197,28 @@ class Vertex:
         self.weight = fs.readByte()
         self.enable_edge = fs.readByte()
 
+    @classmethod
+    def fromRecords(cls, records):
+        """ Create Vertex objects from a structured array of DTYPE. """
+        vertices = []
+        for position, normal, uv, bones, weight, enable_edge in zip(*[records[i].tolist() for i in cls.DTYPE.names]):
+            v = cls()
+            v.position = position
+            v.normal = normal
+            v.uv = uv
+            v.bones = bones
+            v.weight = weight
+            v.enable_edge = enable_edge
+            vertices.append(v)
+        return vertices
+
+    @classmethod
+    def toRecords(cls, vertices):
+        """ Return a structured array of DTYPE for Vertex objects. """
+        if isinstance(vertices, RecordList):
+            return vertices.records
+        return np.array([(v.position, v.normal, v.uv, v.bones, v.weight, v.enable_edge) for v in vertices], dtype=cls.DTYPE)
+
 class Material:
     def __init__(self):
         self.diffuse = []
@@ -224,6 +304,11 @@ class IK:
             self.ik_child_bones.append(fs.readUnsignedShort())
 
 class MorphData:
+    DTYPE = np.dtype([
+        ('index', '<u4'),
+        ('offset', '<f4', (3,)),
+        ])
+
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -232,6 +317,24 @@ class MorphData:
         self.index = fs.readUnsignedInt()
         self.offset = fs.readVector(3)
 
+    @classmethod
+    def fromRecords(cls, records):
+        """ Create MorphData objects from a structured array of DTYPE. """
+        data = []
+        for index, offset in zip(records['index'].tolist(), records['offset'].tolist()):
+            t = cls()
+            t.index = index
+            t.offset = offset
+            data.append(t)
+        return data
+
+    @classmethod
+    def toRecords(cls, data):
+        """ Return a structured array of DTYPE for MorphData objects. """
+        if isinstance(data, RecordList):
+            return data.records
+        return np.array([(i.index, i.offset) for i in data], dtype=cls.DTYPE)
+
 class VertexMorph:
     def __init__(self):
         self.name = ''
@@ -243,10 +346,7 @@ class VertexMorph:
         self.name = fs.readStr(20)
         data_size = fs.readUnsignedInt()
         self.type = fs.readByte()
-        for i in range(data_size):
-            t = MorphData()
-            t.load(fs)
-            self.data.append(t)
+        self.data = RecordList(MorphData, np.array(fs.readArray(MorphData.DTYPE, data_size)))
 
 class RigidBody:
     def __init__(self):
@@ -353,12 +453,13 @@ class Model:
         logging.info('------------------------------')
         logging.info('Load Vertices')
         logging.info('------------------------------')
-        self.vertices = []
         vert_count = fs.readUnsignedInt()
-        for i in range(vert_count):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        # the records are copied, since the arrays of readArray() are views of the file.
+        # the complete records of a truncated file are kept before the error.
+        num = min(vert_count, max(0, fs.size() - fs.tell()) // Vertex.DTYPE.itemsize)
+        self.vertices = RecordList(Vertex, np.array(fs.readArray(Vertex.DTYPE, num)))
+        if num < vert_count:
+            raise struct.error('vertex section is truncated')
         logging.info('the number of vetices: %d', len(self.vertices))
         logging.info('finished importing vertices.')
 
@@ -368,11 +469,12 @@ class Model:
         logging.info('------------------------------')
         self.faces = []
         face_vert_count = fs.readUnsignedInt()
-        for i in range(int(face_vert_count/3)):
-            f1 = fs.readUnsignedShort()
-            f2 = fs.readUnsignedShort()
-            f3 = fs.readUnsignedShort()
-            self.faces.append((f3, f2, f1))
+        num = min(int(face_vert_count/3), max(0, fs.size() - fs.tell()) // 6)
+        face_data = fs.readArray('<u2', num*3).reshape(-1, 3)
+        self.faces = list(zip(*face_data[:, ::-1].T.tolist()))
+        del face_data
+        if num < int(face_vert_count/3):
+            raise struct.error('face section is truncated')
         logging.info('the number of faces: %d', len(self.faces))
         logging.info('finished importing faces.')
 
@@ -7,19 +7,56 @@ import copy
 import logging
 
 import mathutils
+import numpy as np
 
 import mmd_tools.core.pmx.importer as import_pmx
 import mmd_tools.core.pmd as pmd
 import mmd_tools.core.pmx as pmx
+from mmd_tools.core.pmx import bulk
 
 from math import radians
 
 class PMDImporter:
+    @staticmethod
+    def prepare(**args):
+        args['model_loader'] = import_pmd_to_pmx
+        return import_pmx.PMXImporter.prepare(**args)
+
     def execute(self, **args):
-        args['pmx'] = import_pmd_to_pmx(args['filepath'])
+        args['model_loader'] = import_pmd_to_pmx
         importer = import_pmx.PMXImporter()
         importer.execute(**args)
 
+def _convert_vertices(pmd_vertices):
+    """ Convert pmd vertices to a bulk.VertexList of BDEF1/BDEF2 vertices. """
+    records = pmd.Vertex.toRecords(pmd_vertices)
+    data = bulk.VertexData(len(records))
+    data.co[:] = records['position']
+    data.normal[:] = records['normal']
+    data.uv[:] = records['uv']
+    data.edge_scale[:] = records['enable_edge'] == 0
+
+    bones = records['bones'].astype(np.int32)
+    weights = records['weight'].astype(np.float32) / 100.0
+    bdef2 = bones[:, 0] != bones[:, 1]
+    data.weight_type[bdef2] = pmx.BoneWeight.BDEF2
+    data.bones[:, 0] = bones[:, 0]
+    data.bones[bdef2, 1] = bones[bdef2, 1]
+    data.weights[:, 0] = np.where(bdef2, weights, 1.0)
+    data.weights[bdef2, 1] = 1.0 - weights[bdef2]
+    return bulk.VertexList(data)
+
+def _convert_morph_offsets(morph, base_indices):
+    """ Convert the data of a pmd morph, which is relative to the base morph, to pmx offsets. """
+    records = pmd.MorphData.toRecords(morph.data)
+    offsets = []
+    for index, offset in zip(base_indices[records['index']].tolist(), records['offset'].tolist()):
+        mo = pmx.VertexMorphOffset()
+        mo.index = index
+        mo.offset = offset
+        offsets.append(mo)
+    return offsets
+
 def import_pmd_to_pmx(filepath):
     """ Import pmd file
     """
@@ -43,42 +80,19 @@ def import_pmd_to_pmx(filepath):
     pmx_model.comment = pmd_model.comment
     pmx_model.comment_e = pmd_model.comment_e
 
-    pmx_model.vertices = []
-
     # convert vertices
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Vertices')
     logging.info('------------------------------')
-    for v in pmd_model.vertices:
-        pmx_v = pmx.Vertex()
-        pmx_v.co = v.position
-        pmx_v.normal = v.normal
-        pmx_v.uv = v.uv
-        pmx_v.additional_uvs= []
-        pmx_v.edge_scale = 1 if v.enable_edge == 0 else 0
-
-        weight = pmx.BoneWeight()
-        if v.bones[0] != v.bones[1]:
-            weight.type = pmx.BoneWeight.BDEF2
-            weight.bones = v.bones
-            weight.weights = [float(v.weight)/100.0]
-        else:
-            weight.type = pmx.BoneWeight.BDEF1
-            weight.bones = [v.bones[0]]
-            weight.weights = [float(v.weight)/100.0]
-
-        pmx_v.weight = weight
-
-        pmx_model.vertices.append(pmx_v)
+    pmx_model.vertices = _convert_vertices(pmd_model.vertices)
     logging.info('----- Converted %d vertices', len(pmx_model.vertices))
 
     logging.info('')
     logging.info('------------------------------')
     logging.info(' Convert Faces')
     logging.info('------------------------------')
-    for f in pmd_model.faces:
-        pmx_model.faces.append(f)
+    pmx_model.faces = list(pmd_model.faces)
     logging.info('----- Converted %d faces', len(pmx_model.faces))
 
     knee_bones = []
@@ -251,9 +265,7 @@ def import_pmd_to_pmx(filepath):
     else:
         if len(t) > 1:
             logging.warning('Found two or more base morphs.')
-        vertex_map = []
-        for i in t[0].data:
-            vertex_map.append(i.index)
+        base_indices = pmd.MorphData.toRecords(t[0].data)['index'].astype(np.int64)
 
         for morph in pmd_model.morphs:
             logging.debug('Vertex Morph: %s', morph.name)
@@ -261,11 +273,7 @@ def import_pmd_to_pmx(filepath):
                 morph_index_map.append(-1)
                 continue
             pmx_morph = pmx.VertexMorph(morph.name, morph.name_e, morph.type)
-            for i in morph.data:
-                mo = pmx.VertexMorphOffset()
-                mo.index = vertex_map[i.index]
-                mo.offset = i.offset
-                pmx_morph.offsets.append(mo)
+            pmx_morph.offsets = _convert_morph_offsets(morph, base_indices)
             morph_index_map.append(len(pmx_model.morphs))
             pmx_model.morphs.append(pmx_morph)
     logging.info('----- Converted %d morphs', len(pmx_model.morphs))
@@ -3,6 +3,23 @@ import struct
 import os
 import logging
 
+from mmd_tools.core.mapped_file import MappedFile
+
+# Record classes use __slots__ when the environment variable MMD_TOOLS_PMX_SLOTS
+# is set to 1. It cuts the memory of large models, but the records do not
+# accept attributes other than their fields then, which breaks scripts adding
+# their own ones.
+USE_SLOTS = os.environ.get('MMD_TOOLS_PMX_SLOTS', '0') == '1'
+
+def _slots(*names, base=True):
+    """ Return the __slots__ of a record class with fields of names.
+
+    base is False for subclasses of records, which inherit the __dict__.
+    """
+    if USE_SLOTS:
+        return names
+    return ('__dict__', '__weakref__') if base else ()
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -13,6 +30,7 @@ class FileStream:
         self.__path = path
         self.__file_obj = file_obj
         self.__header = pmx_header
+        self.__codec = None
 
     def __enter__(self):
         return self
@@ -30,6 +48,12 @@ class FileStream:
 
     def setHeader(self, pmx_header):
         self.__header = pmx_header
+        self.__codec = None
+
+    def codec(self):
+        if self.__codec is None:
+            self.__codec = RecordCodec.get(self.header())
+        return self.__codec
 
     def close(self):
         if self.__file_obj is not None:
@@ -38,23 +62,33 @@ class FileStream:
             self.__file_obj = None
 
 class FileReadStream(FileStream):
+    __SIGNED_INDEX = {1:struct.Struct('<b'), 2:struct.Struct('<h'), 4:struct.Struct('<i')}
+    __UNSIGNED_INDEX = {1:struct.Struct('<B'), 2:struct.Struct('<H'), 4:struct.Struct('<I')}
+    __INT = struct.Struct('<i')
+    __SHORT = struct.Struct('<h')
+    __UNSIGNED_SHORT = struct.Struct('<H')
+    __FLOAT = struct.Struct('<f')
+    __BYTE = struct.Struct('<B')
+    __SIGNED_BYTE = struct.Struct('<b')
+    __VECTOR = {i:struct.Struct('<%df'%i) for i in range(1, 5)}
+
     def __init__(self, path, pmx_header=None):
-        self.__fin = open(path, 'rb')
+        self.__fin = MappedFile(path)
         FileStream.__init__(self, path, self.__fin, pmx_header)
 
     def __readIndex(self, size, typedict):
         index = None
         if size in typedict :
-            index, = struct.unpack(typedict[size], self.__fin.read(size))
+            index, = self.__fin.unpack(typedict[size])
         else:
             raise ValueError('invalid data size %s'%str(size))
         return index
 
     def __readSignedIndex(self, size):
-        return self.__readIndex(size, { 1 :"<b", 2 :"<h", 4 :"<i"})
+        return self.__readIndex(size, self.__SIGNED_INDEX)
 
     def __readUnsignedIndex(self, size):
-        return self.__readIndex(size, { 1 :"<B", 2 :"<H", 4 :"<I"})
+        return self.__readIndex(size, self.__UNSIGNED_INDEX)
 
 
     # READ methods for indexes
@@ -78,61 +112,92 @@ class FileReadStream(FileStream):
 
     # READ / WRITE methods for general types
     def readInt(self):
-        v, = struct.unpack('<i', self.__fin.read(4))
+        v, = self.__fin.unpack(self.__INT)
         return v
 
     def readShort(self):
-        v, = struct.unpack('<h', self.__fin.read(2))
+        v, = self.__fin.unpack(self.__SHORT)
         return v
 
     def readUnsignedShort(self):
-        v, = struct.unpack('<H', self.__fin.read(2))
+        v, = self.__fin.unpack(self.__UNSIGNED_SHORT)
         return v
 
     def readStr(self):
         length = self.readInt()
-        fmt = '<' + str(length) + 's'
-        buf, = struct.unpack(fmt, self.__fin.read(length))
+        buf = self.__fin.read_view(length)
+        if len(buf) < length:
+            raise struct.error('unpack requires a buffer of %d bytes'%length)
         return str(buf, self.header().encoding.charset)
 
     def readFloat(self):
-        v, = struct.unpack('<f', self.__fin.read(4))
+        v, = self.__fin.unpack(self.__FLOAT)
         return v
 
     def readVector(self, size):
-        fmt = '<'
-        for i in range(size):
-            fmt += 'f'
-        return list(struct.unpack(fmt, self.__fin.read(4*size)))
+        fmt = self.__VECTOR.get(size, None) or struct.Struct('<%df'%size)
+        return list(self.__fin.unpack(fmt))
 
     def readByte(self):
-        v, = struct.unpack('<B', self.__fin.read(1))
+        v, = self.__fin.unpack(self.__BYTE)
         return v
 
     def readBytes(self, length):
         return self.__fin.read(length)
 
+    def readView(self, length):
+        """ Same as readBytes(), but returns a memoryview without copying. """
+        return self.__fin.read_view(length)
+
+    def readArray(self, dtype, count):
+        return self.__fin.read_array(dtype, count)
+
     def readSignedByte(self):
-        v, = struct.unpack('<b', self.__fin.read(1))
+        v, = self.__fin.unpack(self.__SIGNED_BYTE)
         return v
 
+    def readStruct(self, fmt):
+        """ Read a record of the struct.Struct fmt (see RecordCodec) as a tuple. """
+        return self.__fin.unpack(fmt)
+
+    def size(self):
+        return self.__fin.size()
+
+    def tell(self):
+        return self.__fin.tell()
+
+    def seek(self, pos):
+        self.__fin.seek(pos)
+
 class FileWriteStream(FileStream):
+    BUFFER_SIZE = 1 << 20
+
+    __SIGNED_INDEX = {1:struct.Struct('<b'), 2:struct.Struct('<h'), 4:struct.Struct('<i')}
+    __UNSIGNED_INDEX = {1:struct.Struct('<B'), 2:struct.Struct('<H'), 4:struct.Struct('<I')}
+    __INT = struct.Struct('<i')
+    __SHORT = struct.Struct('<h')
+    __UNSIGNED_SHORT = struct.Struct('<H')
+    __FLOAT = struct.Struct('<f')
+    __BYTE = struct.Struct('<B')
+    __SIGNED_BYTE = struct.Struct('<b')
+    __VECTOR = {i:struct.Struct('<%df'%i) for i in range(1, 5)}
+
     def __init__(self, path, pmx_header=None):
-        self.__fout = open(path, 'wb')
+        self.__fout = open(path, 'wb', buffering=self.BUFFER_SIZE)
         FileStream.__init__(self, path, self.__fout, pmx_header)
 
     def __writeIndex(self, index, size, typedict):
         if size in typedict :
-            self.__fout.write(struct.pack(typedict[size], int(index)))
+            self.__fout.write(typedict[size].pack(int(index)))
         else:
             raise ValueError('invalid data size %s'%str(size))
         return
 
     def __writeSignedIndex(self, index, size):
-        return self.__writeIndex(index, size, { 1 :"<b", 2 :"<h", 4 :"<i"})
+        return self.__writeIndex(index, size, self.__SIGNED_INDEX)
 
     def __writeUnsignedIndex(self, index, size):
-        return self.__writeIndex(index, size, { 1 :"<B", 2 :"<H", 4 :"<I"})
+        return self.__writeIndex(index, size, self.__UNSIGNED_INDEX)
 
     # WRITE methods for indexes
     def writeVertexIndex(self, index):
@@ -155,13 +220,13 @@ class FileWriteStream(FileStream):
 
 
     def writeInt(self, v):
-        self.__fout.write(struct.pack('<i', int(v)))
+        self.__fout.write(self.__INT.pack(int(v)))
 
     def writeShort(self, v):
-        self.__fout.write(struct.pack('<h', int(v)))
+        self.__fout.write(self.__SHORT.pack(int(v)))
 
     def writeUnsignedShort(self, v):
-        self.__fout.write(struct.pack('<H', int(v)))
+        self.__fout.write(self.__UNSIGNED_SHORT.pack(int(v)))
 
     def writeStr(self, v):
         data = v.encode(self.header().encoding.charset)
@@ -169,23 +234,24 @@ class FileWriteStream(FileStream):
         self.__fout.write(data)
 
     def writeFloat(self, v):
-        self.__fout.write(struct.pack('<f', float(v)))
+        self.__fout.write(self.__FLOAT.pack(float(v)))
 
     def writeVector(self, v):
-        l = len(v)
-        fmt = '<'
-        for i in range(l):
-            fmt += 'f'
-        self.__fout.write(struct.pack(fmt, *v))
+        fmt = self.__VECTOR.get(len(v), None) or struct.Struct('<%df'%len(v))
+        self.__fout.write(fmt.pack(*v))
 
     def writeByte(self, v):
-        self.__fout.write(struct.pack('<B', int(v)))
+        self.__fout.write(self.__BYTE.pack(int(v)))
 
     def writeBytes(self, v):
         self.__fout.write(v)
 
     def writeSignedByte(self, v):
-        self.__fout.write(struct.pack('<b', int(v)))
+        self.__fout.write(self.__SIGNED_BYTE.pack(int(v)))
+
+    def writeStruct(self, fmt, values):
+        """ Write the tuple values as a record of the struct.Struct fmt. """
+        self.__fout.write(fmt.pack(*values))
 
 class Encoding:
     _MAP = [
@@ -216,6 +282,8 @@ class Encoding:
 
 class Coordinate:
     """ """
+    __slots__ = _slots('x_axis', 'z_axis')
+
     def __init__(self, xAxis, zAxis):
         self.x_axis = xAxis
         self.z_axis = zAxis
@@ -323,6 +391,83 @@ class Header:
             self.rigid_index_size,
             )
 
+class RecordCodec:
+    """ The precompiled struct.Struct objects of the pmx records.
+
+    Each attribute decodes a fixed-size run of a record in one call. The
+    layout depends on the index sizes of the header, so a codec is built for
+    each header configuration and shared by all files using it.
+    """
+    __SIGNED_INDEX = {1:'b', 2:'h', 4:'i'}
+    __UNSIGNED_INDEX = {1:'B', 2:'H', 4:'I'}
+    __codecs = {}
+
+    def __init__(self, header):
+        vertex = self.__index(self.__UNSIGNED_INDEX, header.vertex_index_size)
+        texture = self.__index(self.__SIGNED_INDEX, header.texture_index_size)
+        material = self.__index(self.__SIGNED_INDEX, header.material_index_size)
+        bone = self.__index(self.__SIGNED_INDEX, header.bone_index_size)
+        morph = self.__index(self.__SIGNED_INDEX, header.morph_index_size)
+        rigid = self.__index(self.__SIGNED_INDEX, header.rigid_index_size)
+
+        self.charset = header.encoding.charset
+
+        # diffuse, specular, shininess, ambient, flags, edge color, edge size,
+        # texture, sphere texture, sphere mode and shared toon flag
+        self.material = self.__struct('4f3ff3fB4ff' + texture*2 + 'bb')
+        # location, parent, transform order and flags
+        self.bone = self.__struct('3f' + bone + 'ih')
+        self.bone_additional_transform = self.__struct(bone + 'f')
+        # target, loop count, rotation constraint and the number of links
+        self.bone_ik = self.__struct(bone + 'ifi')
+        self.ik_link = self.__struct(bone + 'B')
+        self.ik_link_limits = self.__struct('6f')
+
+        self.vertex_morph_offset = self.__struct(vertex + '3f')
+        self.uv_morph_offset = self.__struct(vertex + '4f')
+        self.bone_morph_offset = self.__struct(bone + '7f')
+        self.material_morph_offset = self.__struct(material + 'b28f')
+        self.group_morph_offset = self.__struct(morph + 'f')
+
+        # bone, collision group and mask, shape, size, location, rotation,
+        # mass, attenuations, bounce, friction and mode
+        self.rigid = self.__struct(bone + 'bHb' + '3f3f3f' + '5f' + 'b')
+        # mode, rigid bodies, location, rotation, limits and spring constants
+        self.joint = self.__struct('b' + rigid*2 + '24f')
+
+        self.bone_weights = {
+            BoneWeight.BDEF1: self.__struct(bone),
+            BoneWeight.BDEF2: self.__struct(bone*2 + 'f'),
+            BoneWeight.BDEF4: self.__struct(bone*4 + '4f'),
+            BoneWeight.SDEF: self.__struct(bone*2 + '10f'),
+            BoneWeight.QDEF: self.__struct(bone*4 + '4f'),
+            }
+
+    @staticmethod
+    def __index(typedict, size):
+        if size not in typedict:
+            raise ValueError('invalid data size %s'%str(size))
+        return typedict[size]
+
+    @staticmethod
+    def __struct(fmt):
+        return struct.Struct('<' + fmt)
+
+    @classmethod
+    def get(cls, header):
+        """ Return the codec of the configuration of header. """
+        key = (header.encoding.charset,
+               header.vertex_index_size,
+               header.texture_index_size,
+               header.material_index_size,
+               header.bone_index_size,
+               header.morph_index_size,
+               header.rigid_index_size)
+        codec = cls.__codecs.get(key, None)
+        if codec is None:
+            codec = cls.__codecs[key] = cls(header)
+        return codec
+
 class Model:
     def __init__(self):
         self.filepath = ''
@@ -370,31 +515,44 @@ class Model:
         logging.info('Comment:%s', self.comment)
         logging.info('Comment(english):%s', self.comment_e)
 
+        self.loadVertices(fs)
+        self.loadFaces(fs)
+        self.loadTextures(fs)
+        self.loadMaterials(fs, len(self.textures))
+        self.loadBones(fs)
+        self.loadMorphs(fs)
+        self.loadDisplay(fs)
+        self.loadRigids(fs)
+        self.loadJoints(fs)
+
+    def loadVertices(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info('Load Vertices')
         logging.info('------------------------------')
+        from mmd_tools.core.pmx import bulk
         num_vertices = fs.readInt()
-        self.vertices = []
-        for i in range(num_vertices):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        vertex_data = bulk.VertexData()
+        try:
+            vertex_data.load(fs, num_vertices)
+        finally:
+            # keep the vertices read before a truncation like the other sections
+            self.vertices = bulk.VertexList(vertex_data)
         logging.info('----- Loaded %d vertices', len(self.vertices))
 
+    def loadFaces(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Faces')
         logging.info('------------------------------')
+        from mmd_tools.core.pmx import bulk
         num_faces = fs.readInt()
-        self.faces = []
-        for i in range(int(num_faces/3)):
-            f1 = fs.readVertexIndex()
-            f2 = fs.readVertexIndex()
-            f3 = fs.readVertexIndex()
-            self.faces.append((f3, f2, f1))
+        self.faces = list(zip(*bulk.load_faces(fs, num_faces).T.tolist()))
+        if len(self.faces) < int(num_faces/3):
+            raise struct.error('face section is truncated')
         logging.info(' Load %d faces', len(self.faces))
 
+    def loadTextures(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Textures')
@@ -408,6 +566,7 @@ class Model:
             logging.info('Texture %d: %s', i, t.path)
         logging.info(' ----- Loaded %d textures', len(self.textures))
 
+    def loadMaterials(self, fs, num_textures):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Materials')
@@ -447,6 +606,7 @@ class Model:
 
         logging.info('----- Loaded %d  materials.', len(self.materials))
 
+    def loadBones(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Bones')
@@ -488,6 +648,7 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d bones.', len(self.bones))
 
+    def loadMorphs(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Morphs')
@@ -505,6 +666,7 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d morphs.', len(self.morphs))
 
+    def loadDisplay(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Display Items')
@@ -521,6 +683,7 @@ class Model:
             logging.debug('')
         logging.info('----- Loaded %d display items.', len(self.display))
 
+    def loadRigids(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Rigid Bodies')
@@ -550,6 +713,7 @@ class Model:
 
         logging.info('----- Loaded %d rigid bodies.', len(self.rigids))
 
+    def loadJoints(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Joints')
@@ -591,19 +755,14 @@ comment(english):
 %s
 ''', self.name, self.name_e, self.comment, self.comment_e)
 
+        from mmd_tools.core.pmx import bulk
         logging.info('exporting vertices...')
-        fs.writeInt(len(self.vertices))
-        for i in self.vertices:
-            i.save(fs)
+        bulk.save_vertices(fs, self.vertices)
         logging.info('the number of vetices: %d', len(self.vertices))
         logging.info('finished exporting vertices.')
 
         logging.info('exporting faces...')
-        fs.writeInt(len(self.faces)*3)
-        for f3, f2, f1 in self.faces:
-            fs.writeVertexIndex(f1)
-            fs.writeVertexIndex(f2)
-            fs.writeVertexIndex(f3)
+        bulk.save_faces(fs, self.faces)
         logging.info('the number of faces: %d', len(self.faces))
         logging.info('finished exporting faces.')
 
@@ -669,6 +828,8 @@ comment(english):
             )
 
 class Vertex:
+    __slots__ = _slots('co', 'normal', 'uv', 'additional_uvs', 'weight', 'edge_scale')
+
     def __init__(self):
         self.co = [0.0, 0.0, 0.0]
         self.normal = [0.0, 0.0, 0.0]
@@ -710,6 +871,8 @@ class Vertex:
         fs.writeFloat(self.edge_scale)
 
 class BoneWeightSDEF:
+    __slots__ = _slots('weight', 'c', 'r0', 'r1')
+
     def __init__(self, weight=0, c=None, r0=None, r1=None):
         self.weight = weight
         self.c = c
@@ -717,16 +880,20 @@ class BoneWeightSDEF:
         self.r1 = r1
 
 class BoneWeight:
+    __slots__ = _slots('bones', 'weights', 'type')
+
     BDEF1 = 0
     BDEF2 = 1
     BDEF4 = 2
     SDEF  = 3
+    QDEF  = 4
 
     TYPES = [
         (BDEF1, 'BDEF1'),
         (BDEF2, 'BDEF2'),
         (BDEF4, 'BDEF4'),
         (SDEF, 'SDEF'),
+        (QDEF, 'QDEF'),
         ]
 
     def __init__(self):
@@ -750,59 +917,46 @@ class BoneWeight:
 
     def load(self, fs):
         self.type = fs.readByte()
-        self.bones = []
-        self.weights = []
+        fmt = fs.codec().bone_weights.get(self.type, None)
+        if fmt is None:
+            raise ValueError('invalid weight type %s'%str(self.type))
+        v = fs.readStruct(fmt)
 
         if self.type == self.BDEF1:
-            self.bones.append(fs.readBoneIndex())
+            self.bones = [v[0]]
+            self.weights = []
         elif self.type == self.BDEF2:
-            self.bones.append(fs.readBoneIndex())
-            self.bones.append(fs.readBoneIndex())
-            self.weights.append(fs.readFloat())
-        elif self.type == self.BDEF4:
-            self.bones.append(fs.readBoneIndex())
-            self.bones.append(fs.readBoneIndex())
-            self.bones.append(fs.readBoneIndex())
-            self.bones.append(fs.readBoneIndex())
-            self.weights = fs.readVector(4)
+            self.bones = list(v[0:2])
+            self.weights = [v[2]]
+        elif self.type in (self.BDEF4, self.QDEF):
+            self.bones = list(v[0:4])
+            self.weights = list(v[4:8])
         elif self.type == self.SDEF:
-            self.bones.append(fs.readBoneIndex())
-            self.bones.append(fs.readBoneIndex())
-            self.weights = BoneWeightSDEF()
-            self.weights.weight = fs.readFloat()
-            self.weights.c = fs.readVector(3)
-            self.weights.r0 = fs.readVector(3)
-            self.weights.r1 = fs.readVector(3)
-        else:
-            raise ValueError('invalid weight type %s'%str(self.type))
+            self.bones = list(v[0:2])
+            self.weights = BoneWeightSDEF(v[2], list(v[3:6]), list(v[6:9]), list(v[9:12]))
 
     def save(self, fs):
+        fmt = fs.codec().bone_weights.get(self.type, None)
+        if fmt is None:
+            raise ValueError('invalid weight type %s'%str(self.type))
         fs.writeByte(self.type)
         if self.type == self.BDEF1:
-            fs.writeBoneIndex(self.bones[0])
+            v = (int(self.bones[0]),)
         elif self.type == self.BDEF2:
-            for i in range(2):
-                fs.writeBoneIndex(self.bones[i])
-            fs.writeFloat(self.weights[0])
-        elif self.type == self.BDEF4:
-            for i in range(4):
-                fs.writeBoneIndex(self.bones[i])
-            for i in range(4):
-                fs.writeFloat(self.weights[i])
+            v = tuple(int(i) for i in self.bones[0:2]) + (self.weights[0],)
+        elif self.type in (self.BDEF4, self.QDEF):
+            v = tuple(int(i) for i in self.bones[0:4]) + tuple(self.weights[0:4])
         elif self.type == self.SDEF:
-            for i in range(2):
-                fs.writeBoneIndex(self.bones[i])
             if not isinstance(self.weights, BoneWeightSDEF):
                 raise ValueError
-            fs.writeFloat(self.weights.weight)
-            fs.writeVector(self.weights.c)
-            fs.writeVector(self.weights.r0)
-            fs.writeVector(self.weights.r1)
-        else:
-            raise ValueError('invalid weight type %s'%str(self.type))
+            w = self.weights
+            v = tuple(int(i) for i in self.bones[0:2]) + (w.weight,) + tuple(w.c) + tuple(w.r0) + tuple(w.r1)
+        fs.writeStruct(fmt, v)
 
 
 class Texture:
+    __slots__ = _slots('path')
+
     def __init__(self):
         self.path = ''
 
@@ -822,11 +976,20 @@ class Texture:
         fs.writeStr(relPath)
 
 class SharedTexture(Texture):
+    __slots__ = _slots('number', 'prefix', base=False)
+
     def __init__(self):
         self.number = 0
         self.prefix = ''
 
 class Material:
+    __slots__ = _slots(
+        'name', 'name_e', 'diffuse', 'specular', 'shininess', 'ambient', 'is_double_sided',
+        'enabled_drop_shadow', 'enabled_self_shadow_map', 'enabled_self_shadow',
+        'enabled_toon_edge', 'edge_color', 'edge_size', 'texture', 'sphere_texture',
+        'sphere_texture_mode', 'is_shared_toon_texture', 'toon_texture', 'comment', 'vertex_count',
+        )
+
     SPHERE_MODE_OFF = 0
     SPHERE_MODE_MULT = 1
     SPHERE_MODE_ADD = 2
@@ -886,27 +1049,27 @@ class Material:
         self.name = fs.readStr()
         self.name_e = fs.readStr()
 
-        self.diffuse = fs.readVector(4)
-        self.specular = fs.readVector(3)
-        self.shininess = fs.readFloat()
-        self.ambient = fs.readVector(3)
+        v = fs.readStruct(fs.codec().material)
+        self.diffuse = list(v[0:4])
+        self.specular = list(v[4:7])
+        self.shininess = v[7]
+        self.ambient = list(v[8:11])
 
-        flags = fs.readByte()
+        flags = v[11]
         self.is_double_sided = bool(flags & 1)
         self.enabled_drop_shadow = bool(flags & 2)
         self.enabled_self_shadow_map = bool(flags & 4)
         self.enabled_self_shadow = bool(flags & 8)
         self.enabled_toon_edge = bool(flags & 16)
 
-        self.edge_color = fs.readVector(4)
-        self.edge_size = fs.readFloat()
+        self.edge_color = list(v[12:16])
+        self.edge_size = v[16]
 
-        self.texture = __tex_index(fs.readTextureIndex())
-        self.sphere_texture = __tex_index(fs.readTextureIndex())
-        self.sphere_texture_mode = fs.readSignedByte()
+        self.texture = __tex_index(v[17])
+        self.sphere_texture = __tex_index(v[18])
+        self.sphere_texture_mode = v[19]
 
-        self.is_shared_toon_texture = fs.readSignedByte()
-        self.is_shared_toon_texture = (self.is_shared_toon_texture == 1)
+        self.is_shared_toon_texture = (v[20] == 1)
         if self.is_shared_toon_texture:
             self.toon_texture = fs.readSignedByte()
         else:
@@ -919,31 +1082,22 @@ class Material:
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        fs.writeVector(self.diffuse)
-        fs.writeVector(self.specular)
-        fs.writeFloat(self.shininess)
-        fs.writeVector(self.ambient)
-
         flags = 0
         flags |= int(self.is_double_sided)
         flags |= int(self.enabled_drop_shadow) << 1
         flags |= int(self.enabled_self_shadow_map) << 2
         flags |= int(self.enabled_self_shadow) << 3
         flags |= int(self.enabled_toon_edge) << 4
-        fs.writeByte(flags)
 
-        fs.writeVector(self.edge_color)
-        fs.writeFloat(self.edge_size)
-
-        fs.writeTextureIndex(self.texture)
-        fs.writeTextureIndex(self.sphere_texture)
-        fs.writeSignedByte(self.sphere_texture_mode)
+        fs.writeStruct(fs.codec().material,
+                       tuple(self.diffuse) + tuple(self.specular) + (self.shininess,) + tuple(self.ambient) +
+                       (flags,) + tuple(self.edge_color) + (self.edge_size,) +
+                       (int(self.texture), int(self.sphere_texture), int(self.sphere_texture_mode),
+                        int(bool(self.is_shared_toon_texture))))
 
         if self.is_shared_toon_texture:
-            fs.writeSignedByte(1)
             fs.writeSignedByte(self.toon_texture)
         else:
-            fs.writeSignedByte(0)
             fs.writeTextureIndex(self.toon_texture)
 
         fs.writeStr(self.comment)
@@ -951,6 +1105,13 @@ class Material:
 
 
 class Bone:
+    __slots__ = _slots(
+        'name', 'name_e', 'location', 'parent', 'transform_order', 'displayConnection',
+        'isRotatable', 'isMovable', 'visible', 'isControllable', 'isIK', 'hasAdditionalRotate',
+        'hasAdditionalLocation', 'additionalTransform', 'axis', 'localCoordinate', 'transAfterPhis',
+        'externalTransKey', 'target', 'loopCount', 'rotationConstraint', 'ik_links',
+        )
+
     def __init__(self):
         self.name = ''
         self.name_e = ''
@@ -1009,11 +1170,13 @@ class Bone:
         self.name = fs.readStr()
         self.name_e = fs.readStr()
 
-        self.location = fs.readVector(3)
-        self.parent = fs.readBoneIndex()
-        self.transform_order = fs.readInt()
+        codec = fs.codec()
+        v = fs.readStruct(codec.bone)
+        self.location = list(v[0:3])
+        self.parent = v[3]
+        self.transform_order = v[4]
 
-        flags = fs.readShort()
+        flags = v[5]
         if flags & 0x0001:
             self.displayConnection = fs.readBoneIndex()
         else:
@@ -1029,9 +1192,7 @@ class Bone:
         self.hasAdditionalRotate = ((flags & 0x0100) != 0)
         self.hasAdditionalLocation = ((flags & 0x0200) != 0)
         if self.hasAdditionalRotate or self.hasAdditionalLocation:
-            t = fs.readBoneIndex()
-            v = fs.readFloat()
-            self.additionalTransform = (t, v)
+            self.additionalTransform = fs.readStruct(codec.bone_additional_transform)
         else:
             self.additionalTransform = None
 
@@ -1056,11 +1217,7 @@ class Bone:
             self.externalTransKey = None
 
         if self.isIK:
-            self.target = fs.readBoneIndex()
-            self.loopCount = fs.readInt()
-            self.rotationConstraint = fs.readFloat()
-
-            iklink_num = fs.readInt()
+            self.target, self.loopCount, self.rotationConstraint, iklink_num = fs.readStruct(codec.bone_ik)
             self.ik_links = []
             for i in range(iklink_num):
                 link = IKLink()
@@ -1071,9 +1228,7 @@ class Bone:
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        fs.writeVector(self.location)
-        fs.writeBoneIndex(-1 if self.parent is None else self.parent)
-        fs.writeInt(self.transform_order)
+        codec = fs.codec()
 
         flags = 0
         flags |= int(isinstance(self.displayConnection, int))
@@ -1091,7 +1246,11 @@ class Bone:
         flags |= int(self.transAfterPhis) << 12
         flags |= int(self.externalTransKey is not None) << 13
 
-        fs.writeShort(flags)
+        fs.writeStruct(codec.bone, tuple(self.location) + (
+            -1 if self.parent is None else int(self.parent),
+            int(self.transform_order),
+            flags,
+            ))
 
         if flags & 0x0001:
             fs.writeBoneIndex(self.displayConnection)
@@ -1099,8 +1258,8 @@ class Bone:
             fs.writeVector(self.displayConnection)
 
         if self.hasAdditionalRotate or self.hasAdditionalLocation:
-            fs.writeBoneIndex(self.additionalTransform[0])
-            fs.writeFloat(self.additionalTransform[1])
+            fs.writeStruct(codec.bone_additional_transform,
+                           (int(self.additionalTransform[0]), self.additionalTransform[1]))
 
         if flags & 0x0400:
             fs.writeVector(self.axis)
@@ -1113,16 +1272,15 @@ class Bone:
             fs.writeInt(self.externalTransKey)
 
         if self.isIK:
-            fs.writeBoneIndex(self.target)
-            fs.writeInt(self.loopCount)
-            fs.writeFloat(self.rotationConstraint)
-
-            fs.writeInt(len(self.ik_links))
+            fs.writeStruct(codec.bone_ik,
+                           (int(self.target), int(self.loopCount), self.rotationConstraint, len(self.ik_links)))
             for i in self.ik_links:
                 i.save(fs)
 
 
 class IKLink:
+    __slots__ = _slots('target', 'maximumAngle', 'minimumAngle')
+
     def __init__(self):
         self.target = None
         self.maximumAngle = None
@@ -1132,25 +1290,27 @@ class IKLink:
         return '<IKLink target %s>'%(str(self.target))
 
     def load(self, fs):
-        self.target = fs.readBoneIndex()
-        flag = fs.readByte()
+        codec = fs.codec()
+        self.target, flag = fs.readStruct(codec.ik_link)
         if flag == 1:
-            self.minimumAngle = fs.readVector(3)
-            self.maximumAngle = fs.readVector(3)
+            v = fs.readStruct(codec.ik_link_limits)
+            self.minimumAngle = list(v[0:3])
+            self.maximumAngle = list(v[3:6])
         else:
             self.minimumAngle = None
             self.maximumAngle = None
 
     def save(self, fs):
-        fs.writeBoneIndex(self.target)
+        codec = fs.codec()
         if isinstance(self.minimumAngle, list) and isinstance(self.maximumAngle, list):
-            fs.writeByte(1)
-            fs.writeVector(self.minimumAngle)
-            fs.writeVector(self.maximumAngle)
+            fs.writeStruct(codec.ik_link, (int(self.target), 1))
+            fs.writeStruct(codec.ik_link_limits, tuple(self.minimumAngle) + tuple(self.maximumAngle))
         else:
-            fs.writeByte(0)
+            fs.writeStruct(codec.ik_link, (int(self.target), 0))
 
 class Morph:
+    __slots__ = _slots('offsets', 'name', 'name_e', 'category')
+
     CATEGORY_SYSTEM = 0
     CATEGORY_EYEBROW = 1
     CATEGORY_EYE = 2
@@ -1202,11 +1362,16 @@ class Morph:
         fs.writeStr(self.name_e)
         fs.writeSignedByte(self.category)
         fs.writeSignedByte(self.type_index())
+        self.saveOffsets(fs)
+
+    def saveOffsets(self, fs):
         fs.writeInt(len(self.offsets))
         for i in self.offsets:
             i.save(fs)
 
 class VertexMorph(Morph):
+    __slots__ = _slots(base=False)
+
     def __init__(self, *args, **kwargs):
         Morph.__init__(self, *args, **kwargs)
 
@@ -1220,20 +1385,28 @@ class VertexMorph(Morph):
             t.load(fs)
             self.offsets.append(t)
 
+    def saveOffsets(self, fs):
+        from mmd_tools.core.pmx import bulk
+        bulk.save_morph_offsets(fs, self.offsets, 3)
+
 class VertexMorphOffset:
+    __slots__ = _slots('index', 'offset')
+
     def __init__(self):
         self.index = 0
         self.offset = []
 
     def load(self, fs):
-        self.index = fs.readVertexIndex()
-        self.offset = fs.readVector(3)
+        v = fs.readStruct(fs.codec().vertex_morph_offset)
+        self.index = v[0]
+        self.offset = list(v[1:])
 
     def save(self, fs):
-        fs.writeVertexIndex(self.index)
-        fs.writeVector(self.offset)
+        fs.writeStruct(fs.codec().vertex_morph_offset, (int(self.index),) + tuple(self.offset))
 
 class UVMorph(Morph):
+    __slots__ = _slots('uv_index', base=False)
+
     def __init__(self, *args, **kwargs):
         self.uv_index = kwargs.get('type_index', 3) - 3
         Morph.__init__(self, *args, **kwargs)
@@ -1249,20 +1422,28 @@ class UVMorph(Morph):
             t.load(fs)
             self.offsets.append(t)
 
+    def saveOffsets(self, fs):
+        from mmd_tools.core.pmx import bulk
+        bulk.save_morph_offsets(fs, self.offsets, 4)
+
 class UVMorphOffset:
+    __slots__ = _slots('index', 'offset')
+
     def __init__(self):
         self.index = 0
         self.offset = []
 
     def load(self, fs):
-        self.index = fs.readVertexIndex()
-        self.offset = fs.readVector(4)
+        v = fs.readStruct(fs.codec().uv_morph_offset)
+        self.index = v[0]
+        self.offset = list(v[1:])
 
     def save(self, fs):
-        fs.writeVertexIndex(self.index)
-        fs.writeVector(self.offset)
+        fs.writeStruct(fs.codec().uv_morph_offset, (int(self.index),) + tuple(self.offset))
 
 class BoneMorph(Morph):
+    __slots__ = _slots(base=False)
+
     def __init__(self, *args, **kwargs):
         Morph.__init__(self, *args, **kwargs)
 
@@ -1278,22 +1459,26 @@ class BoneMorph(Morph):
             self.offsets.append(t)
 
 class BoneMorphOffset:
+    __slots__ = _slots('index', 'location_offset', 'rotation_offset')
+
     def __init__(self):
         self.index = None
         self.location_offset = []
         self.rotation_offset = []
 
     def load(self, fs):
-        self.index = fs.readBoneIndex()
-        self.location_offset = fs.readVector(3)
-        self.rotation_offset = fs.readVector(4)
+        v = fs.readStruct(fs.codec().bone_morph_offset)
+        self.index = v[0]
+        self.location_offset = list(v[1:4])
+        self.rotation_offset = list(v[4:8])
 
     def save(self, fs):
-        fs.writeBoneIndex(self.index)
-        fs.writeVector(self.location_offset)
-        fs.writeVector(self.rotation_offset)
+        fs.writeStruct(fs.codec().bone_morph_offset,
+                       (int(self.index),) + tuple(self.location_offset) + tuple(self.rotation_offset))
 
 class MaterialMorph(Morph):
+    __slots__ = _slots(base=False)
+
     def __init__(self, *args, **kwargs):
         Morph.__init__(self, *args, **kwargs)
 
@@ -1309,6 +1494,12 @@ class MaterialMorph(Morph):
             self.offsets.append(t)
 
 class MaterialMorphOffset:
+    __slots__ = _slots(
+        'index', 'offset_type', 'diffuse_offset', 'specular_offset', 'shininess_offset',
+        'ambient_offset', 'edge_color_offset', 'edge_size_offset', 'texture_factor',
+        'sphere_texture_factor', 'toon_texture_factor',
+        )
+
     TYPE_MULT = 0
     TYPE_ADD = 1
 
@@ -1326,32 +1517,35 @@ class MaterialMorphOffset:
         self.toon_texture_factor = []
 
     def load(self, fs):
-        self.index = fs.readMaterialIndex()
-        self.offset_type = fs.readSignedByte()
-        self.diffuse_offset = fs.readVector(4)
-        self.specular_offset = fs.readVector(3)
-        self.shininess_offset = fs.readFloat()
-        self.ambient_offset = fs.readVector(3)
-        self.edge_color_offset = fs.readVector(4)
-        self.edge_size_offset = fs.readFloat()
-        self.texture_factor = fs.readVector(4)
-        self.sphere_texture_factor = fs.readVector(4)
-        self.toon_texture_factor = fs.readVector(4)
+        v = fs.readStruct(fs.codec().material_morph_offset)
+        self.index = v[0]
+        self.offset_type = v[1]
+        self.diffuse_offset = list(v[2:6])
+        self.specular_offset = list(v[6:9])
+        self.shininess_offset = v[9]
+        self.ambient_offset = list(v[10:13])
+        self.edge_color_offset = list(v[13:17])
+        self.edge_size_offset = v[17]
+        self.texture_factor = list(v[18:22])
+        self.sphere_texture_factor = list(v[22:26])
+        self.toon_texture_factor = list(v[26:30])
 
     def save(self, fs):
-        fs.writeMaterialIndex(self.index)
-        fs.writeSignedByte(self.offset_type)
-        fs.writeVector(self.diffuse_offset)
-        fs.writeVector(self.specular_offset)
-        fs.writeFloat(self.shininess_offset)
-        fs.writeVector(self.ambient_offset)
-        fs.writeVector(self.edge_color_offset)
-        fs.writeFloat(self.edge_size_offset)
-        fs.writeVector(self.texture_factor)
-        fs.writeVector(self.sphere_texture_factor)
-        fs.writeVector(self.toon_texture_factor)
+        fs.writeStruct(fs.codec().material_morph_offset,
+                       (int(self.index), int(self.offset_type)) +
+                       tuple(self.diffuse_offset) +
+                       tuple(self.specular_offset) +
+                       (self.shininess_offset,) +
+                       tuple(self.ambient_offset) +
+                       tuple(self.edge_color_offset) +
+                       (self.edge_size_offset,) +
+                       tuple(self.texture_factor) +
+                       tuple(self.sphere_texture_factor) +
+                       tuple(self.toon_texture_factor))
 
 class GroupMorph(Morph):
+    __slots__ = _slots(base=False)
+
     def __init__(self, *args, **kwargs):
         Morph.__init__(self, *args, **kwargs)
 
@@ -1367,20 +1561,22 @@ class GroupMorph(Morph):
             self.offsets.append(t)
 
 class GroupMorphOffset:
+    __slots__ = _slots('morph', 'factor')
+
     def __init__(self):
         self.morph = None
         self.factor = 0.0
 
     def load(self, fs):
-        self.morph = fs.readMorphIndex()
-        self.factor = fs.readFloat()
+        self.morph, self.factor = fs.readStruct(fs.codec().group_morph_offset)
 
     def save(self, fs):
-        fs.writeMorphIndex(self.morph)
-        fs.writeFloat(self.factor)
+        fs.writeStruct(fs.codec().group_morph_offset, (int(self.morph), self.factor))
 
 
 class Display:
+    __slots__ = _slots('name', 'name_e', 'isSpecial', 'data')
+
     def __init__(self):
         self.name = ''
         self.name_e = ''
@@ -1431,6 +1627,12 @@ class Display:
                 raise Exception('invalid value.')
 
 class Rigid:
+    __slots__ = _slots(
+        'name', 'name_e', 'bone', 'collision_group_number', 'collision_group_mask', 'type', 'size',
+        'location', 'rotation', 'mass', 'velocity_attenuation', 'rotation_attenuation', 'bounce',
+        'friction', 'mode',
+        )
+
     TYPE_SPHERE = 0
     TYPE_BOX = 1
     TYPE_CAPSULE = 2
@@ -1470,56 +1672,55 @@ class Rigid:
         self.name = fs.readStr()
         self.name_e = fs.readStr()
 
-        boneIndex = fs.readBoneIndex()
+        v = fs.readStruct(fs.codec().rigid)
+        boneIndex = v[0]
         if boneIndex != -1:
             self.bone = boneIndex
         else:
             self.bone = None
 
-        self.collision_group_number = fs.readSignedByte()
-        self.collision_group_mask = fs.readUnsignedShort()
+        self.collision_group_number = v[1]
+        self.collision_group_mask = v[2]
 
-        self.type = fs.readSignedByte()
-        self.size = fs.readVector(3)
+        self.type = v[3]
+        self.size = list(v[4:7])
 
-        self.location = fs.readVector(3)
-        self.rotation = fs.readVector(3)
+        self.location = list(v[7:10])
+        self.rotation = list(v[10:13])
 
-        self.mass = fs.readFloat()
-        self.velocity_attenuation = fs.readFloat()
-        self.rotation_attenuation = fs.readFloat()
-        self.bounce = fs.readFloat()
-        self.friction = fs.readFloat()
+        self.mass = v[13]
+        self.velocity_attenuation = v[14]
+        self.rotation_attenuation = v[15]
+        self.bounce = v[16]
+        self.friction = v[17]
 
-        self.mode = fs.readSignedByte()
+        self.mode = v[18]
 
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        if self.bone is None:
-            fs.writeBoneIndex(-1)
-        else:
-            fs.writeBoneIndex(self.bone)
-
-        fs.writeSignedByte(self.collision_group_number)
-        fs.writeUnsignedShort(self.collision_group_mask)
-
-        fs.writeSignedByte(self.type)
-        fs.writeVector(self.size)
-
-        fs.writeVector(self.location)
-        fs.writeVector(self.rotation)
-
-        fs.writeFloat(self.mass)
-        fs.writeFloat(self.velocity_attenuation)
-        fs.writeFloat(self.rotation_attenuation)
-        fs.writeFloat(self.bounce)
-        fs.writeFloat(self.friction)
-
-        fs.writeSignedByte(self.mode)
+        fs.writeStruct(fs.codec().rigid, (
+            -1 if self.bone is None else int(self.bone),
+            int(self.collision_group_number),
+            int(self.collision_group_mask),
+            int(self.type),
+            ) + tuple(self.size) + tuple(self.location) + tuple(self.rotation) + (
+            self.mass,
+            self.velocity_attenuation,
+            self.rotation_attenuation,
+            self.bounce,
+            self.friction,
+            int(self.mode),
+            ))
 
 class Joint:
+    __slots__ = _slots(
+        'name', 'name_e', 'mode', 'src_rigid', 'dest_rigid', 'location', 'rotation',
+        'maximum_location', 'minimum_location', 'maximum_rotation', 'minimum_rotation',
+        'spring_constant', 'spring_rotation_constant',
+        )
+
     MODE_SPRING6DOF = 0
     def __init__(self):
         self.name = ''
@@ -1545,51 +1746,44 @@ class Joint:
         self.name = fs.readStr()
         self.name_e = fs.readStr()
 
-        self.mode = fs.readSignedByte()
+        v = fs.readStruct(fs.codec().joint)
+        self.mode = v[0]
 
-        self.src_rigid = fs.readRigidIndex()
-        self.dest_rigid = fs.readRigidIndex()
+        self.src_rigid = v[1]
+        self.dest_rigid = v[2]
         if self.src_rigid == -1:
             self.src_rigid = None
         if self.dest_rigid == -1:
             self.dest_rigid = None
 
-        self.location = fs.readVector(3)
-        self.rotation = fs.readVector(3)
+        self.location = list(v[3:6])
+        self.rotation = list(v[6:9])
 
-        self.minimum_location = fs.readVector(3)
-        self.maximum_location = fs.readVector(3)
-        self.minimum_rotation = fs.readVector(3)
-        self.maximum_rotation = fs.readVector(3)
+        self.minimum_location = list(v[9:12])
+        self.maximum_location = list(v[12:15])
+        self.minimum_rotation = list(v[15:18])
+        self.maximum_rotation = list(v[18:21])
 
-        self.spring_constant = fs.readVector(3)
-        self.spring_rotation_constant = fs.readVector(3)
+        self.spring_constant = list(v[21:24])
+        self.spring_rotation_constant = list(v[24:27])
 
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        fs.writeSignedByte(self.mode)
-
-        if self.src_rigid is not None:
-            fs.writeRigidIndex(self.src_rigid)
-        else:
-            fs.writeRigidIndex(-1)
-        if self.dest_rigid is not None:
-            fs.writeRigidIndex(self.dest_rigid)
-        else:
-            fs.writeRigidIndex(-1)
-
-        fs.writeVector(self.location)
-        fs.writeVector(self.rotation)
-
-        fs.writeVector(self.minimum_location)
-        fs.writeVector(self.maximum_location)
-        fs.writeVector(self.minimum_rotation)
-        fs.writeVector(self.maximum_rotation)
-
-        fs.writeVector(self.spring_constant)
-        fs.writeVector(self.spring_rotation_constant)
+        fs.writeStruct(fs.codec().joint, (
+            int(self.mode),
+            -1 if self.src_rigid is None else int(self.src_rigid),
+            -1 if self.dest_rigid is None else int(self.dest_rigid),
+            ) +
+            tuple(self.location) +
+            tuple(self.rotation) +
+            tuple(self.minimum_location) +
+            tuple(self.maximum_location) +
+            tuple(self.minimum_rotation) +
+            tuple(self.maximum_rotation) +
+            tuple(self.spring_constant) +
+            tuple(self.spring_rotation_constant))
 
 
 
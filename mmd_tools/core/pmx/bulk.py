@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+import collections.abc
+import struct
+
+import numpy as np
+
+from mmd_tools.core import pmx
+
+
+def _gather(buf, dtype, offsets):
+    """ Read one record of dtype at each byte offset of buf.
+
+    The buffer is viewed as an array of overlapping records starting at every
+    byte, so a single fancy-index copies all requested records at once.
+    """
+    dtype = np.dtype(dtype)
+    num = len(buf) - dtype.itemsize + 1
+    if num <= 0 or len(offsets) == 0:
+        return np.zeros(len(offsets), dtype)
+    view = np.ndarray(shape=(num,), dtype=dtype, buffer=buf, strides=(1,))
+    return view[offsets]
+
+
+def _scatter(buf, dtype, offsets, values):
+    """ Write values as records of dtype at the byte offsets of a writable buf. """
+    dtype = np.dtype(dtype)
+    num = len(buf) - dtype.itemsize + 1
+    if num <= 0 or len(offsets) == 0:
+        return
+    view = np.ndarray(shape=(num,), dtype=dtype, buffer=buf, strides=(1,))
+    view[offsets] = values
+
+
+def _indexArray(indices, size, shape):
+    """ Convert vertex indices to an array of unsigned integers of size bytes. """
+    if size not in (1, 2, 4):
+        raise ValueError('invalid data size %s'%str(size))
+    a = np.array(indices, dtype=np.int64).reshape(shape)
+    if a.size and (a.min() < 0 or a.max() >= 1 << (size * 8)):
+        raise struct.error('vertex index is out of range')
+    return a.astype('<u%d'%size)
+
+
+def _vertexLayout(bone_size, num_uvs):
+    """ Return the dtype of the fixed vertex prefix and the weight bodies. """
+    if bone_size not in (1, 2, 4):
+        raise ValueError('invalid data size %s'%str(bone_size))
+
+    prefix_fields = [('co', '<f4', (3,)), ('normal', '<f4', (3,)), ('uv', '<f4', (2,))]
+    if num_uvs > 0:
+        prefix_fields.append(('additional_uvs', '<f4', (num_uvs, 4)))
+    prefix_fields.append(('weight_type', 'u1'))
+
+    bone_dtype = '<i%d'%bone_size
+    body_dtypes = {
+        pmx.BoneWeight.BDEF1: np.dtype([('bones', bone_dtype, (1,))]),
+        pmx.BoneWeight.BDEF2: np.dtype([('bones', bone_dtype, (2,)), ('weight', '<f4')]),
+        pmx.BoneWeight.BDEF4: np.dtype([('bones', bone_dtype, (4,)), ('weights', '<f4', (4,))]),
+        pmx.BoneWeight.SDEF: np.dtype([('bones', bone_dtype, (2,)), ('weight', '<f4'),
+                                       ('c', '<f4', (3,)), ('r0', '<f4', (3,)), ('r1', '<f4', (3,))]),
+        pmx.BoneWeight.QDEF: np.dtype([('bones', bone_dtype, (4,)), ('weights', '<f4', (4,))]),
+        }
+    return np.dtype(prefix_fields), body_dtypes
+
+
+def _vertexStructs(bone_size, num_uvs):
+    """ Return a struct.Struct of the whole vertex record for each weight type. """
+    if bone_size not in (1, 2, 4):
+        raise ValueError('invalid data size %s'%str(bone_size))
+    b = {1:'b', 2:'h', 4:'i'}[bone_size]
+    prefix = '<8f%dfB'%(num_uvs * 4)
+    bodies = {
+        pmx.BoneWeight.BDEF1: b,
+        pmx.BoneWeight.BDEF2: '2%sf'%b,
+        pmx.BoneWeight.BDEF4: '4%s4f'%b,
+        pmx.BoneWeight.SDEF: '2%s10f'%b,
+        pmx.BoneWeight.QDEF: '4%s4f'%b,
+        }
+    return {k:struct.Struct(prefix + v + 'f') for k, v in bodies.items()}
+
+
+def _maxVertexSize(prefix_dtype, body_dtypes):
+    return prefix_dtype.itemsize + max(i.itemsize for i in body_dtypes.values()) + 4
+
+
+def _scanVertices(buf, count, prefix_dtype, body_dtypes, append=None):
+    """ Return the number and the size of the complete vertex records among
+    the first count records at the start of buf.
+
+    The weight type of each record decides where the next one begins, so
+    the records are walked in one sequential scan. The offset of each
+    complete record is passed to append if given. A short buf ends the scan
+    at its last complete record.
+    """
+    type_pos = prefix_dtype.itemsize - 1
+    record_sizes = [prefix_dtype.itemsize + body_dtypes[i].itemsize + 4 for i in range(len(body_dtypes))]
+    size = len(buf)
+    pos = 0
+    num = 0
+    try:
+        while num < count:
+            end = pos + record_sizes[buf[pos + type_pos]]
+            if end > size:
+                break
+            if append is not None:
+                append(pos)
+            pos = end
+            num += 1
+    except IndexError:
+        if pos + type_pos < size:
+            raise ValueError('invalid weight type %s'%str(buf[pos + type_pos]))
+    return num, pos
+
+
+def skip_vertices(fs, count):
+    """ Move fs past count vertex records without decoding them. """
+    header = fs.header()
+    prefix_dtype, body_dtypes = _vertexLayout(header.bone_index_size, header.additional_uvs)
+    start = fs.tell()
+    buf = fs.readView(count * _maxVertexSize(prefix_dtype, body_dtypes))
+    num, size = _scanVertices(buf, count, prefix_dtype, body_dtypes)
+    fs.seek(start + size)
+    if num < count:
+        raise struct.error('vertex section is truncated')
+
+
+def _vertexValues(v, num_uvs):
+    """ Flatten a pmx.Vertex into the values of its record. """
+    values = list(v.co)
+    values.extend(v.normal)
+    values.extend(v.uv)
+    for uv in v.additional_uvs:
+        values.extend(uv)
+    values.extend([0.0] * (max(0, num_uvs - len(v.additional_uvs)) * 4))
+
+    w = v.weight
+    values.append(w.type)
+    if w.type == pmx.BoneWeight.BDEF1:
+        values.append(w.bones[0])
+    elif w.type == pmx.BoneWeight.BDEF2:
+        values.extend(w.bones[:2])
+        values.append(w.weights[0])
+    elif w.type in (pmx.BoneWeight.BDEF4, pmx.BoneWeight.QDEF):
+        values.extend(w.bones[:4])
+        values.extend(w.weights[:4])
+    elif w.type == pmx.BoneWeight.SDEF:
+        if not isinstance(w.weights, pmx.BoneWeightSDEF):
+            raise ValueError
+        values.extend(w.bones[:2])
+        values.append(w.weights.weight)
+        values.extend(w.weights.c)
+        values.extend(w.weights.r0)
+        values.extend(w.weights.r1)
+    else:
+        raise ValueError('invalid weight type %s'%str(w.type))
+    values.append(v.edge_scale)
+    return values
+
+
+class VertexData:
+    """ The vertex section of a pmx model as NumPy arrays.
+
+    Bone indices and weights are padded to 4 influences. Unused bone slots
+    are -1 and the weights of BDEF1/BDEF2/SDEF vertices are stored as their
+    effective values (1.0 for BDEF1, w and 1-w for BDEF2/SDEF), so they can
+    be processed like BDEF4. SDEF parameters are zero for other types.
+    """
+    def __init__(self, count=0, additional_uvs=0):
+        self.__allocate(count, additional_uvs)
+
+    def __allocate(self, count, additional_uvs):
+        self.co = np.zeros((count, 3), np.float32)
+        self.normal = np.zeros((count, 3), np.float32)
+        self.uv = np.zeros((count, 2), np.float32)
+        self.additional_uvs = np.zeros((count, additional_uvs, 4), np.float32)
+        self.weight_type = np.zeros(count, np.uint8)
+        self.bones = np.full((count, 4), -1, np.int32)
+        self.weights = np.zeros((count, 4), np.float32)
+        self.sdef_c = np.zeros((count, 3), np.float32)
+        self.sdef_r0 = np.zeros((count, 3), np.float32)
+        self.sdef_r1 = np.zeros((count, 3), np.float32)
+        self.edge_scale = np.ones(count, np.float32)
+
+    @classmethod
+    def fromVertices(cls, vertices):
+        """ Create VertexData from a list of pmx.Vertex objects. """
+        count = len(vertices)
+        num_uvs = max([len(v.additional_uvs) for v in vertices] or [0])
+        self = cls(count, num_uvs)
+        if count == 0:
+            return self
+        self.co[:] = [v.co for v in vertices]
+        self.normal[:] = [v.normal for v in vertices]
+        self.uv[:] = [v.uv for v in vertices]
+        self.edge_scale[:] = [v.edge_scale for v in vertices]
+        for i, v in enumerate(vertices):
+            if len(v.additional_uvs) > 0:
+                self.additional_uvs[i, :len(v.additional_uvs)] = v.additional_uvs
+
+        self.weight_type[:] = [v.weight.type for v in vertices]
+        bones = []
+        weights = []
+        for i, v in enumerate(vertices):
+            w = v.weight
+            if w.type == pmx.BoneWeight.BDEF1:
+                bones.append((w.bones[0], -1, -1, -1))
+                weights.append((1.0, 0.0, 0.0, 0.0))
+            elif w.type in (pmx.BoneWeight.BDEF2, pmx.BoneWeight.SDEF):
+                bones.append((w.bones[0], w.bones[1], -1, -1))
+                if w.type == pmx.BoneWeight.SDEF:
+                    weight = w.weights.weight
+                    self.sdef_c[i] = w.weights.c
+                    self.sdef_r0[i] = w.weights.r0
+                    self.sdef_r1[i] = w.weights.r1
+                else:
+                    weight = w.weights[0]
+                weights.append((weight, 1.0 - weight, 0.0, 0.0))
+            elif w.type in (pmx.BoneWeight.BDEF4, pmx.BoneWeight.QDEF):
+                bones.append(tuple(w.bones[:4]))
+                weights.append(tuple(w.weights[:4]))
+            else:
+                raise ValueError('invalid weight type %s'%str(w.type))
+        self.bones[:] = bones
+        self.weights[:] = weights
+        return self
+
+    def take(self, rows):
+        """ Return a new VertexData with the vertices of rows. """
+        data = VertexData()
+        for name, a in self.__dict__.items():
+            setattr(data, name, a[rows])
+        return data
+
+    def assign(self, rows, data):
+        """ Copy the vertices of data into rows. """
+        for name, a in data.__dict__.items():
+            if name == 'additional_uvs':
+                self.additional_uvs[rows, :a.shape[1]] = a
+            else:
+                getattr(self, name)[rows] = a
+
+    def __len__(self):
+        return len(self.co)
+
+    def __repr__(self):
+        return '<VertexData %d vertices, %d additional uvs>'%(len(self), self.additional_uvs.shape[1])
+
+    def load(self, fs, count):
+        """ Read count vertex records of fs.
+
+        If the file is truncated, the complete records are kept and
+        struct.error is raised after them.
+        """
+        header = fs.header()
+        num_add_uvs = header.additional_uvs
+        prefix_dtype, body_dtypes = _vertexLayout(header.bone_index_size, num_add_uvs)
+        body_sizes = [body_dtypes[i].itemsize for i in range(len(body_dtypes))]
+
+        start = fs.tell()
+        offsets = []
+        buf = fs.readView(count * _maxVertexSize(prefix_dtype, body_dtypes))
+        num, size = _scanVertices(buf, count, prefix_dtype, body_dtypes, offsets.append)
+        fs.seek(start + size)
+
+        self.__allocate(num, num_add_uvs)
+        offsets = np.array(offsets, dtype=np.intp)
+        prefix = _gather(buf, prefix_dtype, offsets)
+        self.co[:] = prefix['co']
+        self.normal[:] = prefix['normal']
+        self.uv[:] = prefix['uv']
+        if num_add_uvs > 0:
+            self.additional_uvs[:] = prefix['additional_uvs']
+        self.weight_type[:] = prefix['weight_type']
+
+        body_offsets = offsets + prefix_dtype.itemsize
+        for weight_type, dtype in body_dtypes.items():
+            rows = np.flatnonzero(self.weight_type == weight_type)
+            if len(rows) == 0:
+                continue
+            body = _gather(buf, dtype, body_offsets[rows])
+            num_bones = dtype['bones'].shape[0]
+            self.bones[rows, :num_bones] = body['bones']
+            if weight_type == pmx.BoneWeight.BDEF1:
+                self.weights[rows, 0] = 1.0
+            elif 'weights' in dtype.names:
+                self.weights[rows] = body['weights']
+            else:
+                self.weights[rows, 0] = body['weight']
+                self.weights[rows, 1] = 1.0 - body['weight']
+            if weight_type == pmx.BoneWeight.SDEF:
+                self.sdef_c[rows] = body['c']
+                self.sdef_r0[rows] = body['r0']
+                self.sdef_r1[rows] = body['r1']
+
+        edge_offsets = body_offsets + np.array(body_sizes, dtype=np.intp)[self.weight_type]
+        self.edge_scale[:] = _gather(buf, '<f4', edge_offsets)
+        if num < count:
+            raise struct.error('vertex section is truncated')
+
+    def pack(self, buf, offsets, rows, header):
+        """ Write the records of the given rows at the byte offsets of buf.
+
+        The records have the additional uvs of header, padded with zeros like
+        pmx.Vertex.save(). Like there, all additional uvs of the arrays are
+        written even if header has fewer.
+        """
+        num_uvs = max(header.additional_uvs, self.additional_uvs.shape[1])
+        prefix_dtype, body_dtypes = _vertexLayout(header.bone_index_size, num_uvs)
+        rows = np.asarray(rows, dtype=np.intp)
+        offsets = np.asarray(offsets, dtype=np.intp)
+        weight_type = self.weight_type[rows]
+        for t, body_dtype in body_dtypes.items():
+            mask = weight_type == t
+            if not mask.any():
+                continue
+            r = rows[mask]
+            record_dtype = np.dtype([('prefix', prefix_dtype), ('body', body_dtype), ('edge_scale', '<f4')])
+            records = np.zeros(len(r), record_dtype)
+            prefix = records['prefix']
+            prefix['co'] = self.co[r]
+            prefix['normal'] = self.normal[r]
+            prefix['uv'] = self.uv[r]
+            if num_uvs > 0:
+                prefix['additional_uvs'][:, :self.additional_uvs.shape[1]] = self.additional_uvs[r]
+            prefix['weight_type'] = t
+            body = records['body']
+            num_bones = body_dtype['bones'].shape[0]
+            body['bones'] = self.bones[r, :num_bones]
+            if 'weights' in body_dtype.names:
+                body['weights'] = self.weights[r]
+            elif 'weight' in body_dtype.names:
+                body['weight'] = self.weights[r, 0]
+            if t == pmx.BoneWeight.SDEF:
+                body['c'] = self.sdef_c[r]
+                body['r0'] = self.sdef_r0[r]
+                body['r1'] = self.sdef_r1[r]
+            records['edge_scale'] = self.edge_scale[r]
+            _scatter(buf, record_dtype, offsets[mask], records)
+
+    def vertex(self, index):
+        """ Create a pmx.Vertex from the arrays of the given vertex. """
+        return self.__createVertex(
+            self.co[index].tolist(),
+            self.normal[index].tolist(),
+            self.uv[index].tolist(),
+            self.additional_uvs[index].tolist(),
+            int(self.weight_type[index]),
+            self.bones[index].tolist(),
+            self.weights[index].tolist(),
+            self.sdef_c[index].tolist(),
+            self.sdef_r0[index].tolist(),
+            self.sdef_r1[index].tolist(),
+            float(self.edge_scale[index]),
+            )
+
+    def vertices(self, indices=None):
+        """ Create pmx.Vertex objects for all vertices or the given indices. """
+        if indices is None:
+            indices = slice(None)
+        else:
+            indices = np.asarray(indices, dtype=np.intp)
+        return [self.__createVertex(*i) for i in zip(
+            self.co[indices].tolist(),
+            self.normal[indices].tolist(),
+            self.uv[indices].tolist(),
+            self.additional_uvs[indices].tolist(),
+            self.weight_type[indices].tolist(),
+            self.bones[indices].tolist(),
+            self.weights[indices].tolist(),
+            self.sdef_c[indices].tolist(),
+            self.sdef_r0[indices].tolist(),
+            self.sdef_r1[indices].tolist(),
+            self.edge_scale[indices].tolist(),
+            )]
+
+    @staticmethod
+    def __createVertex(co, normal, uv, additional_uvs, weight_type, bones, weights, c, r0, r1, edge_scale):
+        v = pmx.Vertex()
+        v.co = co
+        v.normal = normal
+        v.uv = uv
+        v.additional_uvs = additional_uvs
+        v.edge_scale = edge_scale
+        w = v.weight = pmx.BoneWeight()
+        w.type = weight_type
+        if weight_type == pmx.BoneWeight.BDEF1:
+            w.bones = bones[:1]
+        elif weight_type == pmx.BoneWeight.BDEF2:
+            w.bones = bones[:2]
+            w.weights = weights[:1]
+        elif weight_type == pmx.BoneWeight.SDEF:
+            w.bones = bones[:2]
+            w.weights = pmx.BoneWeightSDEF(weights[0], c, r0, r1)
+        else:
+            w.bones = bones
+            w.weights = weights
+        return v
+
+
+class VertexList(collections.abc.MutableSequence):
+    """ A list of pmx.Vertex objects backed by VertexData.
+
+    Vertex objects are only created when they are accessed, a block of
+    neighbouring vertices at a time. Until then an item holds the row of its
+    vertex in VertexData, so items can be moved or removed without creating
+    objects. data() returns the arrays while they still mirror the list, and
+    None once the list has been modified or any Vertex object was created,
+    since those can be edited in place.
+    """
+    BLOCK_SIZE = 1024
+
+    def __init__(self, data):
+        self.__data = data
+        self.__items = list(range(len(data)))
+        self.__modified = False
+
+    def data(self):
+        if self.__modified:
+            return None
+        return self.__data
+
+    def pendingRows(self):
+        """ Return the VertexData and the positions and rows of the items
+        whose Vertex objects have not been created yet.
+        """
+        items = self.__items
+        positions = [i for i, v in enumerate(items) if v.__class__ is int]
+        return self.__data, positions, [items[i] for i in positions]
+
+    def __load(self, start, stop):
+        items = self.__items
+        positions = [i for i in range(start, stop) if items[i].__class__ is int]
+        if positions:
+            self.__modified = True # the arrays do not see edits of the objects
+            vertices = self.__data.vertices([items[i] for i in positions])
+            for i, v in zip(positions, vertices):
+                items[i] = v
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                self.__load(start, max(start, stop))
+                return self.__items[index]
+            return [self[i] for i in range(start, stop, step)]
+        v = self.__items[index]
+        if v.__class__ is int:
+            if index < 0:
+                index += len(self)
+            start = index - index % self.BLOCK_SIZE
+            self.__load(start, min(start + self.BLOCK_SIZE, len(self)))
+            v = self.__items[index]
+        return v
+
+    def __iter__(self):
+        self.__load(0, len(self))
+        return iter(self.__items)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+        self.__modified = True
+        self.__items[index] = value
+
+    def __delitem__(self, index):
+        self.__modified = True
+        del self.__items[index]
+
+    def insert(self, index, value):
+        self.__modified = True
+        self.__items.insert(index, value)
+
+    def keep(self, indices):
+        """ Keep only the items at indices, in that order, without creating Vertex objects. """
+        items = self.__items
+        self.__modified = True
+        self.__items = [items[i] for i in indices]
+
+    def __repr__(self):
+        return '<VertexList %d vertices>'%len(self)
+
+
+def vertex_data(vertices):
+    """ Return a list of vertices as VertexData.
+
+    The arrays of a VertexList are used directly while its vertices were
+    not accessed; otherwise the data is gathered from the pmx.Vertex objects.
+    """
+    if isinstance(vertices, VertexList):
+        data = vertices.data()
+        if data is not None:
+            return data
+        data, positions, rows = vertices.pendingRows()
+        if len(positions) == len(vertices):
+            return data.take(rows)
+        if len(positions) > 0:
+            # rows of created Vertex objects are gathered from the objects
+            pending = data.take(rows)
+            created = np.ones(len(vertices), dtype=bool)
+            created[positions] = False
+            created = np.flatnonzero(created)
+            objects = VertexData.fromVertices([vertices[i] for i in created.tolist()])
+            num_uvs = max(pending.additional_uvs.shape[1], objects.additional_uvs.shape[1])
+            result = VertexData(len(vertices), num_uvs)
+            result.assign(positions, pending)
+            result.assign(created, objects)
+            return result
+    return VertexData.fromVertices(vertices)
+
+
+def load_faces(fs, count):
+    """ Read count vertex indices as an array of shape (count//3, 3).
+
+    The vertex order of each face is reversed like pmx.Model.faces. The
+    array is a view of the file and is only valid while fs is open. If the
+    file is truncated, only the complete faces are returned.
+    """
+    index_size = fs.header().vertex_index_size
+    if index_size not in (1, 2, 4):
+        raise ValueError('invalid data size %s'%str(index_size))
+    num_faces = min(int(count/3), max(0, fs.size() - fs.tell()) // (index_size * 3))
+    faces = fs.readArray('<u%d'%index_size, num_faces * 3).reshape(num_faces, 3)
+    return faces[:, ::-1]
+
+
+def save_vertices(fs, vertices):
+    """ Write the vertex section with a single write.
+
+    The size of each record is known from its weight type, so the section is
+    packed into one preallocated buffer. Vertices of a VertexList that were
+    never accessed are copied from its arrays; others are packed from their
+    pmx.Vertex objects.
+    """
+    header = fs.header()
+    bone_size = header.bone_index_size
+    num_uvs = header.additional_uvs
+    structs = {num_uvs:_vertexStructs(bone_size, num_uvs)}
+    num_vertices = len(vertices)
+
+    data, positions, rows = None, [], []
+    if isinstance(vertices, VertexList):
+        data, positions, rows = vertices.pendingRows()
+    pending = np.zeros(num_vertices, dtype=bool)
+    pending[positions] = True
+
+    sizes = np.zeros(num_vertices, dtype=np.intp)
+    if len(rows) > 0:
+        data_structs = _vertexStructs(bone_size, max(num_uvs, data.additional_uvs.shape[1]))
+        type_sizes = np.array([data_structs[i].size for i in range(len(data_structs))], dtype=np.intp)
+        sizes[positions] = type_sizes[data.weight_type[rows]]
+    objects = []
+    for i in np.flatnonzero(~pending).tolist():
+        v = vertices[i]
+        n = max(num_uvs, len(v.additional_uvs))
+        if n not in structs:
+            structs[n] = _vertexStructs(bone_size, n)
+        fmt = structs[n].get(v.weight.type, None)
+        if fmt is None:
+            raise ValueError('invalid weight type %s'%str(v.weight.type))
+        sizes[i] = fmt.size
+        objects.append((i, v, fmt, n))
+    offsets = np.zeros(num_vertices + 1, dtype=np.intp)
+    np.cumsum(sizes, out=offsets[1:])
+
+    buf = bytearray(int(offsets[-1]))
+    for i, v, fmt, n in objects:
+        fmt.pack_into(buf, int(offsets[i]), *_vertexValues(v, n))
+    if len(rows) > 0:
+        data.pack(np.frombuffer(buf, dtype=np.uint8), offsets[positions], rows, header)
+
+    fs.writeInt(num_vertices)
+    fs.writeBytes(buf)
+
+
+def save_faces(fs, faces):
+    """ Write the face section with a single write. """
+    indices = _indexArray(faces, fs.header().vertex_index_size, (-1, 3))
+    fs.writeInt(len(indices) * 3)
+    fs.writeBytes(indices[:, ::-1].tobytes())
+
+
+def morph_offsets(offsets, size):
+    """ Return the vertex indices and the offsets of a vertex or uv morph as arrays. """
+    indices = np.array([i.index for i in offsets], dtype=np.int64)
+    values = np.array([i.offset for i in offsets], dtype=np.float64).reshape(len(offsets), size)
+    return indices, values
+
+
+def save_morph_offsets(fs, offsets, size):
+    """ Write the offsets of a vertex or uv morph with a single write. """
+    num_offsets = len(offsets)
+    index_size = fs.header().vertex_index_size
+    indices, values = morph_offsets(offsets, size)
+    records = np.empty(num_offsets, [('index', '<u%d'%index_size), ('offset', '<f4', (size,))])
+    records['index'] = _indexArray(indices, index_size, (num_offsets,))
+    records['offset'] = values
+    fs.writeInt(num_offsets)
+    fs.writeBytes(records.tobytes())
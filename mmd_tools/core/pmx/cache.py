@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+import binascii
+import collections
+import copy
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import bulk
+
+
+class ModelCache:
+    """ An on-disk cache of pmx models prepared for importing.
+
+    An entry holds a model after it was cleaned by the importer, together
+    with the vertex map of remove_doubles. It is stored as an uncompressed
+    .npz file: vertices, faces and vertex/uv morph offsets as arrays (with
+    the float32 precision of the pmx format) and the remaining small part of
+    the model as JSON, which is decoded into the record classes of the pmx
+    module only (nothing is unpickled).
+
+    Entries are keyed by the path, size, mtime and content hash of the
+    source file, the options of the cleaner and a hash of the sources of the
+    pmx/pmd packages, so changing the code which prepares the models
+    invalidates them. Using an entry updates its
+    mtime, and the least recently used entries are removed when the size of
+    the folder exceeds max_size bytes.
+    """
+    VERSION = 3
+    SUFFIX = '.npz'
+    PACKAGES = ('pmx', 'pmd')
+
+    __source_hash = None
+
+    def __init__(self, folder, max_size=1024*1024*1024):
+        self.folder = folder
+        self.max_size = max_size
+
+    def key(self, path, options):
+        """ Return the key of the file of path for options (a tuple of values). """
+        path = os.path.normcase(os.path.abspath(path))
+        st = os.stat(path)
+        content = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                content.update(chunk)
+        key = hashlib.sha1()
+        key.update(repr((self.VERSION, self.sourceHash(), path, st.st_size, st.st_mtime, content.hexdigest(), tuple(options))).encode('utf-8'))
+        return key.hexdigest()
+
+    @classmethod
+    def sourceHash(cls):
+        """ Return the hash of the sources of the packages which load and clean models. """
+        if cls.__source_hash is None:
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            h = hashlib.sha1()
+            for package in cls.PACKAGES:
+                folder = os.path.join(root, package)
+                for name in sorted(os.listdir(folder)):
+                    if name.endswith('.py'):
+                        h.update(('%s/%s' % (package, name)).encode('utf-8'))
+                        with open(os.path.join(folder, name), 'rb') as f:
+                            h.update(f.read())
+            cls.__source_hash = h.hexdigest()
+        return cls.__source_hash
+
+    def __entryPath(self, key):
+        return os.path.join(self.folder, key + self.SUFFIX)
+
+    def load(self, key):
+        """ Return (model, vertex_map) of the entry of key, or None. """
+        path = self.__entryPath(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = _loadEntry(data)
+        except Exception as e:
+            logging.warning(' * Failed to load cached model "%s": %s', path, e)
+            self.__remove(path)
+            return None
+        os.utime(path, None)
+        logging.info('Loaded cached model: %s', path)
+        return entry
+
+    def save(self, key, model, vertex_map=None):
+        """ Store the model and the vertex map of remove_doubles as the entry of key. """
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        path = self.__entryPath(key)
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, **_dumpEntry(model, vertex_map))
+            os.replace(temp_path, path)
+        except Exception as e:
+            logging.warning(' * Failed to cache model "%s": %s', path, e)
+            self.__remove(temp_path)
+            return
+        logging.info('Cached model: %s', path)
+        self.__evict()
+
+    def clear(self):
+        for path, st in self.__entries():
+            self.__remove(path)
+
+    def __entries(self):
+        if not os.path.isdir(self.folder):
+            return []
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.folder, name)
+                entries.append((path, os.stat(path)))
+        return entries
+
+    def __evict(self):
+        entries = sorted(self.__entries(), key=lambda x: x[1].st_mtime)
+        total = sum(st.st_size for path, st in entries)
+        for path, st in entries:
+            if total <= self.max_size:
+                break
+            logging.info('Remove cached model: %s', path)
+            self.__remove(path)
+            total -= st.st_size
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class MemoryCache:
+    """ An in-memory cache of entries of a known size.
+
+    Entries are kept in the order of their use and the least recently used
+    ones are dropped when the total size exceeds max_size bytes. An entry
+    can have an owner (e.g. the name of an object): storing a new entry
+    for the owner drops its previous one, which is outdated.
+    """
+
+    def __init__(self, max_size=256*1024*1024):
+        self.max_size = max_size
+        self.__entries = collections.OrderedDict() # key => (entry, size, owner)
+        self.__owners = {}
+        self.__size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def size(self):
+        """ Return the total size of the entries in bytes. """
+        return self.__size
+
+    def get(self, key):
+        """ Return the entry of key, or None. """
+        item = self.__entries.get(key, None)
+        if item is None:
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, entry, size, owner=None):
+        """ Store entry of size bytes as key, unless it is larger than the whole cache. """
+        self.discard(key)
+        if owner is not None:
+            self.discard(self.__owners.get(owner, None))
+        if size > self.max_size:
+            logging.debug(' * Not caching %s: %d bytes', key, size)
+            return
+        self.__entries[key] = (entry, size, owner)
+        self.__size += size
+        if owner is not None:
+            self.__owners[owner] = key
+        self.__evict()
+
+    def discard(self, key):
+        item = self.__entries.pop(key, None)
+        if item is None:
+            return
+        entry, size, owner = item
+        self.__size -= size
+        if owner is not None and self.__owners.get(owner, None) == key:
+            del self.__owners[owner]
+
+    def clear(self):
+        self.__entries.clear()
+        self.__owners.clear()
+        self.__size = 0
+
+    def __evict(self):
+        while self.__size > self.max_size and self.__entries:
+            key = next(iter(self.__entries))
+            logging.debug('Remove cached entry: %s', key)
+            self.discard(key)
+
+
+_VERTEX_ARRAYS = ('co', 'normal', 'uv', 'additional_uvs', 'weight_type', 'bones', 'weights',
+                  'sdef_c', 'sdef_r0', 'sdef_r1', 'edge_scale')
+
+_RECORD_CLASSES = {c.__name__:c for c in vars(pmx).values()
+                   if isinstance(c, type) and c.__module__ == pmx.__name__}
+
+def _fields(obj):
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                yield name, getattr(obj, name)
+    for item in getattr(obj, '__dict__', {}).items():
+        yield item
+
+def _encode(value):
+    """ Convert value to JSON data, keeping the classes of the pmx records. """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, list):
+        return [_encode(i) for i in value]
+    if isinstance(value, tuple):
+        return {'tuple':[_encode(i) for i in value]}
+    if isinstance(value, bytes):
+        return {'bytes':binascii.hexlify(value).decode('ascii')}
+    if _RECORD_CLASSES.get(type(value).__name__, None) is type(value):
+        return {'class':type(value).__name__, 'fields':{k:_encode(v) for k, v in _fields(value)}}
+    if hasattr(value, '__len__'): # numpy arrays, mathutils vectors
+        return [_encode(i) for i in value]
+    raise TypeError('can not cache a value of %s' % type(value))
+
+def _decode(data):
+    if isinstance(data, list):
+        return [_decode(i) for i in data]
+    if not isinstance(data, dict):
+        return data
+    if 'tuple' in data:
+        return tuple(_decode(i) for i in data['tuple'])
+    if 'bytes' in data:
+        return binascii.unhexlify(data['bytes'])
+    cls = _RECORD_CLASSES[data['class']]
+    obj = cls.__new__(cls)
+    for k, v in data['fields'].items():
+        setattr(obj, k, _decode(v))
+    return obj
+
+def _offsetSize(morph):
+    if isinstance(morph, pmx.VertexMorph):
+        return 3
+    if isinstance(morph, pmx.UVMorph):
+        return 4
+    return 0
+
+def _dumpEntry(model, vertex_map):
+    vertex_data = bulk.vertex_data(model.vertices)
+    arrays = {'vertex_' + i:getattr(vertex_data, i) for i in _VERTEX_ARRAYS}
+
+    arrays['faces'] = np.array(model.faces, dtype=np.int32).reshape(-1, 3)
+    if vertex_map is not None:
+        arrays['vertex_map'] = np.array(vertex_map, dtype=np.int32).reshape(-1, 2)
+
+    # vertex/uv morph offsets are the largest part of the remaining data
+    morphs = []
+    offset_counts = []
+    offset_indices = []
+    offset_values = []
+    for m in model.morphs:
+        size = _offsetSize(m)
+        offset_counts.append(len(m.offsets) if size else 0)
+        if size:
+            offset_indices.extend(i.index for i in m.offsets)
+            offset_values.extend((tuple(i.offset) + (0.0,))[:4] for i in m.offsets)
+            m = copy.copy(m)
+            m.offsets = []
+        morphs.append(m)
+    arrays['morph_offset_counts'] = np.array(offset_counts, dtype=np.int64)
+    arrays['morph_offset_indices'] = np.array(offset_indices, dtype=np.int32)
+    arrays['morph_offset_values'] = np.array(offset_values, dtype=np.float32).reshape(-1, 4)
+
+    model = copy.copy(model)
+    model.vertices = []
+    model.faces = []
+    model.morphs = morphs
+    arrays['model'] = np.frombuffer(json.dumps(_encode(model)).encode('utf-8'), dtype=np.uint8)
+    return arrays
+
+def _loadEntry(data):
+    model = _decode(json.loads(data['model'].tobytes().decode('utf-8')))
+    if not isinstance(model, pmx.Model):
+        raise ValueError('invalid model data')
+
+    vertex_data = bulk.VertexData()
+    for i in _VERTEX_ARRAYS:
+        setattr(vertex_data, i, data['vertex_' + i])
+    model.vertices = bulk.VertexList(vertex_data)
+    model.faces = list(zip(*data['faces'].T.tolist()))
+
+    counts = data['morph_offset_counts'].tolist()
+    indices = data['morph_offset_indices'].tolist()
+    values = data['morph_offset_values'].tolist()
+    start = 0
+    for m, count in zip(model.morphs, counts):
+        size = _offsetSize(m)
+        offset_class = pmx.VertexMorphOffset if size == 3 else pmx.UVMorphOffset
+        for index, value in zip(indices[start:start+count], values[start:start+count]):
+            o = offset_class()
+            o.index = index
+            o.offset = value[:size]
+            m.offsets.append(o)
+        start += count
+
+    vertex_map = None
+    if 'vertex_map' in data.files:
+        vertex_map = [tuple(i) for i in data['vertex_map'].tolist()]
+    return model, vertex_map
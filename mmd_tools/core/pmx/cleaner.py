@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import numpy as np
+
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import bulk
+
+
+def _floatKeys(values):
+    """ View float values as integers which are equal if the values compare equal. """
+    values = np.asarray(values, dtype=np.float64) + 0.0 # -0.0 to 0.0
+    return values.view(np.uint64)
+
+def _mix(h):
+    """ The 64-bit finalizer of splitmix64 (wraps around like C). """
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+_SEEDS = (np.uint64(0x9e3779b97f4a7c15), np.uint64(0xc2b2ae3d27d4eb4f))
+
+def _morphFingerprints(pmx_morphs, vertex_count):
+    """ Return the fingerprints of the vertex/uv morph offsets of each vertex.
+
+    Two vertices have equal rows if they have the same sequence of offset
+    values in the order of the morphs, like the offset tuples gathered by
+    the old implementation. The sequence is hashed into 128 bits plus the
+    number of offsets.
+    """
+    indices = []
+    values = []
+    for m in pmx_morphs:
+        if isinstance(m, pmx.VertexMorph):
+            size = 3
+        elif isinstance(m, pmx.UVMorph):
+            size = 4
+        else:
+            continue
+        i, v = bulk.morph_offsets(m.offsets, size)
+        indices.append(i)
+        # the size is a part of the value, (x, y, z) != (x, y, z, 0.0)
+        values.append(np.hstack((_floatKeys(v), np.full((len(v), 5 - size), size, dtype=np.uint64))))
+    fingerprints = np.zeros((vertex_count, 3), dtype=np.uint64)
+    if len(indices) == 0:
+        return fingerprints
+    indices = np.concatenate(indices)
+    values = np.concatenate(values)
+    if len(indices) == 0:
+        return fingerprints
+
+    order = np.argsort(indices, kind='mergesort')
+    indices, values = indices[order], values[order]
+    starts = np.flatnonzero(np.r_[True, indices[1:] != indices[:-1]])
+    counts = np.diff(np.r_[starts, len(indices)])
+    positions = np.arange(len(indices)) - np.repeat(starts, counts)
+    vertices = indices[starts]
+
+    with np.errstate(over='ignore'):
+        fingerprints[vertices, 0] = counts
+        for column, seed in enumerate(_SEEDS, 1):
+            h = _mix(positions.astype(np.uint64) + seed)
+            for i in range(values.shape[1]):
+                h = _mix(h ^ (values[:, i] + seed))
+            fingerprints[vertices, column] = np.add.reduceat(h, starts)
+    return fingerprints
+
+
+class PMXCleaner:
+    """ Remove unused and duplicate data of a pmx model before importing it. """
+
+    @classmethod
+    def clean(cls, pmx_model, mesh_only):
+        logging.info('Cleaning PMX data...')
+        pmx_vertices = pmx_model.vertices
+        vertex_count = len(pmx_vertices)
+        faces = np.array(pmx_model.faces, dtype=np.int64).reshape(-1, 3)
+
+        # clean face/vertex
+        faces = faces[cls.__clean_pmx_faces(pmx_model.materials, faces, faces)]
+
+        used, new_faces = np.unique(faces, return_inverse=True)
+        is_index_clean = len(used) == vertex_count
+        if is_index_clean:
+            logging.info('   (vertices is clean)')
+        else:
+            logging.warning('   - removed %d vertices', vertex_count-len(used))
+            if isinstance(pmx_vertices, bulk.VertexList):
+                pmx_vertices.keep(used.tolist())
+            else:
+                pmx_vertices[:] = [pmx_vertices[i] for i in used.tolist()]
+            # update vertex indices of faces
+            faces = new_faces.reshape(-1, 3)
+        pmx_model.faces[:] = faces.tolist()
+
+        if mesh_only:
+            logging.info('   - Done (mesh only)!!')
+            return
+
+        if not is_index_clean:
+            # clean vertex/uv morphs
+            new_indices = np.full(vertex_count, -1, dtype=np.int64)
+            new_indices[used] = np.arange(len(used))
+            cls.__remap_pmx_morphs(pmx_model.morphs, new_indices)
+        logging.info('   - Done!!')
+
+    @classmethod
+    def remove_doubles(cls, pmx_model, mesh_only):
+        logging.info('Removing doubles...')
+        pmx_vertices = pmx_model.vertices
+        vertex_count = len(pmx_vertices)
+        if vertex_count < 1:
+            logging.info('   - Done (no changes)!!')
+            return None
+        vertex_data = bulk.vertex_data(pmx_vertices)
+
+        # a vertex is merged to the first vertex with the same coordinates and morph offsets
+        co = _floatKeys(vertex_data.co)
+        # NaN is never equal to itself
+        nan_rows = np.isnan(vertex_data.co).any(axis=1)
+        signatures = [co, np.where(nan_rows, np.arange(vertex_count), -1).astype(np.uint64)[:, None]]
+        if not mesh_only:
+            signatures.append(_morphFingerprints(pmx_model.morphs, vertex_count))
+        signatures = np.ascontiguousarray(np.hstack(signatures))
+        firsts, inverse = np.unique(signatures, axis=0, return_index=True, return_inverse=True)[1:]
+        inverse = inverse.reshape(-1)
+        counts = vertex_count - len(firsts)
+        if counts:
+            logging.warning('   - %d vertices will be removed', counts)
+        else:
+            logging.info('   - Done (no changes)!!')
+            return None
+
+        # (pmx index, blender index), blender vertices are in the order of their first pmx vertex
+        blender_indices = np.empty(len(firsts), dtype=np.int64)
+        blender_indices[np.argsort(firsts)] = np.arange(len(firsts))
+        pmx_indices = firsts[inverse]
+        blender_indices = blender_indices[inverse]
+        vertex_map = list(zip(pmx_indices.tolist(), blender_indices.tolist()))
+
+        # clean face, a corner of a face is a merged vertex with its uv
+        faces = np.array(pmx_model.faces, dtype=np.int64).reshape(-1, 3)
+        uv_ids = np.unique(_floatKeys(vertex_data.uv), axis=0, return_inverse=True)[1].reshape(-1)
+        corners = np.unique(np.column_stack((pmx_indices, uv_ids)), axis=0, return_inverse=True)[1].reshape(-1)
+        keep = cls.__clean_pmx_faces(pmx_model.materials, corners[faces], pmx_indices[faces])
+        pmx_model.faces[:] = faces[keep].tolist()
+
+        if mesh_only:
+            logging.info('   - Done (mesh only)!!')
+        else:
+            # clean vertex/uv morphs
+            new_indices = np.where(pmx_indices == np.arange(vertex_count), blender_indices, -1)
+            cls.__remap_pmx_morphs(pmx_model.morphs, new_indices)
+            logging.info('   - Done!!')
+        return vertex_map
+
+
+    @staticmethod
+    def __clean_pmx_faces(pmx_materials, face_keys, face_vertices):
+        """ Return a mask of the faces to keep and update the vertex_count of pmx_materials.
+
+        A face is removed if face_vertices has a repeated vertex, or if a
+        previous face of the same material has the same set of face_keys.
+        Faces which do not belong to a material are removed too.
+        """
+        face_count = len(face_keys)
+        counts = np.array([int(mat.vertex_count/3) for mat in pmx_materials], dtype=np.int64)
+        ends = np.minimum(np.cumsum(counts), face_count)
+        counts = np.diff(np.r_[0, ends])
+        material_indices = np.repeat(np.arange(len(counts)), counts)
+        total = len(material_indices)
+
+        face_vertices = np.sort(face_vertices[:total], axis=1)
+        keep = np.zeros(face_count, dtype=bool)
+        keep[:total] = (face_vertices[:, 0] != face_vertices[:, 1]) & (face_vertices[:, 1] != face_vertices[:, 2])
+
+        candidates = np.flatnonzero(keep)
+        keys = np.sort(face_keys[candidates], axis=1)
+        materials = material_indices[candidates]
+        # stable, so the first face of equal ones comes first
+        order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0], materials))
+        keys, materials = keys[order], materials[order]
+        repeated = (materials[1:] == materials[:-1]) & (keys[1:] == keys[:-1]).all(axis=1)
+        keep[candidates[order[1:][repeated]]] = False
+
+        new_counts = np.bincount(material_indices[keep[:total]], minlength=len(counts))
+        for mat, count in zip(pmx_materials, new_counts.tolist()):
+            mat.vertex_count = count * 3
+
+        new_face_count = int(keep.sum())
+        if new_face_count == face_count:
+            logging.info('   (faces is clean)')
+        else:
+            logging.warning('   - removed %d faces', face_count-new_face_count)
+        return keep
+
+    @staticmethod
+    def __remap_pmx_morphs(pmx_morphs, new_indices):
+        """ Set the index of vertex/uv morph offsets to new_indices[index], removing the offsets of -1. """
+        for m in pmx_morphs:
+            if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
+                continue
+            old_len = len(m.offsets)
+            indices = np.array([x.index for x in m.offsets], dtype=np.int64)
+            valid = (indices >= 0) & (indices < len(new_indices))
+            indices = np.where(valid, new_indices[np.where(valid, indices, 0)], -1)
+            keep = np.flatnonzero(indices >= 0).tolist()
+            offsets = m.offsets
+            m.offsets = [offsets[i] for i in keep]
+            for x, index in zip(m.offsets, indices[keep].tolist()):
+                x.index = index
+            counts = old_len - len(m.offsets)
+            if counts:
+                logging.warning('   - removed %d (of %d) offsets of "%s"', counts, old_len, m.name)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import copy
+import hashlib
 import logging
 import shutil
 import time
@@ -8,9 +9,12 @@ import time
 import mathutils
 import bpy
 import bmesh
+import numpy as np
 
 from collections import OrderedDict
 from mmd_tools.core import pmx
+from mmd_tools.core import profiler
+from mmd_tools.core.pmx import bulk
 from mmd_tools.core.bone import FnBone
 from mmd_tools.core.material import FnMaterial
 from mmd_tools.core.vmd.importer import BoneConverter, BoneConverterPoseMode
@@ -19,9 +23,9 @@ from mmd_tools.utils import saferelpath
 
 
 class _Vertex:
-    def __init__(self, co, groups, offsets, old_index, edge_scale, vertex_order):
+    def __init__(self, co, weight_index, offsets, old_index, edge_scale, vertex_order):
         self.co = co
-        self.groups = groups # [(group_number, weight), ...]
+        self.weight_index = weight_index # the row of its bone weights in _Weights
         self.offsets = offsets
         self.old_index = old_index # used for exporting uv morphs
         self.edge_scale = edge_scale
@@ -38,18 +42,136 @@ class _Face:
         '''
         self.vertices = vertices
 
+class _Weights:
+    def __init__(self, weight_type, bones, weights):
+        ''' Bone weights of the vertices of a mesh, padded like bulk.VertexData
+        '''
+        self.weight_type = weight_type
+        self.bones = bones
+        self.weights = weights
+
 class _Mesh:
-    def __init__(self, mesh_data, material_faces, shape_key_names, vertex_group_names, materials):
-        self.mesh_data = mesh_data
+    def __init__(self, mesh_data, material_faces, shape_key_names, weights, materials, add_uv_count=0):
+        self.mesh_data = mesh_data # None for meshes restored from a _CachedMesh
         self.material_faces = material_faces # dict of {material_index => [face1, face2, ....]}
         self.shape_key_names = shape_key_names
-        self.vertex_group_names = vertex_group_names
+        self.weights = weights
         self.materials = materials
+        self.add_uv_count = add_uv_count
 
     def __del__(self):
+        if self.mesh_data is None:
+            return
         logging.debug('remove mesh data: %s', str(self.mesh_data))
         bpy.data.meshes.remove(self.mesh_data)
 
+class _CachedMesh:
+    """ A _Mesh stored as arrays, which do not refer to Blender data.
+
+    The exporter keeps them in a cache.MemoryCache between exports, keyed
+    by the fingerprint of the data the mesh was loaded from (see
+    __meshKey()), and creates a new _Mesh from the arrays on each hit.
+    """
+    VERSION = 1
+
+    def __init__(self, mesh, default_material=None):
+        rows = {}
+        vertices = []
+        def _row(v):
+            r = rows.get(id(v), None)
+            if r is None:
+                r = rows[id(v)] = len(vertices)
+                vertices.append(v)
+            return r
+        self.faces = OrderedDict()
+        for index, mat_faces in mesh.material_faces.items():
+            self.faces[index] = np.array([[_row(v) for v in f.vertices] for f in mat_faces], dtype=np.int32).reshape(-1, 3)
+
+        count = len(vertices)
+        self.co = np.array([tuple(v.co) for v in vertices], dtype=np.float64).reshape(count, 3)
+        self.normal = np.array([tuple(v.normal) for v in vertices], dtype=np.float64).reshape(count, 3)
+        self.uv = np.array([tuple(v.uv) for v in vertices], dtype=np.float64).reshape(count, 2)
+        self.weight_index = np.array([v.weight_index for v in vertices], dtype=np.int32)
+        self.edge_scale = np.array([v.edge_scale for v in vertices], dtype=np.float64)
+
+        # vertex_order is (mesh_id, weight, index), (mesh_id, index) or None
+        orders = [v.vertex_order for v in vertices]
+        self.sort_vertices = count > 0 and orders[0] is not None
+        self.order_weights = None
+        if self.sort_vertices and len(orders[0]) == 3:
+            self.order_weights = np.array([o[1] for o in orders], dtype=np.float64)
+
+        self.add_uvs = np.zeros((count, 4, 4), dtype=np.float64)
+        self.add_uv_mask = np.zeros((count, 4), dtype=bool)
+        self.sdef_data = np.zeros((count, 3, 3), dtype=np.float64)
+        self.sdef_mask = np.zeros(count, dtype=bool)
+        self.shape_key_names = list(mesh.shape_key_names)
+        offset_keys = {k:i for i, k in enumerate(self.shape_key_names)}
+        offset_rows = []
+        offset_names = []
+        offset_values = []
+        for r, v in enumerate(vertices):
+            for i, uvzw in enumerate(v.add_uvs):
+                if uvzw:
+                    self.add_uvs[r, i] = tuple(uvzw[0]) + tuple(uvzw[1])
+                    self.add_uv_mask[r, i] = True
+            if v.sdef_data:
+                self.sdef_data[r] = [tuple(x) for x in v.sdef_data]
+                self.sdef_mask[r] = True
+            for name, offset in v.offsets.items():
+                offset_rows.append(r)
+                offset_names.append(offset_keys[name])
+                offset_values.append(tuple(offset))
+        self.offset_rows = np.array(offset_rows, dtype=np.int32)
+        self.offset_names = np.array(offset_names, dtype=np.int32)
+        self.offset_values = np.array(offset_values, dtype=np.float64).reshape(-1, 3)
+
+        self.weights = mesh.weights
+        self.vertex_count = len(mesh.weights.weight_type)
+        self.material_names = [None if m is None or m == default_material else m.name for m in mesh.materials]
+        self.add_uv_count = mesh.add_uv_count
+
+    def size(self):
+        """ Return the memory of the arrays in bytes. """
+        arrays = list(self.faces.values()) + [self.weights.weight_type, self.weights.bones, self.weights.weights]
+        arrays += [v for v in self.__dict__.values() if isinstance(v, np.ndarray)]
+        return sum(a.nbytes for a in arrays)
+
+    def mesh(self, materials, mesh_id=None, has_uv_morphs=False):
+        """ Return a new _Mesh of the arrays.
+
+        materials are the materials of the material_names, mesh_id is the
+        number of the mesh for sorting vertices and has_uv_morphs tells if
+        the vertices keep their old indices for uv morphs.
+        """
+        weight_index = self.weight_index.tolist()
+        vertex_orders = [None] * len(weight_index)
+        if self.sort_vertices:
+            if self.order_weights is not None:
+                vertex_orders = [(mesh_id, w, i) for w, i in zip(self.order_weights.tolist(), weight_index)]
+            else:
+                vertex_orders = [(mesh_id, i) for i in weight_index]
+
+        vertices = []
+        for i, co, edge_scale, vertex_order in zip(weight_index, self.co.tolist(), self.edge_scale.tolist(), vertex_orders):
+            vertices.append(_Vertex(co, i, {}, i if has_uv_morphs else None, edge_scale, vertex_order))
+        for v, uv, normal in zip(vertices, self.uv.tolist(), self.normal.tolist()):
+            v.uv = mathutils.Vector(uv)
+            v.normal = mathutils.Vector(normal)
+        for r, i in zip(*[a.tolist() for a in np.nonzero(self.add_uv_mask)]):
+            uvzw = self.add_uvs[r, i].tolist()
+            vertices[r].add_uvs[i] = (mathutils.Vector(uvzw[:2]), mathutils.Vector(uvzw[2:]))
+        for r in np.flatnonzero(self.sdef_mask).tolist():
+            vertices[r].sdef_data = [tuple(x) for x in self.sdef_data[r].tolist()]
+        names = self.shape_key_names
+        for r, k, offset in zip(self.offset_rows.tolist(), self.offset_names.tolist(), self.offset_values.tolist()):
+            vertices[r].offsets[names[k]] = mathutils.Vector(offset)
+
+        material_faces = {}
+        for index, faces in self.faces.items():
+            material_faces[index] = [_Face([vertices[i] for i in f]) for f in faces.tolist()]
+        return _Mesh(None, material_faces, list(names), self.weights, materials, self.add_uv_count)
+
 class _DefaultMaterial:
     def __init__(self):
         mat = bpy.data.materials.new('')
@@ -65,6 +187,127 @@ class _DefaultMaterial:
             bpy.data.materials.remove(self.material)
 
 
+def _bone_weights(vertices, groups, weights, vertex_count, group_bones):
+    """ Convert the vertex group weights of a mesh to pmx bone weights.
+
+    vertices, groups and weights are arrays of the vertex, the vertex group
+    and the weight of every item of vertex.groups, ordered by vertex.
+    group_bones maps vertex groups to bone indices, or -1 for groups which
+    are not bones. By the number of its nonzero bone weights, a vertex gets
+    BDEF1 of bone 0 (none), BDEF1 (one), BDEF2 (two) or BDEF4 of its 4
+    largest weights, kept in their order and normalized.
+
+    Returns a _Weights of vertex_count vertices.
+    """
+    bones = group_bones[groups]
+    keep = np.flatnonzero((weights > 0) & (bones >= 0))
+    vertices = vertices[keep]
+    bones = bones[keep]
+    weights = weights[keep].astype(np.float64)
+
+    # select the 4 largest weights of each vertex, equal ones by their order
+    counts = np.bincount(vertices, minlength=vertex_count)
+    starts = np.cumsum(counts) - counts
+    order = np.lexsort((np.arange(len(vertices)), -weights, vertices))
+    selected = np.sort(order[np.arange(len(order)) - starts[vertices[order]] < 4])
+    vertices = vertices[selected]
+    counts = np.minimum(counts, 4)
+    slots = np.arange(len(vertices)) - (np.cumsum(counts) - counts)[vertices]
+
+    r = _Weights(np.full(vertex_count, pmx.BoneWeight.BDEF4, dtype=np.uint8),
+                 np.full((vertex_count, 4), -1, dtype=np.int32),
+                 np.zeros((vertex_count, 4), dtype=np.float64))
+    r.bones[vertices, slots] = bones[selected]
+    r.weights[vertices, slots] = weights[selected]
+
+    bdef1 = counts < 2
+    r.weight_type[bdef1] = pmx.BoneWeight.BDEF1
+    r.bones[counts == 0, 0] = 0
+    r.weights[bdef1, 0] = 1.0
+
+    bdef2 = np.flatnonzero(counts == 2)
+    r.weight_type[bdef2] = pmx.BoneWeight.BDEF2
+    w = r.weights[bdef2, 0] / r.weights[bdef2, :2].sum(axis=1)
+    r.weights[bdef2, 0] = w
+    r.weights[bdef2, 1] = 1.0 - w
+
+    bdef4 = np.flatnonzero(counts > 2)
+    r.bones[bdef4[counts[bdef4] == 3], 3] = 0
+    r.weights[bdef4] /= r.weights[bdef4].sum(axis=1, keepdims=True)
+    return r
+
+
+def _split_corners(groups, values, tolerances):
+    """ Split groups of face corners by their values (uvs, normals, ...).
+
+    groups is an array of a group number (>= 0) for each corner, in the
+    order of the corners. Like a scan over the corners, a corner joins the
+    first split of its group whose first corner has all values within the
+    tolerances, or starts a new split. Corners with equal values are merged
+    with np.unique, so the tolerances are only tested between the distinct
+    values of a group.
+
+    Returns the split of each corner, numbered by first use, and the first
+    corner of each split.
+    """
+    if len(groups) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    values = [np.ascontiguousarray(v, dtype=np.float32).reshape(len(groups), -1) for v in values]
+    keys = np.column_stack([groups.astype(np.int32)] + [v.view(np.int32) for v in values])
+    first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)[1:]
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    first = first[order]
+    key_splits = np.arange(len(first))
+
+    key_groups = groups[first]
+    shared = np.flatnonzero(np.bincount(key_groups)[key_groups] > 1)
+    if len(shared) > 0:
+        key_values = list(zip(*[v[first[shared]].tolist() for v in values]))
+        splits = {}
+        for k, g, vals in zip(shared.tolist(), key_groups[shared].tolist(), key_values):
+            candidates = splits.setdefault(g, [])
+            for split, split_vals in candidates:
+                if all(sum((a - b)**2 for a, b in zip(x, y)) < tol*tol for x, y, tol in zip(vals, split_vals, tolerances)):
+                    key_splits[k] = split
+                    break
+            else:
+                candidates.append((k, vals))
+    key_splits, corner_splits = np.unique(key_splits, return_inverse=True)
+    return corner_splits.ravel()[rank[inverse.ravel()]], first[key_splits]
+
+
+def _hash_items(h, collection, attr, size, dtype=np.float32):
+    """ Add the values of attr of the items of a bpy collection to the hash h. """
+    values = np.empty(size, dtype=dtype)
+    if size > 0:
+        collection.foreach_get(attr, values)
+    h.update(values.tobytes())
+
+
+def _rna_values(struct):
+    """ Return the values of the properties of a bpy struct (e.g. the settings
+    of a modifier) and the objects it refers to.
+    """
+    values = []
+    objects = []
+    for p in struct.bl_rna.properties:
+        if p.identifier == 'rna_type' or p.type == 'COLLECTION':
+            continue
+        value = getattr(struct, p.identifier, None)
+        if p.type == 'POINTER':
+            if isinstance(value, bpy.types.Object):
+                objects.append(value)
+            value = getattr(value, 'name', None)
+        elif isinstance(value, set):
+            value = sorted(value)
+        elif p.type in {'BOOLEAN', 'INT', 'FLOAT'} and getattr(p, 'array_length', 0) > 0:
+            value = [tuple(x) if hasattr(x, '__len__') else x for x in value]
+        values.append((p.identifier, value))
+    return values, objects
+
+
 class __PmxExporter:
     TO_PMX_MATRIX = mathutils.Matrix([
         [1.0, 0.0, 0.0, 0.0],
@@ -77,9 +320,12 @@ class __PmxExporter:
         'EYE': pmx.Morph.CATEGORY_EYE,
         'MOUTH': pmx.Morph.CATEGORY_MOUTH,
         }
+    # the memory of shape key coordinates read at once by __shapeKeyCoords()
+    SHAPE_KEY_BATCH_BYTES = 64 * 1024 * 1024
 
     def __init__(self):
         self.__model = None
+        self.__mesh_cache = None # cache.MemoryCache of _CachedMesh, for incremental exports
         self.__bone_name_table = []
         self.__material_name_table = []
         self.__vertex_index_map = {} # used for exporting uv morphs
@@ -88,11 +334,6 @@ class __PmxExporter:
         self.__disable_specular = False
         self.__add_uv_count = 0
 
-    @staticmethod
-    def flipUV_V(uv):
-        u, v = uv
-        return [u, 1.0-v]
-
     def __getDefaultMaterial(self):
         if self.__default_material is None:
             self.__default_material = _DefaultMaterial()
@@ -102,8 +343,7 @@ class __PmxExporter:
         logging.info(' - Sorting vertices ...')
         weight_items = self.__vertex_order_map.items()
         sorted_indices = [i[0] for i in sorted(weight_items, key=lambda x: x[1].vertex_order)]
-        vertices = self.__model.vertices
-        self.__model.vertices = [vertices[i] for i in sorted_indices]
+        self.__model.vertices.keep(sorted_indices)
 
         # update indices
         index_map = {x:i for i, x in enumerate(sorted_indices)}
@@ -115,23 +355,67 @@ class __PmxExporter:
             f[:] = [index_map[i] for i in f]
         logging.debug('   - Done (count:%d)', len(self.__vertex_order_map))
 
-    def __exportMeshes(self, meshes, bone_map):
+    def __vertexData(self, vertices, vertex_weights):
+        """ Return the pmx vertices of a list of _Vertex as bulk.VertexData.
+
+        vertex_weights is the list of the _Weights of the mesh of each vertex.
+        """
+        num_add_uvs = min(self.__add_uv_count, 4)
+        data = bulk.VertexData(len(vertices), num_add_uvs)
+        if len(vertices) == 0:
+            return data
+        data.co[:] = [v.co for v in vertices]
+        data.normal[:] = [v.normal for v in vertices]
+        uvs = np.array([v.uv for v in vertices], dtype=np.float64)
+        uvs[:, 1] = 1.0 - uvs[:, 1]
+        data.uv[:] = uvs
+        data.edge_scale[:] = [v.edge_scale for v in vertices]
+        for i in range(num_add_uvs):
+            rows = [k for k, v in enumerate(vertices) if v.add_uvs[i]]
+            if rows:
+                uvzw = np.array([tuple(vertices[k].add_uvs[i][0]) + tuple(vertices[k].add_uvs[i][1]) for k in rows], dtype=np.float64)
+                uvzw[:, 1::2] = 1.0 - uvzw[:, 1::2]
+                data.additional_uvs[rows, i] = uvzw
+
+        mesh_weights = OrderedDict((id(w), w) for w in vertex_weights)
+        mesh_ids = {k:i for i, k in enumerate(mesh_weights.keys())}
+        mesh_index = np.array([mesh_ids[id(w)] for w in vertex_weights], dtype=np.int64)
+        weight_index = np.array([v.weight_index for v in vertices], dtype=np.int64)
+        for i, weights in enumerate(mesh_weights.values()):
+            mask = mesh_index == i
+            rows = weight_index[mask]
+            data.weight_type[mask] = weights.weight_type[rows]
+            data.bones[mask] = weights.bones[rows]
+            data.weights[mask] = weights.weights[rows]
+
+        sdef_rows = [k for k, v in enumerate(vertices) if v.sdef_data]
+        if sdef_rows:
+            sdef_data = np.array([[tuple(x) for x in vertices[k].sdef_data] for k in sdef_rows], dtype=np.float64)
+            data.weight_type[sdef_rows] = pmx.BoneWeight.SDEF
+            data.sdef_c[sdef_rows] = sdef_data[:, 0]
+            data.sdef_r0[sdef_rows] = sdef_data[:, 1]
+            data.sdef_r1[sdef_rows] = sdef_data[:, 2]
+        return data
+
+    def __exportMeshes(self, meshes):
         mat_map = OrderedDict()
         for mesh in meshes:
             for index, mat_faces in sorted(mesh.material_faces.items(), key=lambda x: x[0]):
                 name = mesh.materials[index].name
                 if name not in mat_map:
                     mat_map[name] = []
-                mat_map[name].append((mat_faces, mesh.vertex_group_names))
+                mat_map[name].append((mat_faces, mesh.weights))
 
         sort_vertices = self.__vertex_order_map is not None
         if sort_vertices:
             self.__vertex_order_map.clear()
 
         # export vertices
+        vertices = []
+        vertex_weights = []
         for mat_name, mat_meshes in mat_map.items():
             face_count = 0
-            for mat_faces, vertex_group_names in mat_meshes:
+            for mat_faces, weights in mat_meshes:
                 mesh_vertices = []
                 for face in mat_faces:
                     mesh_vertices.extend(face.vertices)
@@ -140,71 +424,19 @@ class __PmxExporter:
                     if v.index is not None:
                         continue
 
-                    v.index = len(self.__model.vertices)
+                    v.index = len(vertices)
                     if v.old_index is not None:
                         self.__vertex_index_map[v.old_index].append(v.index)
                     if sort_vertices:
                         self.__vertex_order_map[v.index] = v
-
-                    pv = pmx.Vertex()
-                    pv.co = list(v.co)
-                    pv.normal = v.normal
-                    pv.uv = self.flipUV_V(v.uv)
-                    pv.edge_scale = v.edge_scale
-                    for _uvzw in v.add_uvs:
-                        if _uvzw:
-                            pv.additional_uvs.append(self.flipUV_V(_uvzw[0])+self.flipUV_V(_uvzw[1]))
-
-                    t = len(v.groups)
-                    if t == 0:
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF1
-                        weight.bones = [0]
-                        pv.weight = weight
-                    elif t == 1:
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF1
-                        weight.bones = [bone_map[vertex_group_names[v.groups[0][0]]]]
-                        pv.weight = weight
-                    elif t == 2:
-                        vg1, vg2 = v.groups
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF2
-                        weight.bones = [
-                            bone_map[vertex_group_names[vg1[0]]],
-                            bone_map[vertex_group_names[vg2[0]]]
-                            ]
-                        w1, w2 = vg1[1], vg2[1]
-                        weight.weights = [w1/(w1+w2)]
-                        if v.sdef_data:
-                            weight.type = pmx.BoneWeight.SDEF
-                            sdef_weights = pmx.BoneWeightSDEF()
-                            sdef_weights.weight = weight.weights[0]
-                            sdef_weights.c = v.sdef_data[0]
-                            sdef_weights.r0 = v.sdef_data[1]
-                            sdef_weights.r1 = v.sdef_data[2]
-                            weight.weights = sdef_weights
-                        pv.weight = weight
-                    else:
-                        weight = pmx.BoneWeight()
-                        weight.type = pmx.BoneWeight.BDEF4
-                        weight.bones = [0, 0, 0, 0]
-                        weight.weights = [0.0, 0.0, 0.0, 0.0]
-                        w_all = 0.0
-                        for i in range(min(len(v.groups), 4)):
-                            gn, w = v.groups[i]
-                            weight.bones[i] = bone_map[vertex_group_names[gn]]
-                            weight.weights[i] = w
-                            w_all += w
-                        for i in range(4):
-                            weight.weights[i] /= w_all
-                        pv.weight = weight
-                    self.__model.vertices.append(pv)
+                    vertices.append(v)
+                    vertex_weights.append(weights)
 
                 for face in mat_faces:
                     self.__model.faces.append([x.index for x in face.vertices])
                 face_count += len(mat_faces)
             self.__exportMaterial(bpy.data.materials[mat_name], face_count)
+        self.__model.vertices = bulk.VertexList(self.__vertexData(vertices, vertex_weights))
 
         if sort_vertices:
             self.__sortVertices()
@@ -649,23 +881,17 @@ class __PmxExporter:
          モデル中心座標から離れている位置で使用されているマテリアルほどリストの後ろ側にくるように。
          かなりいいかげんな実装
         """
-        center = mathutils.Vector([0, 0, 0])
-        vertices = self.__model.vertices
-        vert_num = len(vertices)
-        for v in self.__model.vertices:
-            center += mathutils.Vector(v.co) / vert_num
+        co = bulk.vertex_data(self.__model.vertices).co.astype(np.float64)
+        center = co.mean(axis=0) if len(co) else np.zeros(3)
+        vertex_distances = np.linalg.norm(co - center, axis=1)
 
         faces = self.__model.faces
+        face_distances = vertex_distances[np.array(faces, dtype=np.int64).reshape(-1, 3)].sum(axis=1)
         offset = 0
         distances = []
         for mat, bl_mat_name in zip(self.__model.materials, self.__material_name_table):
-            d = 0
             face_num = int(mat.vertex_count / 3)
-            for i in range(offset, offset + face_num):
-                face = faces[i]
-                d += (mathutils.Vector(vertices[face[0]].co) - center).length
-                d += (mathutils.Vector(vertices[face[1]].co) - center).length
-                d += (mathutils.Vector(vertices[face[2]].co) - center).length
+            d = float(face_distances[offset:offset+face_num].sum())
             distances.append((d/mat.vertex_count, mat, offset, face_num, bl_mat_name))
             offset += face_num
         sorted_faces = []
@@ -887,102 +1113,158 @@ class __PmxExporter:
 
 
     @staticmethod
-    def __convertFaceUVToVertexUV(vert_index, uv, normal, vertices_map):
-        vertices = vertices_map[vert_index]
-        for i in vertices:
-            if i.uv is None:
-                i.uv = uv
-                i.normal = normal
-                return i
-            elif (i.uv - uv).length < 0.001 and (normal - i.normal).length < 0.01:
-                return i
-        n = copy.copy(i) # shallow copy should be fine
-        n.uv = uv
-        n.normal = normal
-        vertices.append(n)
-        return n
+    def __cornerUVs(uv_data, num_faces):
+        """ Return the uvs of the corners of triangular tessfaces as an array of shape (num_faces*3, 2). """
+        uvs = np.empty((num_faces, 4, 2), dtype=np.float32)
+        if uv_data is None:
+            uvs[:] = (0, 1)
+        else:
+            uv_data.foreach_get('uv_raw', uvs.ravel())
+        return uvs[:, :3].reshape(-1, 2)
 
     @staticmethod
-    def __convertAddUV(vert, adduv, addzw, uv_index, vertices, rip_vertices):
-        if vert.add_uvs[uv_index] is None:
-            vert.add_uvs[uv_index] = (adduv, addzw)
-            return vert
-        for i in rip_vertices:
-            uvzw = i.add_uvs[uv_index]
-            if (uvzw[0] - adduv).length < 0.001 and (uvzw[1] - addzw).length < 0.001:
-                return i
-        n = copy.copy(vert)
-        add_uvs = n.add_uvs.copy()
-        add_uvs[uv_index] = (adduv, addzw)
-        n.add_uvs = add_uvs
-        vertices.append(n)
-        rip_vertices.append(n)
-        return n
+    def __polygonLoops(mesh):
+        """ Return (polygon index, loop index) of the corners of all polygons, in polygon order. """
+        num_polygons = len(mesh.polygons)
+        loop_starts = np.empty(num_polygons, dtype=np.int64)
+        loop_totals = np.empty(num_polygons, dtype=np.int64)
+        mesh.polygons.foreach_get('loop_start', loop_starts)
+        mesh.polygons.foreach_get('loop_total', loop_totals)
+        polygons = np.repeat(np.arange(num_polygons), loop_totals)
+        offsets = np.cumsum(loop_totals) - loop_totals
+        loops = loop_starts[polygons] + np.arange(len(polygons)) - offsets[polygons]
+        return polygons, loops
 
     @staticmethod
-    def __triangulate(mesh, custom_normals):
+    def __loopVertices(mesh):
+        vertices = np.empty(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get('vertex_index', vertices)
+        return vertices
+
+    @classmethod
+    def __triangulate(cls, mesh, custom_normals):
+        """ Triangulate mesh and return custom_normals (of the corners in polygon order) for its new loops. """
+        polygons, loops = cls.__polygonLoops(mesh)
+        if (np.bincount(polygons, minlength=len(mesh.polygons)) == 3).all():
+            assert(len(custom_normals) == len(mesh.loops))
+            return custom_normals
+
+        # the corner of each (polygon, vertex) before triangulating
+        num_vertices = len(mesh.vertices)
+        corner_keys = polygons * num_vertices + cls.__loopVertices(mesh)[loops]
+        corner_order = np.argsort(corner_keys, kind='stable')
+        corner_keys = corner_keys[corner_order]
+
         bm = bmesh.new()
         bm.from_mesh(mesh)
-
-        is_triangulated = True
-        face_verts_to_loop_id_map = {}
-
-        loop_id = 0
-        for f in bm.faces:
-            vert_to_loop_id = face_verts_to_loop_id_map.setdefault(f, {})
-            if is_triangulated and len(f.verts) != 3:
-                is_triangulated = False
-            for v in f.verts:
-                vert_to_loop_id[v] = loop_id
-                loop_id += 1
-
-        loop_normals = None
-        if is_triangulated:
-            loop_normals = custom_normals
-        else:
-            face_map = bmesh.ops.triangulate(bm, faces=bm.faces, quad_method=1, ngon_method=1)['face_map']
-            logging.debug(' - Remapping custom normals...')
-            loop_normals = []
-            for f in bm.faces:
-                vert_to_loop_id = face_verts_to_loop_id_map[face_map.get(f, f)]
-                for v in f.verts:
-                    loop_normals.append(custom_normals[vert_to_loop_id[v]])
-            logging.debug('   - Done (faces:%d)', len(bm.faces))
-            bm.to_mesh(mesh)
-            face_map.clear()
-        face_verts_to_loop_id_map.clear()
+        bm.faces.index_update()
+        face_map = bmesh.ops.triangulate(bm, faces=bm.faces, quad_method=1, ngon_method=1)['face_map']
+        logging.debug(' - Remapping custom normals...')
+        source_polygons = np.array([face_map.get(f, f).index for f in bm.faces], dtype=np.int64)
+        logging.debug('   - Done (faces:%d)', len(bm.faces))
+        bm.to_mesh(mesh)
+        face_map.clear()
         bm.free()
 
+        polygons, loops = cls.__polygonLoops(mesh)
+        keys = source_polygons[polygons] * num_vertices + cls.__loopVertices(mesh)[loops]
+        corners = corner_order[np.searchsorted(corner_keys, keys)]
+        loop_normals = custom_normals[corners]
         assert(len(loop_normals) == len(mesh.loops))
         return loop_normals
 
-    @staticmethod
-    def __get_normals(mesh, matrix):
-        custom_normals = None
+    @classmethod
+    def __get_normals(cls, mesh, matrix):
+        """ Return the normals of the corners of the polygons of mesh, transformed by matrix, as an array. """
+        normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
         if hasattr(mesh, 'has_custom_normals'):
             logging.debug(' - Calculating normals split...')
             mesh.calc_normals_split()
-            custom_normals = [(matrix * l.normal).normalized() for l in mesh.loops]
+            mesh.loops.foreach_get('normal', normals)
             mesh.free_normals_split()
         elif mesh.use_auto_smooth:
             logging.debug(' - Calculating normals split (angle:%f)...', mesh.auto_smooth_angle)
             mesh.calc_normals_split(mesh.auto_smooth_angle)
-            custom_normals = [(matrix * l.normal).normalized() for l in mesh.loops]
+            mesh.loops.foreach_get('normal', normals)
             mesh.free_normals_split()
         else:
             logging.debug(' - Calculating normals...')
             mesh.calc_normals()
-            #custom_normals = [(matrix * mesh.vertices[l.vertex_index].normal).normalized() for l in mesh.loops]
-            custom_normals = []
-            for f in mesh.polygons:
-                if f.use_smooth:
-                    for v in f.vertices:
-                        custom_normals.append((matrix * mesh.vertices[v].normal).normalized())
-                else:
-                    for v in f.vertices:
-                        custom_normals.append((matrix * f.normal).normalized())
+            vertex_normals = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('normal', vertex_normals)
+            polygon_normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+            mesh.polygons.foreach_get('normal', polygon_normals)
+            use_smooth = np.empty(len(mesh.polygons), dtype=bool)
+            mesh.polygons.foreach_get('use_smooth', use_smooth)
+            polygons, loops = cls.__polygonLoops(mesh)
+            vertices = cls.__loopVertices(mesh)[loops]
+            normals = np.where(use_smooth[polygons, None],
+                               vertex_normals.reshape(-1, 3)[vertices],
+                               polygon_normals.reshape(-1, 3)[polygons])
+        normals = np.dot(normals.reshape(-1, 3), np.array([list(row) for row in matrix], dtype=np.float64).T)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
         logging.debug('   - Done (polygons:%d)', len(mesh.polygons))
-        return custom_normals
+        return normals.astype(np.float32)
+
+    @staticmethod
+    def __meshCoords(mesh):
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        return co.reshape(-1, 3).astype(np.float64)
+
+    @staticmethod
+    def __modifiesShapeKeys(meshObj):
+        """ Return True if a modifier of meshObj may change the coordinates of its shape keys.
+
+        Armature modifiers of armatures in rest position are disabled by
+        __loadMeshData(), so models which are not built have none.
+        """
+        for m in meshObj.modifiers:
+            if not m.show_viewport:
+                continue
+            if m.type == 'ARMATURE' and m.object is None:
+                continue
+            return True
+        return False
+
+    def __shapeKeyCoords(self, meshObj, shape_key_list, pmx_matrix, vertex_count):
+        """ Yield (index, key block, coordinates in pmx space) for shape_key_list.
+
+        The coordinates are None if the shape key has another vertex count.
+        Without modifiers changing the shape keys, their data is read with
+        foreach_get in batches of keys and transformed with one multiply per
+        batch. Otherwise each shape key is evaluated by to_mesh().
+        """
+        matrix = np.array([list(row) for row in pmx_matrix], dtype=np.float64)
+        use_to_mesh = self.__modifiesShapeKeys(meshObj)
+        if use_to_mesh:
+            logging.debug(' - Evaluating shape keys with modifiers')
+        batch_size = max(1, self.SHAPE_KEY_BATCH_BYTES // max(1, vertex_count * 12))
+        for start in range(0, len(shape_key_list), batch_size):
+            batch = shape_key_list[start:start+batch_size]
+            # key blocks with a vertex group are blended by Blender and muted ones are not
+            # applied at all, so they are evaluated too
+            direct = [n for n, (i, kb) in enumerate(batch)
+                      if not use_to_mesh and not kb.mute and not kb.vertex_group and len(kb.data) == vertex_count]
+            coords = np.empty((len(direct), vertex_count * 3), dtype=np.float32)
+            for row, n in enumerate(direct):
+                batch[n][1].data.foreach_get('co', coords[row])
+            coords = coords.reshape(len(direct), vertex_count, 3).astype(np.float64)
+            coords = np.dot(coords, matrix[:3, :3].T) + matrix[:3, 3]
+            rows = dict(zip(direct, range(len(direct))))
+            for n, (i, kb) in enumerate(batch):
+                if n in rows:
+                    yield i, kb, coords[rows[n]]
+                    continue
+                meshObj.active_shape_key_index = i
+                mesh = meshObj.to_mesh(bpy.context.scene, True, 'PREVIEW', False)
+                try:
+                    mesh.transform(pmx_matrix)
+                    co = self.__meshCoords(mesh) if len(mesh.vertices) == vertex_count else None
+                finally:
+                    bpy.data.meshes.remove(mesh)
+                yield i, kb, co
 
     def __doLoadMeshData(self, meshObj, bone_map):
         vertex_group_names = {i:x.name for i, x in enumerate(meshObj.vertex_groups) if x.name in bone_map}
@@ -1008,38 +1290,51 @@ class __PmxExporter:
             self.__vertex_index_map = dict([(v.index, []) for v in base_mesh.vertices])
 
 
-        def _get_weight(vertex_group, vertex, default_weight):
-            for i in vertex.groups:
-                if i.group == vertex_group.index:
-                    return vertex_group.weight(vertex.index)
-            return default_weight
-
-        get_edge_scale = None
-        if vg_edge_scale:
-            get_edge_scale = lambda x: _get_weight(vg_edge_scale, x, 1)
-        else:
-            get_edge_scale = lambda x: 1
-
-        get_vertex_order = None
+        # read the weights of all vertex groups in one pass
+        vertex_count = len(base_mesh.vertices)
+        deform_vertices = []
+        deform_groups = []
+        deform_weights = []
+        for v in base_mesh.vertices:
+            for x in v.groups:
+                deform_vertices.append(v.index)
+                deform_groups.append(x.group)
+                deform_weights.append(x.weight)
+        deform_vertices = np.array(deform_vertices, dtype=np.int64)
+        deform_groups = np.array(deform_groups, dtype=np.int64)
+        deform_weights = np.array(deform_weights, dtype=np.float64)
+
+        def _group_weights(vertex_group, default_weight):
+            r = np.full(vertex_count, default_weight, dtype=np.float64)
+            if vertex_group:
+                mask = deform_groups == vertex_group.index
+                r[deform_vertices[mask]] = deform_weights[mask]
+            return r
+
+        group_bones = np.full(len(meshObj.vertex_groups), -1, dtype=np.int64)
+        for i, name in vertex_group_names.items():
+            group_bones[i] = bone_map[name]
+        weights = _bone_weights(deform_vertices, deform_groups, deform_weights, vertex_count, group_bones)
+
+        edge_scales = _group_weights(vg_edge_scale, 1).tolist()
+        vertex_orders = [None] * vertex_count
         if sort_vertices:
             mesh_id = self.__vertex_order_map.setdefault('mesh_id', 0)
             self.__vertex_order_map['mesh_id'] += 1
             if vg_vertex_order and self.__vertex_order_map['method'] == 'CUSTOM':
-                get_vertex_order = lambda x: (mesh_id, _get_weight(vg_vertex_order, x, 2), x.index)
+                vertex_orders = [(mesh_id, w, i) for i, w in enumerate(_group_weights(vg_vertex_order, 2).tolist())]
             else:
-                get_vertex_order = lambda x: (mesh_id, x.index)
-        else:
-            get_vertex_order = lambda x: None
+                vertex_orders = [(mesh_id, i) for i in range(vertex_count)]
 
         base_vertices = {}
-        for v in base_mesh.vertices:
+        for v, edge_scale, vertex_order in zip(base_mesh.vertices, edge_scales, vertex_orders):
             base_vertices[v.index] = [_Vertex(
                 v.co,
-                [(x.group, x.weight) for x in v.groups if x.weight > 0 and x.group in vertex_group_names],
+                v.index,
                 {},
                 v.index if has_uv_morphs else None,
-                get_edge_scale(v),
-                get_vertex_order(v),
+                edge_scale,
+                vertex_order,
                 )]
 
         # calculate offsets
@@ -1055,71 +1350,77 @@ class __PmxExporter:
 
         shape_key_names = []
         sdef_counts = 0
-        for i, kb in shape_key_list:
+        sdef_indices = []
+        base_co = self.__meshCoords(base_mesh)
+        for i, kb, co in self.__shapeKeyCoords(meshObj, shape_key_list, pmx_matrix, len(base_co)):
             shape_key_name = kb.name
             logging.info(' - processing shape key: %s', shape_key_name)
-            meshObj.active_shape_key_index = i
-            mesh = meshObj.to_mesh(bpy.context.scene, True, 'PREVIEW', False)
-            mesh.transform(pmx_matrix)
-            if len(mesh.vertices) != len(base_mesh.vertices):
+            if co is None:
                 logging.warning('   * Error! vertex count mismatch!')
                 continue
             if shape_key_name in {'mmd_sdef_c', 'mmd_sdef_r0', 'mmd_sdef_r1'}:
                 if shape_key_name == 'mmd_sdef_c':
-                    for v in mesh.vertices:
-                        base = base_vertices[v.index][0]
-                        if len(base.groups) != 2:
+                    indices = np.flatnonzero(np.linalg.norm(co - base_co, axis=1) >= 0.001)
+                    for index, c_co in zip(indices.tolist(), co[indices].tolist()):
+                        base = base_vertices[index][0]
+                        if weights.weight_type[index] != pmx.BoneWeight.BDEF2:
                             continue
-                        base_co = base.co
-                        c_co = v.co
-                        if (c_co - base_co).length < 0.001:
-                            continue
-                        base.sdef_data = [tuple(c_co), base_co, base_co]
-                        sdef_counts += 1
+                        base.sdef_data = [tuple(c_co), base.co, base.co]
+                        sdef_indices.append(index)
+                    sdef_counts = len(sdef_indices)
                     logging.info('   - Restored %d SDEF vertices', sdef_counts)
                 elif sdef_counts > 0:
                     ri = 1 if shape_key_name == 'mmd_sdef_r0' else 2
-                    for v in mesh.vertices:
-                        sdef_data = base_vertices[v.index][0].sdef_data
-                        if sdef_data:
-                            sdef_data[ri] = tuple(v.co)
+                    for index, r_co in zip(sdef_indices, co[sdef_indices].tolist()):
+                        base_vertices[index][0].sdef_data[ri] = tuple(r_co)
                     logging.info('   - Updated SDEF data')
             else:
                 shape_key_names.append(shape_key_name)
-                for v in mesh.vertices:
-                    base = base_vertices[v.index][0]
-                    offset = v.co - base.co
-                    if offset.length < 0.001:
-                        continue
-                    base.offsets[shape_key_name] = offset
-            bpy.data.meshes.remove(mesh)
+                offsets = co - base_co
+                indices = np.flatnonzero(np.linalg.norm(offsets, axis=1) >= 0.001)
+                for index, offset in zip(indices.tolist(), offsets[indices].tolist()):
+                    base_vertices[index][0].offsets[shape_key_name] = mathutils.Vector(offset)
 
         # load face data
-        class _DummyUV:
-            uv1 = uv2 = uv3 = mathutils.Vector((0, 1))
+        tessfaces = base_mesh.tessfaces
+        num_faces = len(tessfaces)
+        face_vertices = np.empty((num_faces, 4), dtype=np.int32)
+        tessfaces.foreach_get('vertices_raw', face_vertices.ravel())
+        if (face_vertices[:, 3] != 0).any(): # the 4th vertex of triangles is 0
+            raise Exception
+        material_indices = np.empty(num_faces, dtype=np.int32)
+        tessfaces.foreach_get('material_index', material_indices)
+
+        # split vertices by the uvs and normals of the face corners
+        uv_data = base_mesh.tessface_uv_textures.active
+        uvs = self.__cornerUVs(uv_data.data if uv_data else None, num_faces)
+        corner_vertices = face_vertices[:, :3].ravel().astype(np.int64)
+        splits, first = _split_corners(corner_vertices, [uvs, loop_normals], [0.001, 0.01])
+
+        split_vertices = []
+        for index, uv, normal in zip(corner_vertices[first].tolist(), uvs[first].tolist(), loop_normals[first].tolist()):
+            vertices = base_vertices[index]
+            v = vertices[0]
+            if v.uv is not None:
+                v = copy.copy(v) # shallow copy should be fine
+                v.add_uvs = v.add_uvs.copy()
+                vertices.append(v)
+            v.uv = mathutils.Vector(uv)
+            v.normal = mathutils.Vector(normal)
+            split_vertices.append(v)
 
         materials = {}
-        uv_data = base_mesh.tessface_uv_textures.active
-        if uv_data:
-            uv_data = uv_data.data
-        else:
-            uv_data = iter(lambda: _DummyUV, None)
         face_seq = []
         reversing = not pmx_matrix.is_negative # pmx.load/pmx.save reverse face vertices by default
-        for face, uv in zip(base_mesh.tessfaces, uv_data):
-            if len(face.vertices) != 3:
-                raise Exception
-            idx = face.index * 3
-            n1, n2, n3 = loop_normals[idx:idx+3]
-            v1 = self.__convertFaceUVToVertexUV(face.vertices[0], uv.uv1, n1, base_vertices)
-            v2 = self.__convertFaceUVToVertexUV(face.vertices[1], uv.uv2, n2, base_vertices)
-            v3 = self.__convertFaceUVToVertexUV(face.vertices[2], uv.uv3, n3, base_vertices)
-
-            t = _Face([v3, v2, v1]) if reversing else _Face([v1, v2, v3])
+        face_splits = splits.reshape(-1, 3)
+        if reversing:
+            face_splits = face_splits[:, ::-1]
+        for (i1, i2, i3), material_index in zip(face_splits.tolist(), material_indices.tolist()):
+            t = _Face([split_vertices[i1], split_vertices[i2], split_vertices[i3]])
             face_seq.append(t)
-            if face.material_index not in materials:
-                materials[face.material_index] = []
-            materials[face.material_index].append(t)
+            if material_index not in materials:
+                materials[material_index] = []
+            materials[material_index].append(t)
 
         # assign default material
         if len(base_mesh.materials) < len(materials):
@@ -1136,27 +1437,141 @@ class __PmxExporter:
             if uv_n > 3:
                 logging.warning(' * extra addUV%d+ are not supported', uv_n+1)
                 break
-            uv_data = uv_tex.data
             zw_data = base_mesh.tessface_uv_textures.get('_'+uv_tex.name, None)
             logging.info(' # exporting addUV%d: %s [zw: %s]', uv_n+1, uv_tex.name, zw_data)
-            if zw_data:
-                zw_data = zw_data.data
-            else:
-                zw_data = iter(lambda: _DummyUV, None)
-            rip_vertices_map = {}
-            for f, face, uv, zw in zip(face_seq, base_mesh.tessfaces, uv_data, zw_data):
-                vertices = [base_vertices[x] for x in face.vertices]
-                rip_vertices = [rip_vertices_map.setdefault(x, [x]) for x in f.vertices]
-                f.vertices[0] = self.__convertAddUV(f.vertices[0], uv.uv1, zw.uv1, uv_n, vertices[0], rip_vertices[0])
-                f.vertices[1] = self.__convertAddUV(f.vertices[1], uv.uv2, zw.uv2, uv_n, vertices[1], rip_vertices[1])
-                f.vertices[2] = self.__convertAddUV(f.vertices[2], uv.uv3, zw.uv3, uv_n, vertices[2], rip_vertices[2])
+            add_uvs = self.__cornerUVs(uv_tex.data, num_faces)
+            add_zws = self.__cornerUVs(zw_data.data if zw_data else None, num_faces)
+
+            # split the vertices at the face corners again by their add UVs,
+            # the i-th vertex of a face gets the add UV of its i-th corner
+            slot_vertices = [v for f in face_seq for v in f.vertices]
+            slot_splits = np.array([id(v) for v in slot_vertices], dtype=np.int64)
+            slot_splits = np.unique(slot_splits, return_inverse=True)[1].ravel()
+            splits, first = _split_corners(slot_splits, [add_uvs, add_zws], [0.001, 0.001])
+
+            split_vertices = []
+            seen = set()
+            for slot, uv, zw in zip(first.tolist(), add_uvs[first].tolist(), add_zws[first].tolist()):
+                v = slot_vertices[slot]
+                if v in seen:
+                    v = copy.copy(v)
+                    v.add_uvs = v.add_uvs.copy()
+                else:
+                    seen.add(v)
+                v.add_uvs[uv_n] = (mathutils.Vector(uv), mathutils.Vector(zw))
+                split_vertices.append(v)
+            for f, (i1, i2, i3) in zip(face_seq, splits.reshape(-1, 3).tolist()):
+                f.vertices[:] = [split_vertices[i1], split_vertices[i2], split_vertices[i3]]
 
         return _Mesh(
             base_mesh,
             materials,
             shape_key_names,
-            vertex_group_names,
-            base_mesh.materials)
+            weights,
+            base_mesh.materials,
+            len(bl_add_uvs))
+
+    def __meshKey(self, meshObj, bone_map):
+        """ Return a fingerprint of the data __doLoadMeshData() reads from meshObj.
+
+        It covers the mesh, its uv layers, vertex groups and shape keys, the
+        material slots, the settings of the modifiers and the transforms (and
+        poses or vertices) of the objects they use, the world matrix and the
+        export options. Changes of other data used by modifiers, such as
+        textures of displace modifiers, are not detected.
+        """
+        h = hashlib.sha1()
+        def _update(*values):
+            h.update(repr(values).encode('utf-8'))
+
+        sort_method = self.__vertex_order_map['method'] if self.__vertex_order_map is not None else None
+        _update(_CachedMesh.VERSION, self.__scale, sort_method)
+        _update([tuple(row) for row in meshObj.matrix_world])
+
+        mesh = meshObj.data
+        _update(len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons))
+        _hash_items(h, mesh.vertices, 'co', len(mesh.vertices) * 3)
+        _hash_items(h, mesh.edges, 'vertices', len(mesh.edges) * 2, np.int32)
+        _hash_items(h, mesh.edges, 'use_edge_sharp', len(mesh.edges), bool)
+        _hash_items(h, mesh.loops, 'vertex_index', len(mesh.loops), np.int32)
+        _hash_items(h, mesh.polygons, 'loop_total', len(mesh.polygons), np.int32)
+        _hash_items(h, mesh.polygons, 'material_index', len(mesh.polygons), np.int32)
+        _hash_items(h, mesh.polygons, 'use_smooth', len(mesh.polygons), bool)
+        has_custom_normals = getattr(mesh, 'has_custom_normals', False) # Blender 2.74+
+        _update(mesh.use_auto_smooth, mesh.auto_smooth_angle, has_custom_normals)
+        if has_custom_normals:
+            mesh.calc_normals_split()
+            _hash_items(h, mesh.loops, 'normal', len(mesh.loops) * 3)
+            mesh.free_normals_split()
+        for uv_layer in mesh.uv_layers:
+            _update(uv_layer.name)
+            _hash_items(h, uv_layer.data, 'uv', len(uv_layer.data) * 2)
+        _update([s.material.name if s.material else None for s in meshObj.material_slots])
+
+        _update([(g.name, bone_map.get(g.name, -1)) for g in meshObj.vertex_groups])
+        group_counts = []
+        groups = []
+        group_weights = []
+        for v in mesh.vertices:
+            group_counts.append(len(v.groups))
+            for x in v.groups:
+                groups.append(x.group)
+                group_weights.append(x.weight)
+        for values, dtype in ((group_counts, np.int32), (groups, np.int32), (group_weights, np.float32)):
+            h.update(np.array(values, dtype=dtype).tobytes())
+
+        if mesh.shape_keys:
+            for kb in mesh.shape_keys.key_blocks:
+                _update(kb.name, kb.vertex_group, kb.relative_key.name, kb.mute, len(kb.data))
+                _hash_items(h, kb.data, 'co', len(kb.data) * 3)
+
+        objects = []
+        for m in meshObj.modifiers:
+            values, modifier_objects = _rna_values(m)
+            _update(m.type, values)
+            objects.extend(modifier_objects)
+        for obj in objects:
+            _update(obj.name, obj.type, [tuple(row) for row in obj.matrix_world])
+            if obj.type == 'ARMATURE':
+                _update(obj.data.pose_position, [([tuple(row) for row in b.matrix], [tuple(row) for row in b.bone.matrix_local])
+                                                 for b in obj.pose.bones])
+            elif obj.type == 'MESH':
+                _hash_items(h, obj.data.vertices, 'co', len(obj.data.vertices) * 3)
+        return h.hexdigest()
+
+    def __restoreMeshData(self, cached):
+        """ Return a _Mesh of a _CachedMesh, as __doLoadMeshData() would have loaded it. """
+        mesh_id = None
+        if self.__vertex_order_map is not None:
+            mesh_id = self.__vertex_order_map.setdefault('mesh_id', 0)
+            self.__vertex_order_map['mesh_id'] += 1
+        has_uv_morphs = self.__vertex_index_map is None # currently support for first mesh only
+        if has_uv_morphs:
+            self.__vertex_index_map = {i:[] for i in range(cached.vertex_count)}
+        self.__add_uv_count = max(self.__add_uv_count, cached.add_uv_count)
+        materials = []
+        for name in cached.material_names:
+            material = bpy.data.materials.get(name, None) if name is not None else None
+            materials.append(material or self.__getDefaultMaterial())
+        return cached.mesh(materials, mesh_id, has_uv_morphs)
+
+    def __loadCachedMeshData(self, meshObj, bone_map):
+        """ __loadMeshData() using the mesh cache, if any. """
+        if self.__mesh_cache is None:
+            return self.__loadMeshData(meshObj, bone_map)
+
+        key = self.__meshKey(meshObj, bone_map)
+        cached = self.__mesh_cache.get(key)
+        if cached is not None:
+            logging.info('Loading cached mesh: %s', meshObj.name)
+            return self.__restoreMeshData(cached)
+
+        mesh = self.__loadMeshData(meshObj, bone_map)
+        default_material = self.__default_material.material if self.__default_material else None
+        cached = _CachedMesh(mesh, default_material)
+        self.__mesh_cache.put(key, cached, cached.size(), owner=meshObj.name)
+        logging.debug('   - Cached mesh data (%d bytes)', cached.size())
+        return mesh
 
     def __loadMeshData(self, meshObj, bone_map):
         show_only_shape_key = meshObj.show_only_shape_key
@@ -1211,40 +1626,52 @@ class __PmxExporter:
         joints = sorted(args.get('joints', []), key=lambda x: x.name)
 
         self.__scale = args.get('scale', 1.0)
+        self.__mesh_cache = args.get('mesh_cache', None)
         copy_textures = args.get('copy_textures', False)
         sort_materials = args.get('sort_materials', False)
         sort_vertices = args.get('sort_vertices', 'NONE')
         if sort_vertices != 'NONE':
             self.__vertex_order_map = {'method':sort_vertices}
 
-        nameMap = self.__exportBones(meshes)
-        self.__exportIK(nameMap)
+        with profiler.phase('bones'):
+            nameMap = self.__exportBones(meshes)
+            self.__exportIK(nameMap)
 
-        mesh_data = []
-        for i in meshes:
-            mesh_data.append(self.__loadMeshData(i, nameMap))
+        with profiler.phase('mesh_data'):
+            mesh_data = []
+            for i in meshes:
+                mesh_data.append(self.__loadCachedMeshData(i, nameMap))
 
         self.__disable_specular = args.get('disable_specular', False)
-        self.__exportMeshes(mesh_data, nameMap)
-        self.__exportVertexMorphs(mesh_data, root)
+        with profiler.phase('meshes'):
+            self.__exportMeshes(mesh_data)
+        with profiler.phase('vertex_morphs'):
+            self.__exportVertexMorphs(mesh_data, root)
         if sort_materials:
-            self.__sortMaterials()
-        rigid_map = self.__exportRigidBodies(rigids, nameMap)
-        self.__exportJoints(joints, rigid_map)
+            with profiler.phase('sort_materials'):
+                self.__sortMaterials()
+        with profiler.phase('rigids'):
+            rigid_map = self.__exportRigidBodies(rigids, nameMap)
+        with profiler.phase('joints'):
+            self.__exportJoints(joints, rigid_map)
         if root is not None:
-            self.__export_bone_morphs(root)
-            self.__export_material_morphs(root)
-            self.__export_uv_morphs(root)
-            self.__export_group_morphs(root)
-            self.__exportDisplayItems(root, nameMap)
+            with profiler.phase('morphs'):
+                self.__export_bone_morphs(root)
+                self.__export_material_morphs(root)
+                self.__export_uv_morphs(root)
+                self.__export_group_morphs(root)
+            with profiler.phase('display'):
+                self.__exportDisplayItems(root, nameMap)
 
         if copy_textures:
-            output_dir = os.path.dirname(filepath)
-            import_folder = root.get('import_folder', '') if root else ''
-            base_folder = bpyutils.addon_preferences('base_texture_folder', '')
-            self.__copy_textures(output_dir, import_folder or base_folder)
-
-        pmx.save(filepath, self.__model, add_uv_count=self.__add_uv_count)
+            with profiler.phase('copy_textures'):
+                output_dir = os.path.dirname(filepath)
+                import_folder = root.get('import_folder', '') if root else ''
+                base_folder = bpyutils.addon_preferences('base_texture_folder', '')
+                self.__copy_textures(output_dir, import_folder or base_folder)
+
+        with profiler.phase('save'):
+            pmx.save(filepath, self.__model, add_uv_count=self.__add_uv_count)
 
 def export(filepath, **kwargs):
     logging.info('****************************************')
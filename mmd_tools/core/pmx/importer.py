@@ -6,13 +6,18 @@ import time
 
 import bpy
 import mathutils
+import numpy as np
 
 import mmd_tools.core.model as mmd_model
 from mmd_tools import utils
 from mmd_tools import bpyutils
 from mmd_tools.core import pmx
+from mmd_tools.core import profiler
+from mmd_tools.core.pmx import bulk
+from mmd_tools.core.pmx.cleaner import PMXCleaner
 from mmd_tools.core.bone import FnBone
-from mmd_tools.core.material import FnMaterial
+from mmd_tools.core.material import BatchUpdate, FnMaterial
+from mmd_tools.core.texture import ImageIndex, PathResolver, preload_file
 from mmd_tools.core.vmd.importer import BoneConverter
 from mmd_tools.operators.display_item import DisplayItemQuickSetup
 from mmd_tools.operators.misc import MoveObject
@@ -54,14 +59,18 @@ class PMXImporter:
 
         self.__vertexGroupTable = None
         self.__textureTable = None
+        self.__texturePaths = None
+        self.__imageIndex = None
         self.__rigidTable = None
 
         self.__boneTable = []
         self.__materialTable = []
         self.__imageTable = {}
 
-        self.__sdefVertices = {} # pmx vertices
+        self.__sdefVertices = {} # index => (c, r0, r1)
         self.__vertex_map = None
+        self.__vertex_data = None
+        self.__bulk_mesh = True
 
         self.__materialFaceCountTable = None
 
@@ -70,6 +79,34 @@ class PMXImporter:
         u, v = uv
         return [u, 1.0-v]
 
+    @staticmethod
+    def __flipUVArray(uv):
+        uv = np.array(uv, dtype=np.float32)
+        uv[..., 1] = 1.0 - uv[..., 1]
+        return uv
+
+    def __toBlenderArray(self, co):
+        """ Convert an array of pmx coordinates like Vector(co) * TO_BLE_MATRIX * scale. """
+        matrix = np.array(self.TO_BLE_MATRIX.to_3x3(), dtype=np.float64)
+        return np.dot(np.asarray(co, dtype=np.float64).reshape(-1, 3), matrix) * self.__scale
+
+    def __shapeKeyBasis(self):
+        """ Return the coordinates of the basis shape key as an array of shape (n, 3). """
+        data = self.__meshObj.data.shape_keys.reference_key.data
+        co = np.empty(len(data) * 3, dtype=np.float32)
+        data.foreach_get('co', co)
+        return co.reshape(-1, 3).astype(np.float64)
+
+    def __vertexData(self):
+        """ The vertices of the model as bulk.VertexData (for the bulk mesh build). """
+        if self.__vertex_data is None:
+            self.__vertex_data = bulk.vertex_data(self.__model.vertices)
+        return self.__vertex_data
+
+    def __vertexMapArray(self):
+        """ The vertex map of remove_doubles as an array of (pmx index, blender index). """
+        return np.array(self.__vertex_map, dtype=np.int64).reshape(-1, 2)
+
     def __getMaterialIndexFromFaceIndex(self, face_index):
         count = 0
         for i, c in enumerate(self.__materialFaceCountTable):
@@ -142,6 +179,10 @@ class PMXImporter:
             vertex_count = len(indices)
 
         mesh.vertices.add(count=vertex_count)
+        if self.__bulk_mesh:
+            self.__importVerticesBulk(vg_edge_scale, vg_vertex_order)
+            return
+
         for i, pv in enumerate(pmx_vertices):
             bv = mesh.vertices[i]
 
@@ -153,7 +194,8 @@ class PMXImporter:
             if isinstance(pv.weight.weights, pmx.BoneWeightSDEF):
                 self.__vertexGroupTable[pv.weight.bones[0]].add(index=[i], weight=pv.weight.weights.weight, type='REPLACE')
                 self.__vertexGroupTable[pv.weight.bones[1]].add(index=[i], weight=1.0-pv.weight.weights.weight, type='REPLACE')
-                self.__sdefVertices[i] = pv
+                sdef = pv.weight.weights
+                self.__sdefVertices[i] = (sdef.c, sdef.r0, sdef.r1)
             elif len(pv.weight.bones) == 1:
                 bone_index = pv.weight.bones[0]
                 if bone_index >= 0:
@@ -171,30 +213,91 @@ class PMXImporter:
         vg_edge_scale.lock_weight = True
         vg_vertex_order.lock_weight = True
 
+    def __importVerticesBulk(self, vg_edge_scale, vg_vertex_order):
+        """ Set the coordinates and the vertex group weights of all vertices from arrays. """
+        mesh = self.__meshObj.data
+        vertex_data = self.__vertexData()
+        rows = np.arange(len(vertex_data))
+        if self.__vertex_map:
+            vm = self.__vertexMapArray()
+            rows = np.flatnonzero(vm[:, 0] == rows)
+        vertex_count = len(rows)
+        indices = np.arange(vertex_count)
+
+        mesh.vertices.foreach_set('co', self.__toBlenderArray(vertex_data.co[rows]).astype(np.float32).ravel())
+
+        self.__addWeights([vg_edge_scale], np.zeros(vertex_count, dtype=np.intp), indices, vertex_data.edge_scale[rows])
+        self.__addWeights([vg_vertex_order], np.zeros(vertex_count, dtype=np.intp), indices, indices/vertex_count)
+
+        weight_types = vertex_data.weight_type[rows]
+        bones = vertex_data.bones[rows].ravel()
+        weights = vertex_data.weights[rows].ravel()
+        vertices = np.repeat(indices, 4)
+        columns = np.tile(np.arange(4), vertex_count)
+        # The second bone of BDEF2/SDEF replaces the first one if they are the same.
+        # If two or more weights for the same bone is present in BDEF4/QDEF, the second and subsequent will be ignored.
+        last_wins = (weight_types == pmx.BoneWeight.BDEF2) | (weight_types == pmx.BoneWeight.SDEF)
+        priorities = np.where(np.repeat(last_wins, 4), -columns, columns)
+
+        valid = bones >= 0
+        bones, weights, vertices, priorities = bones[valid], weights[valid], vertices[valid], priorities[valid]
+        order = np.lexsort((priorities, bones, vertices))
+        bones, weights, vertices = bones[order], weights[order], vertices[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (vertices[1:] != vertices[:-1]) | (bones[1:] != bones[:-1])
+        self.__addWeights(self.__vertexGroupTable, bones[first], vertices[first], weights[first])
+
+        sdef = np.flatnonzero(weight_types == pmx.BoneWeight.SDEF)
+        sdef_rows = rows[sdef]
+        self.__sdefVertices.update(zip(sdef.tolist(), zip(vertex_data.sdef_c[sdef_rows].tolist(),
+                                                          vertex_data.sdef_r0[sdef_rows].tolist(),
+                                                          vertex_data.sdef_r1[sdef_rows].tolist())))
+
+        vg_edge_scale.lock_weight = True
+        vg_vertex_order.lock_weight = True
+
+    @staticmethod
+    def __addWeights(vertex_groups, group_indices, vertex_indices, weights):
+        """ Add the vertices to vertex_groups[group_indices] with one call for each group and weight. """
+        if len(vertex_indices) < 1:
+            return
+        order = np.lexsort((weights, group_indices))
+        group_indices, vertex_indices, weights = group_indices[order], vertex_indices[order], weights[order]
+        breaks = np.flatnonzero((group_indices[1:] != group_indices[:-1]) | (weights[1:] != weights[:-1])) + 1
+        for start, end in zip([0] + breaks.tolist(), breaks.tolist() + [len(order)]):
+            vertex_groups[group_indices[start]].add(index=vertex_indices[start:end].tolist(), weight=float(weights[start]), type='REPLACE')
+
     def __storeVerticesSDEF(self):
         if len(self.__sdefVertices) < 1:
             return
 
         self.__createBasisShapeKey()
-        sdefC = self.__meshObj.shape_key_add('mmd_sdef_c')
-        sdefR0 = self.__meshObj.shape_key_add('mmd_sdef_r0')
-        sdefR1 = self.__meshObj.shape_key_add('mmd_sdef_r1')
-        for i, pv in self.__sdefVertices.items():
-            w = pv.weight.weights
-            shapeKeyPoint = sdefC.data[i]
-            shapeKeyPoint.co = mathutils.Vector(w.c) * self.TO_BLE_MATRIX * self.__scale
-            shapeKeyPoint = sdefR0.data[i]
-            shapeKeyPoint.co = mathutils.Vector(w.r0) * self.TO_BLE_MATRIX * self.__scale
-            shapeKeyPoint = sdefR1.data[i]
-            shapeKeyPoint.co = mathutils.Vector(w.r1) * self.TO_BLE_MATRIX * self.__scale
+        basis = self.__shapeKeyBasis()
+        indices = np.array(list(self.__sdefVertices.keys()), dtype=np.int64)
+        sdef_values = np.array(list(self.__sdefVertices.values()), dtype=np.float64).reshape(-1, 3, 3)
+        for i, name in enumerate(('mmd_sdef_c', 'mmd_sdef_r0', 'mmd_sdef_r1')):
+            shapeKey = self.__meshObj.shape_key_add(name)
+            co = basis.copy()
+            co[indices] = self.__toBlenderArray(sdef_values[:, i])
+            shapeKey.data.foreach_set('co', co.astype(np.float32).ravel())
         logging.info('Stored %d SDEF vertices', len(self.__sdefVertices))
 
+    def __preloadTextures(self):
+        """ Resolve the texture paths and read the files in the background. """
+        if self.__textureTable is None:
+            self.__texturePaths = self.__imageIndex.preload([i.path for i in self.__model.textures])
+
     def __importTextures(self):
         pmxModel = self.__model
 
+        if self.__textureTable is not None:
+            return # resolved by prepare()
+        if self.__texturePaths is not None:
+            self.__textureTable = [i.result() for i in self.__texturePaths]
+            return
         self.__textureTable = []
         for i in pmxModel.textures:
-            self.__textureTable.append(bpy.path.resolve_ncase(path=i.path))
+            self.__textureTable.append(self.__imageIndex.resolver.resolve(i.path))
 
     def __createEditBones(self, obj, pmx_bones):
         """ create EditBones from pmx file data.
@@ -512,6 +615,11 @@ class PMXImporter:
         logging.debug('Finished importing joints in %f seconds.', time.time() - start_time)
 
     def __importMaterials(self):
+        # the materials are updated once when BatchUpdate exits, while the image index is still active
+        with BatchUpdate():
+            self.__importMaterialsAndTextures()
+
+    def __importMaterialsAndTextures(self):
         self.__importTextures()
 
         pmxModel = self.__model
@@ -569,7 +677,61 @@ class PMXImporter:
                 texture_slot = fnMat.create_sphere_texture(self.__textureTable[i.sphere_texture])
                 texture_slot.diffuse_color_factor = amount
 
+    def __importPolygons(self):
+        """ Build the faces and uv layers of the mesh with foreach_set. """
+        pmxModel = self.__model
+        mesh = self.__meshObj.data
+
+        faces = np.array(pmxModel.faces, dtype=np.int64).reshape(-1, 3)
+        face_count = len(faces)
+        counts = np.array(self.__materialFaceCountTable, dtype=np.int64)
+        if face_count > counts.sum():
+            raise Exception('invalid face index.')
+        loop_vertices = faces
+        if self.__vertex_map:
+            loop_vertices = self.__vertexMapArray()[:, 1][faces]
+
+        mesh.loops.add(face_count * 3)
+        mesh.loops.foreach_set('vertex_index', loop_vertices.astype(np.int32).ravel())
+        mesh.polygons.add(face_count)
+        mesh.polygons.foreach_set('loop_start', np.arange(0, face_count * 3, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('loop_total', np.full(face_count, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('use_smooth', np.ones(face_count, dtype=bool))
+        material_indices = np.repeat(np.arange(len(counts), dtype=np.int32), counts)[:face_count]
+        mesh.polygons.foreach_set('material_index', material_indices)
+
+        vertex_data = self.__vertexData()
+        uv_tex = mesh.uv_textures.new()
+        mesh.uv_layers[uv_tex.name].data.foreach_set('uv', self.__flipUVArray(vertex_data.uv[faces]).ravel())
+        for material_index, image in self.__imageTable.items():
+            for i in np.flatnonzero(material_indices == material_index).tolist():
+                uv_tex.data[i].image = image
+
+        if pmxModel.header and pmxModel.header.additional_uvs:
+            logging.info('Importing %d additional uvs', pmxModel.header.additional_uvs)
+            zw_data_map = collections.OrderedDict()
+            for i in range(pmxModel.header.additional_uvs):
+                add_uv = mesh.uv_textures.new('UV'+str(i+1))
+                logging.info(' - %s...(uv channels)', add_uv.name)
+                uvs = vertex_data.additional_uvs[faces, i]
+                mesh.uv_layers[add_uv.name].data.foreach_set('uv', self.__flipUVArray(uvs[..., :2]).ravel())
+                if not uvs[..., 2:].any():
+                    logging.info('\t- zw are all zeros: %s', add_uv.name)
+                else:
+                    zw_data_map['_'+add_uv.name] = uvs[..., 2:]
+            for name, zws in zw_data_map.items():
+                logging.info(' - %s...(zw channels of %s)', name, name[1:])
+                add_zw = mesh.uv_textures.new(name)
+                if add_zw is None:
+                    logging.warning('\t* Lost zw channels')
+                    continue
+                mesh.uv_layers[add_zw.name].data.foreach_set('uv', self.__flipUVArray(zws).ravel())
+
     def __importFaces(self):
+        if self.__bulk_mesh:
+            self.__importPolygons()
+            return
+
         pmxModel = self.__model
         mesh = self.__meshObj.data
         vertex_map = self.__vertex_map
@@ -624,6 +786,7 @@ class PMXImporter:
         pmxModel = self.__model
         mmd_root = self.__root.mmd_root
         self.__createBasisShapeKey()
+        basis = self.__shapeKeyBasis()
         categories = self.CATEGORIES
         for morph in filter(lambda x: isinstance(x, pmx.VertexMorph), pmxModel.morphs):
             shapeKey = self.__meshObj.shape_key_add(morph.name)
@@ -631,10 +794,10 @@ class PMXImporter:
             vtx_morph.name = morph.name
             vtx_morph.name_e = morph.name_e
             vtx_morph.category = categories.get(morph.category, 'OTHER')
-            for md in morph.offsets:
-                shapeKeyPoint = shapeKey.data[md.index]
-                offset = mathutils.Vector(md.offset) * self.TO_BLE_MATRIX
-                shapeKeyPoint.co = shapeKeyPoint.co + offset * self.__scale
+            indices, offsets = bulk.morph_offsets(morph.offsets, 3)
+            co = basis.copy()
+            np.add.at(co, indices, self.__toBlenderArray(offsets))
+            shapeKey.data.foreach_set('co', co.astype(np.float32).ravel())
 
     def __importMaterialMorphs(self):
         mmd_root = self.__root.mmd_root
@@ -750,7 +913,17 @@ class PMXImporter:
             logging.info(' * No support for custom normals!!')
             return
         logging.info('Setting custom normals...')
-        if self.__vertex_map:
+        if self.__bulk_mesh:
+            normals = self.__vertexData().normal[:, (0, 2, 1)].astype(np.float64)
+            lengths = np.linalg.norm(normals, axis=1)
+            lengths[lengths == 0] = 1.0
+            normals /= lengths[:, None]
+            if self.__vertex_map:
+                faces = np.array(self.__model.faces, dtype=np.int64).reshape(-1, 3)
+                mesh.normals_split_custom_set(normals[faces.ravel()])
+            else:
+                mesh.normals_split_custom_set_from_vertices(normals)
+        elif self.__vertex_map:
             verts, faces = self.__model.vertices, self.__model.faces
             custom_normals = [(mathutils.Vector(verts[i].normal).xzy).normalized() for f in faces for i in f]
             mesh.normals_split_custom_set(custom_normals)
@@ -775,30 +948,83 @@ class PMXImporter:
                 continue
             self.__rig.renameBone(i.name, self.__translator.translate(i.name))
 
-    def __fixRepeatedMorphName(self):
+    @staticmethod
+    def __fixRepeatedMorphName(model):
         used_names_map = {}
-        for m in self.__model.morphs:
+        for m in model.morphs:
             #used_names = used_names_map.setdefault('all', set())
             used_names = used_names_map.setdefault(type(m), set())
             m.name = utils.uniqueName(m.name, used_names)
             used_names.add(m.name)
 
-    def execute(self, **args):
+    @classmethod
+    def __loadModel(cls, args, types):
+        """ Load the model and clean it, or use the cached result of that.
+
+        Returns (model, vertex_map).
+        """
+        clean_model = 'MESH' in types and args.get('clean_model', False)
+        remove_doubles = 'MESH' in types and args.get('remove_doubles', False)
+        mesh_only = 'MORPHS' not in types
+
+        model_cache = args.get('model_cache', None)
+        cache_key = None
+        if model_cache and 'pmx' not in args:
+            cache_key = model_cache.key(args['filepath'], (clean_model, remove_doubles, mesh_only))
+            cached = model_cache.load(cache_key)
+            if cached is not None:
+                return cached
+
         if 'pmx' in args:
-            self.__model = args['pmx']
+            model = args['pmx']
         else:
-            self.__model = pmx.load(args['filepath'])
-        self.__fixRepeatedMorphName()
+            model = args.get('model_loader', pmx.load)(args['filepath'])
+        cls.__fixRepeatedMorphName(model)
+
+        vertex_map = None
+        if clean_model:
+            PMXCleaner.clean(model, mesh_only)
+        if remove_doubles:
+            vertex_map = PMXCleaner.remove_doubles(model, mesh_only)
+
+        if cache_key is not None:
+            model_cache.save(cache_key, model, vertex_map)
+        return model, vertex_map
+
+    @classmethod
+    def prepare(cls, **args):
+        """ Do the work of execute() which does not touch Blender data.
+
+        The model is loaded and cleaned, and its texture files are resolved
+        and read, so this can run in a worker thread. Returns a copy of args
+        for execute() with the results.
+        """
+        args = dict(args)
+        types = args.get('types', set())
+        model, vertex_map = cls.__loadModel(args, types)
+        args['prepared'] = (model, vertex_map)
+        if 'MESH' in types:
+            resolver = PathResolver()
+            args['texture_paths'] = [preload_file(i.path, resolver) for i in model.textures]
+        return args
 
+    def execute(self, **args):
         types = args.get('types', set())
-        clean_model = args.get('clean_model', False)
-        remove_doubles = args.get('remove_doubles', False)
+        if 'prepared' in args:
+            self.__model, self.__vertex_map = args['prepared']
+        else:
+            with profiler.phase('load'):
+                self.__model, self.__vertex_map = self.__loadModel(args, types)
+        self.__textureTable = args.get('texture_paths', None)
+
         self.__scale = args.get('scale', 1.0)
+        self.__bulk_mesh = args.get('bulk_mesh', True)
         self.__use_mipmap = args.get('use_mipmap', True)
         self.__sph_blend_factor = args.get('sph_blend_factor', 1.0)
         self.__spa_blend_factor = args.get('spa_blend_factor', 1.0)
         self.__fix_IK_links = args.get('fix_IK_links', False)
         self.__translator = args.get('translator', None)
+        self.__imageIndex = ImageIndex()
 
         logging.info('****************************************')
         logging.info(' mmd_tools.import_pmx module')
@@ -809,49 +1035,64 @@ class PMXImporter:
 
         start_time = time.time()
 
-        self.__createObjects()
+        with profiler.phase('objects'):
+            self.__createObjects()
 
         if 'MESH' in types:
-            if clean_model:
-                _PMXCleaner.clean(self.__model, 'MORPHS' not in types)
-            if remove_doubles:
-                self.__vertex_map = _PMXCleaner.remove_doubles(self.__model, 'MORPHS' not in types)
-            self.__createMeshObject()
-            self.__importVertices()
-            self.__importMaterials()
-            self.__importFaces()
-            self.__meshObj.data.update()
-            self.__assignCustomNormals()
-            self.__storeVerticesSDEF()
+            # the image index stops the preloading of textures if the import fails
+            with self.__imageIndex:
+                with profiler.phase('vertices'):
+                    self.__createMeshObject()
+                    self.__preloadTextures()
+                    self.__importVertices()
+                with profiler.phase('materials'):
+                    self.__importMaterials()
+            with profiler.phase('faces'):
+                self.__importFaces()
+                self.__meshObj.data.update()
+            with profiler.phase('normals'):
+                self.__assignCustomNormals()
+                self.__storeVerticesSDEF()
 
         if 'ARMATURE' in types:
-            # for tracking bone order
-            if 'MESH' not in types:
-                self.__createMeshObject()
-                self.__importVertexGroup()
-            self.__importBones()
-            if args.get('rename_LR_bones', False):
-                use_underscore = args.get('use_underscore', False)
-                self.__renameLRBones(use_underscore)
-            if self.__translator:
-                self.__translateBoneNames()
-            self.__rig.applyAdditionalTransformConstraints()
+            with profiler.phase('bones'):
+                # for tracking bone order
+                if 'MESH' not in types:
+                    self.__createMeshObject()
+                    self.__importVertexGroup()
+                self.__importBones()
+                if args.get('rename_LR_bones', False):
+                    use_underscore = args.get('use_underscore', False)
+                    self.__renameLRBones(use_underscore)
+                if self.__translator:
+                    self.__translateBoneNames()
+            with profiler.phase('additional_transforms'):
+                self.__rig.applyAdditionalTransformConstraints()
 
         if 'PHYSICS' in types:
-            self.__importRigids()
-            self.__importJoints()
-
-        if 'DISPLAY' in types:
-            self.__importDisplayFrames()
-        else:
-            self.__rig.initialDisplayFrames()
+            with profiler.phase('rigids'):
+                self.__importRigids()
+            with profiler.phase('joints'):
+                self.__importJoints()
+
+        with profiler.phase('display'):
+            if 'DISPLAY' in types:
+                self.__importDisplayFrames()
+            else:
+                self.__rig.initialDisplayFrames()
 
         if 'MORPHS' in types:
-            self.__importGroupMorphs()
-            self.__importVertexMorphs()
-            self.__importBoneMorphs()
-            self.__importMaterialMorphs()
-            self.__importUVMorphs()
+            with profiler.phase('morphs'):
+                with profiler.phase('group_morphs'):
+                    self.__importGroupMorphs()
+                with profiler.phase('vertex_morphs'):
+                    self.__importVertexMorphs()
+                with profiler.phase('bone_morphs'):
+                    self.__importBoneMorphs()
+                with profiler.phase('material_morphs'):
+                    self.__importMaterialMorphs()
+                with profiler.phase('uv_morphs'):
+                    self.__importUVMorphs()
 
         if self.__meshObj:
             self.__addArmatureModifier(self.__meshObj, self.__armObj)
@@ -869,131 +1110,3 @@ class PMXImporter:
         logging.info('----------------------------------------')
         logging.info(' mmd_tools.import_pmx module')
         logging.info('****************************************')
-
-
-class _PMXCleaner:
-    @classmethod
-    def clean(cls, pmx_model, mesh_only):
-        logging.info('Cleaning PMX data...')
-        pmx_faces = pmx_model.faces
-        pmx_vertices = pmx_model.vertices
-
-        # clean face/vertex
-        cls.__clean_pmx_faces(pmx_faces, pmx_model.materials, lambda f: frozenset(f))
-
-        index_map = {v:v for f in pmx_faces for v in f}
-        is_index_clean = len(index_map) == len(pmx_vertices)
-        if is_index_clean:
-            logging.info('   (vertices is clean)')
-        else:
-            new_vertex_count = 0
-            for v in sorted(index_map):
-                if v != new_vertex_count:
-                    pmx_vertices[new_vertex_count] = pmx_vertices[v]
-                    index_map[v] = new_vertex_count
-                new_vertex_count += 1
-            logging.warning('   - removed %d vertices', len(pmx_vertices)-new_vertex_count)
-            del pmx_vertices[new_vertex_count:]
-
-            # update vertex indices of faces
-            for f in pmx_faces:
-                f[:] = [index_map[v] for v in f]
-
-        if mesh_only:
-            logging.info('   - Done (mesh only)!!')
-            return
-
-        if not is_index_clean:
-            # clean vertex/uv morphs
-            def __update_index(x):
-                x.index = index_map.get(x.index, None)
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
-        logging.info('   - Done!!')
-
-    @classmethod
-    def remove_doubles(cls, pmx_model, mesh_only):
-        logging.info('Removing doubles...')
-        pmx_vertices = pmx_model.vertices
-
-        vertex_map = [None] * len(pmx_vertices)
-        # gather vertex data
-        for i, v in enumerate(pmx_vertices):
-            vertex_map[i] = [tuple(v.co)]
-        if not mesh_only:
-            for m in pmx_model.morphs:
-                if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
-                    continue
-                for x in m.offsets:
-                    vertex_map[x.index].append(tuple(x.offset))
-        # generate vertex merging table
-        keys = {}
-        for i, v in enumerate(vertex_map):
-            k = tuple(v)
-            if k in keys:
-                vertex_map[i] = keys[k] # merge pmx_vertices[i] to pmx_vertices[keys[k][0]]
-            else:
-                vertex_map[i] = keys[k] = (i, len(keys)) # (pmx index, blender index)
-        counts = len(vertex_map) - len(keys)
-        keys.clear()
-        if counts:
-            logging.warning('   - %d vertices will be removed', counts)
-        else:
-            logging.info('   - Done (no changes)!!')
-            return None
-
-        # clean face
-        #face_key_func = lambda f: frozenset(vertex_map[x][0] for x in f)
-        face_key_func = lambda f: frozenset({vertex_map[x][0]:tuple(pmx_vertices[x].uv) for x in f}.items())
-        cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, face_key_func)
-
-        if mesh_only:
-            logging.info('   - Done (mesh only)!!')
-        else:
-            # clean vertex/uv morphs
-            def __update_index(x):
-                indices = vertex_map[x.index]
-                x.index = indices[1] if x.index == indices[0] else None
-                return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
-            logging.info('   - Done!!')
-        return vertex_map
-
-
-    @staticmethod
-    def __clean_pmx_faces(pmx_faces, pmx_materials, face_key_func):
-        new_face_count = 0
-        face_iter = iter(pmx_faces)
-        for mat in pmx_materials:
-            used_faces = set()
-            new_vertex_count = 0
-            for i in range(int(mat.vertex_count/3)):
-                f = next(face_iter)
-
-                f_key = face_key_func(f)
-                if len(f_key) != 3 or f_key in used_faces:
-                    continue
-                used_faces.add(f_key)
-
-                pmx_faces[new_face_count] = list(f)
-                new_face_count += 1
-                new_vertex_count += 3
-            mat.vertex_count = new_vertex_count
-        face_iter = None
-        if new_face_count == len(pmx_faces):
-            logging.info('   (faces is clean)')
-        else:
-            logging.warning('   - removed %d faces', len(pmx_faces)-new_face_count)
-            del pmx_faces[new_face_count:]
-
-    @staticmethod
-    def __clean_pmx_morphs(pmx_morphs, index_update_func):
-        for m in pmx_morphs:
-            if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
-                continue
-            old_len = len(m.offsets)
-            m.offsets = [x for x in m.offsets if index_update_func(x)]
-            counts = old_len - len(m.offsets)
-            if counts:
-                logging.warning('   - removed %d (of %d) offsets of "%s"', counts, old_len, m.name)
-
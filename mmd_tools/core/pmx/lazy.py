@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import logging
+import struct
+
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import bulk
+
+
+def _skipBytes(fs, size):
+    fs.seek(fs.tell() + size)
+
+def _skipStr(fs):
+    _skipBytes(fs, fs.readInt())
+
+def _skipTextures(fs, count):
+    for i in range(count):
+        _skipStr(fs)
+
+def _skipMaterials(fs, count):
+    header = fs.header()
+    tex_size = header.texture_index_size
+    for i in range(count):
+        _skipStr(fs)
+        _skipStr(fs)
+        # diffuse, specular, shininess, ambient, flags, edge color, edge size,
+        # texture, sphere texture and sphere mode
+        _skipBytes(fs, 65 + tex_size*2 + 1)
+        if fs.readSignedByte() == 1:
+            _skipBytes(fs, 1)
+        else:
+            _skipBytes(fs, tex_size)
+        _skipStr(fs)
+        _skipBytes(fs, 4)
+
+def _skipBones(fs, count):
+    bone_size = fs.header().bone_index_size
+    for i in range(count):
+        _skipStr(fs)
+        _skipStr(fs)
+        _skipBytes(fs, 12 + bone_size + 4)
+        flags = fs.readShort()
+        size = bone_size if flags & 0x0001 else 12
+        if flags & 0x0300:
+            size += bone_size + 4
+        if flags & 0x0400:
+            size += 12
+        if flags & 0x0800:
+            size += 24
+        if flags & 0x2000:
+            size += 4
+        _skipBytes(fs, size)
+        if flags & 0x0020:
+            _skipBytes(fs, bone_size + 8)
+            for j in range(fs.readInt()):
+                _skipBytes(fs, bone_size)
+                if fs.readByte() == 1:
+                    _skipBytes(fs, 24)
+
+def _skipMorphs(fs, count):
+    header = fs.header()
+    uv_offset_size = header.vertex_index_size + 16
+    offset_sizes = {
+        0: header.morph_index_size + 4,
+        1: header.vertex_index_size + 12,
+        2: header.bone_index_size + 28,
+        3: uv_offset_size,
+        4: uv_offset_size,
+        5: uv_offset_size,
+        6: uv_offset_size,
+        7: uv_offset_size,
+        8: header.material_index_size + 113,
+        }
+    for i in range(count):
+        _skipStr(fs)
+        _skipStr(fs)
+        fs.readSignedByte()
+        offset_size = offset_sizes[fs.readSignedByte()]
+        _skipBytes(fs, fs.readInt() * offset_size)
+
+def _skipDisplay(fs, count):
+    header = fs.header()
+    index_sizes = {0: header.bone_index_size, 1: header.morph_index_size}
+    for i in range(count):
+        _skipStr(fs)
+        _skipStr(fs)
+        _skipBytes(fs, 1)
+        num = fs.readInt()
+        if header.bone_index_size == header.morph_index_size:
+            _skipBytes(fs, num * (1 + header.bone_index_size))
+            continue
+        for j in range(num):
+            disp_type = fs.readByte()
+            if disp_type not in index_sizes:
+                raise Exception('invalid value.')
+            _skipBytes(fs, index_sizes[disp_type])
+
+def _skipRigids(fs, count):
+    size = fs.header().bone_index_size + 61
+    for i in range(count):
+        _skipStr(fs)
+        _skipStr(fs)
+        _skipBytes(fs, size)
+
+def _skipJoints(fs, count):
+    size = 1 + fs.header().rigid_index_size*2 + 96
+    for i in range(count):
+        _skipStr(fs)
+        _skipStr(fs)
+        _skipBytes(fs, size)
+
+def _skipFaces(fs, count):
+    _skipBytes(fs, int(count/3) * 3 * fs.header().vertex_index_size)
+
+
+class LazyModel(pmx.Model):
+    """ A pmx.Model which decodes its sections on first access.
+
+    load() reads the header, names and comments, and records the offset of
+    every section by skipping over the records without creating objects.
+    The file is opened again to decode a section when its attribute (e.g.
+    bones or morphs) is used for the first time. After that it is a plain
+    attribute, so the model can be used like a pmx.Model.
+    """
+    SECTIONS = (
+        ('vertices', bulk.skip_vertices),
+        ('faces', _skipFaces),
+        ('textures', _skipTextures),
+        ('materials', _skipMaterials),
+        ('bones', _skipBones),
+        ('morphs', _skipMorphs),
+        ('display', _skipDisplay),
+        ('rigids', _skipRigids),
+        ('joints', _skipJoints),
+        )
+
+    def __init__(self):
+        pmx.Model.__init__(self)
+        self.__offsets = {}
+        self.__num_textures = 0
+
+    def load(self, fs):
+        self.filepath = fs.path()
+        self.header = fs.header()
+
+        self.name = fs.readStr()
+        self.name_e = fs.readStr()
+        self.comment = fs.readStr()
+        self.comment_e = fs.readStr()
+        logging.info('Model name: %s', self.name)
+
+        self.__offsets = {}
+        for name, skip in self.SECTIONS:
+            # the section is recorded before skipping it, so a truncated
+            # section is decoded as far as possible like pmx.load() does
+            offset = fs.tell()
+            self.__offsets[name] = offset
+            delattr(self, name)
+            count = fs.readInt()
+            if name == 'textures':
+                self.__num_textures = count
+            skip(fs, count)
+            logging.debug('Section %s: %d items at offset %d', name, count, offset)
+
+    def isLoaded(self, name):
+        """ Return True if the section is decoded or was not found in the file. """
+        return name in self.__dict__ or name not in self.__offsets
+
+    def __getattr__(self, name):
+        offsets = self.__dict__.get('_LazyModel__offsets', {})
+        if name not in offsets:
+            raise AttributeError(name)
+        logging.info('Load the section "%s" of %s', name, self.filepath)
+        with pmx.FileReadStream(self.filepath, self.header) as fs:
+            fs.seek(offsets[name])
+            try:
+                if name == 'materials':
+                    self.loadMaterials(fs, self.__num_textures)
+                else:
+                    getattr(self, 'load' + name.capitalize())(fs)
+            except struct.error as e:
+                logging.error(' * Corrupted file: %s', e)
+                if name not in self.__dict__:
+                    setattr(self, name, getattr(pmx.Model(), name))
+            return self.__dict__[name]
+
+
+def load(path):
+    """ Load a pmx file as a LazyModel. Only the section offsets are read. """
+    with pmx.FileReadStream(path) as fs:
+        header = pmx.Header()
+        header.load(fs)
+        fs.setHeader(header)
+        model = LazyModel()
+        try:
+            model.load(fs)
+        except struct.error as e:
+            logging.error(' * Corrupted file: %s', e)
+        return model
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+""" Opt-in timings of the steps of importing and exporting models.
+
+While a Profiler is active (with Profiler(name) as profiler: ...), the
+phases of the importer, the exporter and Model.build() record their wall
+time, CPU time, the change of the number of Blender data blocks and,
+with trace_memory, the change of the memory allocated by Python. Tracing
+the memory slows down Python a lot and distorts the times, so it is off by
+default. Without an active Profiler, phase() does nothing.
+
+    with profiler.phase('vertices'):
+        ...
+"""
+import collections
+import json
+import logging
+import platform
+import threading
+import time
+import tracemalloc
+
+import bpy
+
+
+# the collections of bpy.data whose sizes are recorded by each phase
+DATA_COLLECTIONS = ('objects', 'meshes', 'materials', 'textures', 'images', 'armatures',
+                    'shape_keys', 'actions', 'groups', 'texts')
+
+
+def _dataCounts():
+    counts = {}
+    for name in DATA_COLLECTIONS:
+        data = getattr(bpy.data, name, None)
+        if data is not None:
+            counts[name] = len(data)
+    return counts
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.__profiler = profiler
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.allocated = None
+        self.data = collections.OrderedDict()
+        self.phases = []
+        self.__start = None
+
+    def __enter__(self):
+        self.__profiler._push(self)
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.__start = (time.perf_counter(), time.process_time(), memory, _dataCounts())
+        return self
+
+    def __exit__(self, type, value, traceback):
+        wall, cpu, memory, counts = self.__start
+        self.wall += time.perf_counter() - wall
+        self.cpu += time.process_time() - cpu
+        if memory is not None and tracemalloc.is_tracing():
+            self.allocated = (self.allocated or 0) + tracemalloc.get_traced_memory()[0] - memory
+        for k, v in _dataCounts().items():
+            delta = v - counts.get(k, 0)
+            if delta:
+                self.data[k] = self.data.get(k, 0) + delta
+        self.__profiler._pop(self)
+
+    def report(self):
+        r = collections.OrderedDict()
+        r['name'] = self.name
+        r['wall_s'] = self.wall
+        r['cpu_s'] = self.cpu
+        r['allocated_bytes'] = self.allocated
+        r['data'] = self.data
+        r['phases'] = [i.report() for i in self.phases]
+        return r
+
+
+class Profiler:
+    """ Collect the phases of an import or export into a report.
+
+    Phases are only recorded in the thread which entered the profiler, so
+    work prepared in other threads (see core/pipeline.py) is not counted.
+    """
+    __current = None
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.__root = _Phase(self, name)
+        self.__stack = []
+        self.__thread = None
+        self.__previous = None
+        self.__started_tracing = False
+
+    @classmethod
+    def current(cls):
+        """ Return the active Profiler, or None. """
+        return cls.__current
+
+    def __enter__(self):
+        self.__previous = Profiler.__current
+        Profiler.__current = self
+        self.__thread = threading.get_ident()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+        self.__root.__enter__()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.__root.__exit__(type, value, traceback)
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+        Profiler.__current = self.__previous
+        self.__previous = None
+
+    def _push(self, phase):
+        if self.__stack:
+            self.__stack[-1].phases.append(phase)
+        self.__stack.append(phase)
+
+    def _pop(self, phase):
+        assert self.__stack[-1] is phase
+        self.__stack.pop()
+
+    def phase(self, name):
+        if threading.get_ident() != self.__thread:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def report(self):
+        """ Return the report as a dict which can be serialized as JSON. """
+        r = collections.OrderedDict()
+        r['version'] = 1
+        r['name'] = self.name
+        r['time'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        r['blender'] = bpy.app.version_string
+        r['python'] = platform.python_version()
+        r['trace_memory'] = self.trace_memory
+        r['total'] = self.__root.report()
+        return r
+
+    def dumps(self):
+        return json.dumps(self.report(), indent=2)
+
+    def save(self, filepath):
+        """ Write the report as a JSON file. """
+        with open(filepath, 'w') as f:
+            f.write(self.dumps() + '\n')
+        logging.info('Saved profile: %s', filepath)
+
+    def saveText(self, name=None):
+        """ Write the report into the text block of name, and return the text block. """
+        name = name or 'mmd_tools.profile.json'
+        text = bpy.data.texts.get(name, None) or bpy.data.texts.new(name)
+        text.from_string(self.dumps())
+        return text
+
+
+def phase(name):
+    """ Return a context manager recording a phase of the active Profiler, if any. """
+    profiler = Profiler.current()
+    if profiler is None:
+        return _NULL_PHASE
+    return profiler.phase(name)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+""" Lookup of texture files and their images for importing models.
+
+FnMaterial finds an existing image or texture of a file by comparing it to
+every item of bpy.data, which takes two stats per item. While an
+ImageIndex is active (with ImageIndex(): ...), the images and textures are
+indexed once by the real path and the (st_dev, st_ino) of their files, and
+case-insensitive path resolution reuses the directory listings.
+"""
+import concurrent.futures
+import os
+
+import bpy
+
+
+class PathResolver:
+    """ bpy.path.resolve_ncase() with cached results and directory listings. """
+
+    def __init__(self):
+        self.__listings = {}
+        self.__paths = {}
+
+    def __listing(self, dirpath):
+        """ Return {lower case name: name} of the files of dirpath, or None. """
+        listing = self.__listings.get(dirpath, None)
+        if listing is None:
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                names = None
+            if names is not None:
+                listing = {}
+                for name in names:
+                    listing.setdefault(name.lower(), name)
+            self.__listings[dirpath] = listing
+        return listing
+
+    def __find(self, path):
+        if not path or os.path.exists(path):
+            return path, True
+        filename = os.path.basename(path)
+        dirpath = os.path.dirname(path)
+        suffix = path[:0]
+        if not filename:
+            suffix = path[-1]
+            path = path[:-1]
+            filename = os.path.basename(path)
+            dirpath = os.path.dirname(path)
+        if not os.path.exists(dirpath):
+            if dirpath == path:
+                return path, False
+            dirpath, found = self.__find(dirpath)
+            if not found:
+                return path, False
+        if not os.path.isdir(dirpath):
+            return path, False
+        listing = self.__listing(dirpath)
+        name = listing.get(filename.lower(), None) if listing else None
+        if name is None:
+            return path, False
+        return os.path.join(dirpath, name) + suffix, True
+
+    def resolve(self, path):
+        """ Return path with the case of its existing file, or path if it is not found. """
+        result = self.__paths.get(path, None)
+        if result is None:
+            found_path, found = self.__find(path)
+            result = self.__paths[path] = found_path if found else path
+        return result
+
+
+def preload_file(path, resolver=None):
+    """ Resolve path and read its file, so that Blender loads it from the system cache.
+
+    Returns the resolved path.
+    """
+    if resolver is not None:
+        path = resolver.resolve(path)
+    try:
+        with open(path, 'rb') as f:
+            while f.read(1 << 20):
+                pass
+    except (IOError, OSError):
+        pass
+    return path
+
+
+def _fileKeys(filepath):
+    """ Return the keys of a file: its normalized real path and (st_dev, st_ino) if it exists. """
+    keys = [os.path.normcase(os.path.realpath(os.path.abspath(filepath)))]
+    try:
+        st = os.stat(filepath)
+    except (OSError, ValueError):
+        return keys
+    if st.st_ino:
+        keys.append((st.st_dev, st.st_ino))
+    return keys
+
+
+class ImageIndex:
+    """ An index of the images and image textures of bpy.data by their files.
+
+    It is built on first use and updated with addImage()/addTexture(), so
+    that an import finds the images and textures it creates itself. Removing
+    images or textures invalidates the index.
+    """
+    __current = None
+
+    def __init__(self, max_workers=4):
+        self.resolver = PathResolver()
+        self.max_workers = max_workers
+        self.__images = None
+        self.__textures = None
+        self.__executor = None
+        self.__previous = None
+
+    @classmethod
+    def current(cls):
+        """ Return the active ImageIndex, or None. """
+        return cls.__current
+
+    def __enter__(self):
+        self.__previous = ImageIndex.__current
+        ImageIndex.__current = self
+        return self
+
+    def __exit__(self, type, value, traceback):
+        ImageIndex.__current = self.__previous
+        self.__previous = None
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
+    @staticmethod
+    def __add(table, filepath, item):
+        for k in _fileKeys(filepath):
+            table.setdefault(k, item)
+
+    @staticmethod
+    def __imagePath(image):
+        if image and image.source == 'FILE':
+            return image.filepath_from_user()
+        return None
+
+    def __imageTable(self):
+        if self.__images is None:
+            self.__images = {}
+            for i in bpy.data.images:
+                filepath = self.__imagePath(i)
+                if filepath:
+                    self.__add(self.__images, filepath, i)
+        return self.__images
+
+    def __textureTable(self):
+        if self.__textures is None:
+            self.__textures = {}
+            for t in bpy.data.textures:
+                filepath = self.__imagePath(t.image) if t.type == 'IMAGE' else None
+                if filepath:
+                    self.__add(self.__textures, filepath, t)
+        return self.__textures
+
+    @staticmethod
+    def __find(table, filepath):
+        for k in _fileKeys(filepath):
+            item = table.get(k, None)
+            if item is not None:
+                return item
+        return None
+
+    def findImage(self, filepath):
+        """ Return the image of the file of filepath, or None. """
+        return self.__find(self.__imageTable(), filepath)
+
+    def findTexture(self, filepath):
+        """ Return the image texture of the file of filepath, or None. """
+        return self.__find(self.__textureTable(), filepath)
+
+    def addImage(self, image):
+        filepath = self.__imagePath(image)
+        if filepath and self.__images is not None:
+            self.__add(self.__images, filepath, image)
+
+    def addTexture(self, texture):
+        filepath = self.__imagePath(texture.image)
+        if filepath and self.__textures is not None:
+            self.__add(self.__textures, filepath, texture)
+
+    def invalidate(self):
+        self.__images = None
+        self.__textures = None
+
+    def preload(self, paths):
+        """ Resolve paths and read their files on a thread pool.
+
+        Blender loads the images later from the system cache. Returns a list
+        of futures of the resolved paths.
+        """
+        if self.__executor is None:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        return [self.__executor.submit(preload_file, i, self.resolver) for i in paths]
+
+
+def resolve_ncase(path):
+    """ bpy.path.resolve_ncase() using the cache of the active ImageIndex. """
+    index = ImageIndex.current()
+    if index is None:
+        return bpy.path.resolve_ncase(path=path)
+    return index.resolver.resolve(path)
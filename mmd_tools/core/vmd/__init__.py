@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
 import struct
 import collections
+import collections.abc
+
+import numpy as np
+
+from mmd_tools.core.mapped_file import MappedFile
 
 class InvalidFileError(Exception):
     pass
@@ -15,17 +21,21 @@ def _toShiftJisString(byteString):
         return byteString[:-1].decode("shift_jis")
 
 
+_COUNT = struct.Struct('<L')
+
+
 class Header:
     VMD_SIGN = b'Vocaloid Motion Data 0002'
+    _STRUCT = struct.Struct('<30s20s')
     def __init__(self):
         self.signature = None
         self.model_name = ''
 
     def load(self, fin):
-        self.signature, = struct.unpack('<30s', fin.read(30))
+        self.signature, model_name = fin.unpack(self._STRUCT)
         if self.signature[:len(self.VMD_SIGN)] != self.VMD_SIGN:
             raise InvalidFileError('File signature "%s" is invalid.'%self.signature)
-        self.model_name = _toShiftJisString(struct.unpack('<20s', fin.read(20))[0])
+        self.model_name = _toShiftJisString(model_name)
 
     def save(self, fin):
         fin.write(struct.pack('<30s', self.VMD_SIGN))
@@ -36,6 +46,14 @@ class Header:
 
 
 class BoneFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('location', '<f4', (3,)),
+        ('rotation', '<f4', (4,)),
+        ('interp', 'i1', (64,)),
+        ])
+    _STRUCT = struct.Struct('<L3f4f64b')
+
     def __init__(self):
         self.frame_number = 0
         self.location = []
@@ -43,10 +61,11 @@ class BoneFrameKey:
         self.interp = []
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.location = list(struct.unpack('<fff', fin.read(4*3)))
-        self.rotation = list(struct.unpack('<ffff', fin.read(4*4)))
-        self.interp = list(struct.unpack('<64b', fin.read(64)))
+        v = fin.unpack(self._STRUCT)
+        self.frame_number = v[0]
+        self.location = list(v[1:4])
+        self.rotation = list(v[4:8])
+        self.interp = list(v[8:])
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -54,6 +73,18 @@ class BoneFrameKey:
         fin.write(struct.pack('<ffff', *self.rotation))
         fin.write(struct.pack('<64b', *self.interp))
 
+    @classmethod
+    def fromRecord(cls, frame_number, location, rotation, interp):
+        self = cls()
+        self.frame_number = frame_number
+        self.location = location
+        self.rotation = rotation
+        self.interp = interp
+        return self
+
+    def toRecord(self):
+        return (self.frame_number, tuple(self.location), tuple(self.rotation), tuple(self.interp))
+
     def __repr__(self):
         return '<BoneFrameKey frame %s, loa %s, rot %s>'%(
             str(self.frame_number),
@@ -63,18 +94,33 @@ class BoneFrameKey:
 
 
 class ShapeKeyFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('weight', '<f4'),
+        ])
+    _STRUCT = struct.Struct('<Lf')
+
     def __init__(self):
         self.frame_number = 0
         self.weight = 0.0
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.weight, = struct.unpack('<f', fin.read(4))
+        self.frame_number, self.weight = fin.unpack(self._STRUCT)
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
         fin.write(struct.pack('<f', self.weight))
 
+    @classmethod
+    def fromRecord(cls, frame_number, weight):
+        self = cls()
+        self.frame_number = frame_number
+        self.weight = weight
+        return self
+
+    def toRecord(self):
+        return (self.frame_number, self.weight)
+
     def __repr__(self):
         return '<ShapeKeyFrameKey frame %s, weight %s>'%(
             str(self.frame_number),
@@ -83,6 +129,18 @@ class ShapeKeyFrameKey:
 
 
 class CameraKeyFrameKey:
+    # the persp field keeps the value of the file (0: perspective)
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('distance', '<f4'),
+        ('location', '<f4', (3,)),
+        ('rotation', '<f4', (3,)),
+        ('interp', 'i1', (24,)),
+        ('angle', '<u4'),
+        ('persp', 'i1'),
+        ])
+    _STRUCT = struct.Struct('<Lf3f3f24bLb')
+
     def __init__(self):
         self.frame_number = 0
         self.distance = 0.0
@@ -93,14 +151,14 @@ class CameraKeyFrameKey:
         self.persp = True
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.distance, = struct.unpack('<f', fin.read(4))
-        self.location = list(struct.unpack('<fff', fin.read(4*3)))
-        self.rotation = list(struct.unpack('<fff', fin.read(4*3)))
-        self.interp = list(struct.unpack('<24b', fin.read(24)))
-        self.angle, = struct.unpack('<L', fin.read(4))
-        self.persp, = struct.unpack('<b', fin.read(1))
-        self.persp = (self.persp == 0)
+        v = fin.unpack(self._STRUCT)
+        self.frame_number = v[0]
+        self.distance = v[1]
+        self.location = list(v[2:5])
+        self.rotation = list(v[5:8])
+        self.interp = list(v[8:32])
+        self.angle = v[32]
+        self.persp = (v[33] == 0)
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -111,6 +169,22 @@ class CameraKeyFrameKey:
         fin.write(struct.pack('<L', self.angle))
         fin.write(struct.pack('<b', 0 if self.persp else 1))
 
+    @classmethod
+    def fromRecord(cls, frame_number, distance, location, rotation, interp, angle, persp):
+        self = cls()
+        self.frame_number = frame_number
+        self.distance = distance
+        self.location = location
+        self.rotation = rotation
+        self.interp = interp
+        self.angle = angle
+        self.persp = (persp == 0)
+        return self
+
+    def toRecord(self):
+        return (self.frame_number, self.distance, tuple(self.location), tuple(self.rotation),
+                tuple(self.interp), self.angle, 0 if self.persp else 1)
+
     def __repr__(self):
         return '<CameraKeyFrameKey frame %s, distance %s, loc %s, rot %s, angle %s, persp %s>'%(
             str(self.frame_number),
@@ -123,21 +197,40 @@ class CameraKeyFrameKey:
 
 
 class LampKeyFrameKey:
+    DTYPE = np.dtype([
+        ('frame_number', '<u4'),
+        ('color', '<f4', (3,)),
+        ('direction', '<f4', (3,)),
+        ])
+    _STRUCT = struct.Struct('<L3f3f')
+
     def __init__(self):
         self.frame_number = 0
         self.color = []
         self.direction = []
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.color = list(struct.unpack('<fff', fin.read(4*3)))
-        self.direction = list(struct.unpack('<fff', fin.read(4*3)))
+        v = fin.unpack(self._STRUCT)
+        self.frame_number = v[0]
+        self.color = list(v[1:4])
+        self.direction = list(v[4:7])
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
         fin.write(struct.pack('<fff', *self.color))
         fin.write(struct.pack('<fff', *self.direction))
 
+    @classmethod
+    def fromRecord(cls, frame_number, color, direction):
+        self = cls()
+        self.frame_number = frame_number
+        self.color = color
+        self.direction = direction
+        return self
+
+    def toRecord(self):
+        return (self.frame_number, tuple(self.color), tuple(self.direction))
+
     def __repr__(self):
         return '<LampKeyFrameKey frame %s, color %s, direction %s>'%(
             str(self.frame_number),
@@ -146,53 +239,221 @@ class LampKeyFrameKey:
             )
 
 
-class _AnimationBase(collections.defaultdict):
-    def __init__(self):
-        collections.defaultdict.__init__(self, list)
+class _KeyFrameList(collections.abc.MutableSequence):
+    """ Keyframes of one track stored as one contiguous NumPy array per field.
+
+    The fields of frameClass().DTYPE are available as attributes, e.g.
+    frame_number or location. The list also behaves like a list of frame
+    key objects, which are created on first access. Once the list is
+    modified, the arrays are rebuilt from the objects on the next access.
+    Key objects can be edited in place, so the rows of created objects are
+    updated from them whenever the arrays are used.
+    """
+    def __init__(self, columns=None):
+        self.__columns = columns
+        self.__keys = [None] * self.__columnLength(columns)
+        self.__has_keys = False # True once a key object was created from the arrays
 
     @staticmethod
     def frameClass():
         raise NotImplementedError
 
-    def load(self, fin):
-        count, = struct.unpack('<L', fin.read(4))
-        for i in range(count):
-            name = _toShiftJisString(struct.unpack('<15s', fin.read(15))[0])
-            cls = self.frameClass()
-            frameKey = cls()
-            frameKey.load(fin)
-            self[name].append(frameKey)
+    @staticmethod
+    def __columnLength(columns):
+        if columns is None:
+            return 0
+        return len(columns['frame_number'])
+
+    def setRecords(self, records):
+        """ Replace the keyframes with a structured array of frameClass().DTYPE. """
+        self.__columns = {i:np.array(records[i]) for i in self.frameClass().DTYPE.names}
+        self.__keys = [None] * len(records)
+        self.__has_keys = False
+
+    def toRecords(self):
+        """ Return the keyframes as a structured array of frameClass().DTYPE. """
+        columns = self.columns()
+        records = np.empty(len(self), self.frameClass().DTYPE)
+        for name, a in columns.items():
+            records[name] = a
+        return records
+
+    def columns(self):
+        frame_class = self.frameClass()
+        if self.__columns is None:
+            records = np.array([k.toRecord() for k in self.__keys], dtype=frame_class.DTYPE)
+            self.__columns = {i:np.ascontiguousarray(records[i]) for i in frame_class.DTYPE.names}
+            self.__has_keys = False
+        elif self.__has_keys:
+            rows = [i for i, k in enumerate(self.__keys) if k is not None]
+            records = np.array([self.__keys[i].toRecord() for i in rows], dtype=frame_class.DTYPE)
+            for name in frame_class.DTYPE.names:
+                column = self.__columns[name]
+                if not column.flags.writeable:
+                    column = self.__columns[name] = column.copy()
+                column[rows] = records[name]
+        return self.__columns
+
+    def __getattr__(self, name):
+        if name in self.frameClass().DTYPE.names:
+            return self.columns()[name]
+        raise AttributeError(name)
+
+    def __materialize(self):
+        if self.__columns is not None and None in self.__keys:
+            self.__has_keys = True
+            fromRecord = self.frameClass().fromRecord
+            columns = [self.__columns[i].tolist() for i in self.frameClass().DTYPE.names]
+            for i, values in enumerate(zip(*columns)):
+                if self.__keys[i] is None:
+                    self.__keys[i] = fromRecord(*values)
+
+    def __modified(self):
+        self.__materialize()
+        self.__columns = None
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        k = self.__keys[index]
+        if k is None:
+            self.__has_keys = True
+            frame_class = self.frameClass()
+            k = self.__keys[index] = frame_class.fromRecord(*[self.__columns[i][index].tolist() for i in frame_class.DTYPE.names])
+        return k
+
+    def __iter__(self):
+        self.__materialize()
+        return iter(self.__keys)
+
+    def __setitem__(self, index, value):
+        self.__modified()
+        self.__keys[index] = value
+
+    def __delitem__(self, index):
+        self.__modified()
+        del self.__keys[index]
+
+    def insert(self, index, value):
+        self.__modified()
+        self.__keys.insert(index, value)
+
+    def append(self, value):
+        self.__modified()
+        self.__keys.append(value)
+
+    def sort(self, key=None, reverse=False):
+        self.__modified()
+        self.__keys.sort(key=key, reverse=reverse)
 
-    def save(self, fin):
-        count = sum([len(i) for i in self.values()])
-        fin.write(struct.pack('<L', count))
-        for name, frameKeys in self.items():
-            name_data = struct.pack('<15s', name.encode('shift_jis'))
-            for frameKey in frameKeys:
-                fin.write(name_data)
-                frameKey.save(fin)
+    def __repr__(self):
+        return '<%s %d keys>'%(type(self).__name__, len(self))
 
 
-class _AnimationListBase(list):
-    def __init__(self):
-        list.__init__(self)
+class BoneKeyFrameList(_KeyFrameList):
+    @staticmethod
+    def frameClass():
+        return BoneFrameKey
+
 
+class ShapeKeyKeyFrameList(_KeyFrameList):
     @staticmethod
     def frameClass():
+        return ShapeKeyFrameKey
+
+
+def _readRecords(fin, dtype):
+    count, = fin.unpack(_COUNT)
+    return fin.read_array(dtype, count)
+
+
+class _AnimationBase(collections.defaultdict):
+    def __init__(self):
+        collections.defaultdict.__init__(self, self.keyFrameListClass())
+
+    @staticmethod
+    def keyFrameListClass():
         raise NotImplementedError
 
+    @classmethod
+    def frameClass(cls):
+        return cls.keyFrameListClass().frameClass()
+
+    @classmethod
+    def recordDType(cls):
+        return np.dtype([('name', 'S15')] + cls.frameClass().DTYPE.descr)
+
     def load(self, fin):
-        count, = struct.unpack('<L', fin.read(4))
-        for i in range(count):
-            cls = self.frameClass()
-            frameKey = cls()
-            frameKey.load(fin)
-            self.append(frameKey)
+        records = _readRecords(fin, self.recordDType())
+        if len(records) == 0:
+            return
+        raw_names, first, inverse = np.unique(records['name'], return_index=True, return_inverse=True)
+
+        # names may differ after the null terminator, so tracks are grouped
+        # by the decoded name in the order they first appear in the file
+        track_ids = {}
+        order = []
+        for i in np.argsort(first, kind='mergesort'):
+            name = _toShiftJisString(raw_names[i])
+            if name not in track_ids:
+                track_ids[name] = len(track_ids)
+                order.append(name)
+        lut = np.empty(len(raw_names), np.intp)
+        for i, raw_name in enumerate(raw_names):
+            lut[i] = track_ids[_toShiftJisString(raw_name)]
+        track_index = lut[inverse.reshape(-1)]
+
+        indices = np.argsort(track_index, kind='mergesort')
+        bounds = np.cumsum(np.bincount(track_index, minlength=len(order)))
+        records = records[indices]
+        frame_names = self.frameClass().DTYPE.names
+        columns = {i:np.ascontiguousarray(records[i]) for i in frame_names}
+        start = 0
+        for name, end in zip(order, bounds.tolist()):
+            keys = self[name]
+            if len(keys) > 0:
+                keys.extend(self.keyFrameListClass()({i:columns[i][start:end] for i in frame_names}))
+            else:
+                self[name] = self.keyFrameListClass()({i:columns[i][start:end] for i in frame_names})
+            start = end
+
+    def save(self, fin):
+        dtype = self.recordDType()
+        sections = []
+        for name, frameKeys in self.items():
+            if not isinstance(frameKeys, _KeyFrameList):
+                keys = self.keyFrameListClass()()
+                keys.extend(frameKeys)
+                frameKeys = keys
+            records = np.empty(len(frameKeys), dtype)
+            records['name'] = name.encode('shift_jis')
+            for field, a in frameKeys.columns().items():
+                records[field] = a
+            sections.append(records)
+        records = np.concatenate(sections) if sections else np.empty(0, dtype)
+        fin.write(struct.pack('<L', len(records)))
+        fin.write(records.tobytes())
+
+
+class _AnimationListBase(_KeyFrameList):
+    def __init__(self, columns=None):
+        _KeyFrameList.__init__(self, columns)
+
+    def load(self, fin):
+        records = _readRecords(fin, self.frameClass().DTYPE)
+        if len(self) > 0:
+            loaded = type(self)()
+            loaded.setRecords(records)
+            self.extend(loaded)
+        else:
+            self.setRecords(records)
 
     def save(self, fin):
         fin.write(struct.pack('<L', len(self)))
-        for frameKey in self:
-            frameKey.save(fin)
+        fin.write(self.toRecords().tobytes())
 
 
 class BoneAnimation(_AnimationBase):
@@ -200,8 +461,8 @@ class BoneAnimation(_AnimationBase):
         _AnimationBase.__init__(self)
 
     @staticmethod
-    def frameClass():
-        return BoneFrameKey
+    def keyFrameListClass():
+        return BoneKeyFrameList
 
 
 class ShapeKeyAnimation(_AnimationBase):
@@ -209,13 +470,13 @@ class ShapeKeyAnimation(_AnimationBase):
         _AnimationBase.__init__(self)
 
     @staticmethod
-    def frameClass():
-        return ShapeKeyFrameKey
+    def keyFrameListClass():
+        return ShapeKeyKeyFrameList
 
 
 class CameraAnimation(_AnimationListBase):
-    def __init__(self):
-        _AnimationListBase.__init__(self)
+    def __init__(self, columns=None):
+        _AnimationListBase.__init__(self, columns)
 
     @staticmethod
     def frameClass():
@@ -223,8 +484,8 @@ class CameraAnimation(_AnimationListBase):
 
 
 class LampAnimation(_AnimationListBase):
-    def __init__(self):
-        _AnimationListBase.__init__(self)
+    def __init__(self, columns=None):
+        _AnimationListBase.__init__(self, columns)
 
     @staticmethod
     def frameClass():
@@ -243,7 +504,7 @@ class File:
     def load(self, **args):
         path = args['filepath']
 
-        with open(path, 'rb') as fin:
+        with MappedFile(path) as fin:
             self.filepath = path
             self.header = Header()
             self.boneAnimation = BoneAnimation()
@@ -263,16 +524,139 @@ class File:
     def save(self, **args):
         path = args.get('filepath', self.filepath)
 
-        header = self.header or Header()
-        boneAnimation = self.boneAnimation or BoneAnimation()
-        shapeKeyAnimation = self.shapeKeyAnimation or ShapeKeyAnimation()
-        cameraAnimation = self.cameraAnimation or CameraAnimation()
-        lampAnimation = self.lampAnimation or LampAnimation()
-
-        with open(path, 'wb') as fin:
-            header.save(fin)
-            boneAnimation.save(fin)
-            shapeKeyAnimation.save(fin)
-            cameraAnimation.save(fin)
-            lampAnimation.save(fin)
-
+        with FileWriter(path, self.header) as writer:
+            for name, frameKeys in (self.boneAnimation or {}).items():
+                writer.writeBoneTrack(name, frameKeys)
+            for name, frameKeys in (self.shapeKeyAnimation or {}).items():
+                writer.writeShapeKeyTrack(name, frameKeys)
+            writer.writeCameraKeys(self.cameraAnimation or [])
+            writer.writeLampKeys(self.lampAnimation or [])
+
+
+class FileWriter:
+    """ Write a vmd file while its keyframes are generated.
+
+    The sections are written in the order of the file: bone, shape key,
+    camera and lamp. The count of a section is reserved when the section
+    begins and patched when it ends, and keys are encoded a chunk at a time,
+    so keyframes do not have to be kept in memory. Sections which are not
+    written are saved empty.
+
+    The file is written to path + '.tmp' and only replaces path when the
+    writer is closed. If the with block raises, the partial file is removed.
+    """
+    CHUNK_SIZE = 4096
+
+    __SECTIONS = (
+        (BoneAnimation.recordDType(), BoneFrameKey.DTYPE),
+        (ShapeKeyAnimation.recordDType(), ShapeKeyFrameKey.DTYPE),
+        (CameraKeyFrameKey.DTYPE, CameraKeyFrameKey.DTYPE),
+        (LampKeyFrameKey.DTYPE, LampKeyFrameKey.DTYPE),
+        )
+
+    def __init__(self, path, header=None):
+        self.__path = path
+        self.__temp_path = path + '.tmp'
+        self.__fout = open(self.__temp_path, 'wb')
+        (header or Header()).save(self.__fout)
+        self.__section = -1
+        self.__count_offset = None
+        self.__count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __endSection(self):
+        if self.__count_offset is not None:
+            end = self.__fout.tell()
+            self.__fout.seek(self.__count_offset)
+            self.__fout.write(_COUNT.pack(self.__count))
+            self.__fout.seek(end)
+            self.__count_offset = None
+
+    def __beginSection(self, section):
+        if section < self.__section:
+            raise ValueError('vmd sections must be written in order')
+        while self.__section < section:
+            self.__endSection()
+            self.__section += 1
+            self.__count_offset = self.__fout.tell()
+            self.__count = 0
+            self.__fout.write(_COUNT.pack(0))
+
+    def __chunks(self, frameKeys, frame_dtype):
+        """ Yield the records of every CHUNK_SIZE keys as a structured array. """
+        if isinstance(frameKeys, _KeyFrameList):
+            yield frameKeys.columns()
+            return
+        chunk = []
+        for k in frameKeys:
+            chunk.append(k.toRecord())
+            if len(chunk) >= self.CHUNK_SIZE:
+                yield np.array(chunk, dtype=frame_dtype)
+                chunk = []
+        if len(chunk) > 0:
+            yield np.array(chunk, dtype=frame_dtype)
+
+    def __writeKeys(self, section, frameKeys, name=None):
+        self.__beginSection(section)
+        dtype, frame_dtype = self.__SECTIONS[section]
+        count = 0
+        name_data = None if name is None else name.encode('shift_jis')
+        for chunk in self.__chunks(frameKeys, frame_dtype):
+            records = np.empty(len(chunk['frame_number']), dtype)
+            if name_data is not None:
+                records['name'] = name_data
+            for field in frame_dtype.names:
+                records[field] = chunk[field]
+            self.__fout.write(records.tobytes())
+            count += len(records)
+        self.__count += count
+        return count
+
+    def writeBoneTrack(self, name, frameKeys):
+        """ Write the BoneFrameKeys of a bone. Returns the number of keys. """
+        return self.__writeKeys(0, frameKeys, name)
+
+    def writeShapeKeyTrack(self, name, frameKeys):
+        """ Write the ShapeKeyFrameKeys of a shape key. Returns the number of keys. """
+        return self.__writeKeys(1, frameKeys, name)
+
+    def writeCameraKeys(self, frameKeys):
+        """ Write CameraKeyFrameKeys. Returns the number of keys. """
+        return self.__writeKeys(2, frameKeys)
+
+    def writeLampKeys(self, frameKeys):
+        """ Write LampKeyFrameKeys. Returns the number of keys. """
+        return self.__writeKeys(3, frameKeys)
+
+    def close(self):
+        """ Finish the sections and move the file to its path. """
+        if self.__fout is None:
+            return
+        try:
+            self.__beginSection(len(self.__SECTIONS) - 1)
+            self.__endSection()
+        except Exception:
+            self.abort()
+            raise
+        self.__fout.close()
+        self.__fout = None
+        os.replace(self.__temp_path, self.__path)
+
+    def abort(self):
+        """ Close and remove the partial file, leaving path untouched. """
+        if self.__fout is None:
+            return
+        self.__fout.close()
+        self.__fout = None
+        try:
+            os.remove(self.__temp_path)
+        except OSError:
+            pass
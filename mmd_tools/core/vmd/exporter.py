@@ -166,14 +166,13 @@ class VMDExporter:
 
 
     def __exportBoneAnimation(self, armObj):
+        """ Yield the name and a generator of the frame keys of each animated bone. """
         if armObj is None:
-            return None
+            return
         animation_data = armObj.animation_data
         if animation_data is None or animation_data.action is None:
             logging.warning('[WARNING] armature "%s" has no animation data', armObj.name)
-            return None
-
-        vmd_bone_anim = vmd.BoneAnimation()
+            return
 
         anim_bones = {}
         rePath = re.compile(r'^pose\.bones\["(.+)"\]\.([a-z_]+)$')
@@ -200,43 +199,47 @@ class VMDExporter:
             elif prop_name == 'rotation_quaternion': # rw, rx, ry, rz
                 bone_curves[3+fcurve.array_index].setFCurve(fcurve)
 
+        key_names = set()
         for bone, bone_curves in anim_bones.items():
             key_name = bone.mmd_bone.name_j or bone.name
-            assert(key_name not in vmd_bone_anim) # VMD bone name collision
-            frame_keys = vmd_bone_anim[key_name]
-
-            converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-            prev_rot = None
-            for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves):
-                key = vmd.BoneFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.location = converter.convert_location([x[0], y[0], z[0]])
-                curr_rot = converter.convert_rotation([rx[0], ry[0], rz[0], rw[0]])
-                if prev_rot is not None:
-                    curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                prev_rot = curr_rot
-                key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
-                #FIXME we can only choose one interpolation from (rw, rx, ry, rz) for bone's rotation
-                ir = self.__pickRotationInterpolation([rw[1], rx[1], ry[1], rz[1]])
-                key.interp = self.__getVMDBoneInterpolation(x[1], z[1], y[1], ir) # x, z, y, q
-                frame_keys.append(key)
-            logging.info('(bone) frames:%5d  name: %s', len(frame_keys), key_name)
-        return vmd_bone_anim
+            assert(key_name not in key_names) # VMD bone name collision
+            key_names.add(key_name)
+            yield key_name, self.__exportBoneFrameKeys(bone, bone_curves, key_name)
+
+    def __exportBoneFrameKeys(self, bone, bone_curves, key_name):
+        converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
+        prev_rot = None
+        count = 0
+        for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves):
+            key = vmd.BoneFrameKey()
+            key.frame_number = frame_number - self.__frame_start
+            key.location = converter.convert_location([x[0], y[0], z[0]])
+            curr_rot = converter.convert_rotation([rx[0], ry[0], rz[0], rw[0]])
+            if prev_rot is not None:
+                curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
+            prev_rot = curr_rot
+            key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
+            #FIXME we can only choose one interpolation from (rw, rx, ry, rz) for bone's rotation
+            ir = self.__pickRotationInterpolation([rw[1], rx[1], ry[1], rz[1]])
+            key.interp = self.__getVMDBoneInterpolation(x[1], z[1], y[1], ir) # x, z, y, q
+            count += 1
+            yield key
+        logging.info('(bone) frames:%5d  name: %s', count, key_name)
 
 
     def __exportMorphAnimation(self, meshObj):
+        """ Yield the name and a generator of the frame keys of each animated shape key. """
         if meshObj is None:
-            return None
+            return
         if meshObj.data.shape_keys is None:
             logging.warning('[WARNING] mesh "%s" has no shape keys', meshObj.name)
-            return None
+            return
         animation_data = meshObj.data.shape_keys.animation_data
         if animation_data is None or animation_data.action is None:
             logging.warning('[WARNING] mesh "%s" has no animation data', meshObj.name)
-            return None
-
-        vmd_morph_anim = vmd.ShapeKeyAnimation()
+            return
 
+        key_names = set()
         rePath = re.compile(r'^key_blocks\["(.+)"\]\.value$')
         for fcurve in animation_data.action.fcurves:
             m = rePath.match(fcurve.data_path)
@@ -249,34 +252,37 @@ class VMDExporter:
                 logging.warning(' * Shape key not found: %s', key_name)
                 continue
 
-            assert(key_name not in vmd_morph_anim)
-            anim = vmd_morph_anim[key_name]
+            assert(key_name not in key_names)
+            key_names.add(key_name)
 
             curve = _FCurve(kb.value)
             curve.setFCurve(fcurve)
+            yield key_name, self.__exportMorphFrameKeys(curve, key_name)
 
-            for frame_number, weight in self.__allFrameKeys([curve]):
-                key = vmd.ShapeKeyFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.weight = weight[0]
-                anim.append(key)
-            logging.info('(mesh) frames:%5d  name: %s', len(anim), key_name)
-        return vmd_morph_anim
+    def __exportMorphFrameKeys(self, curve, key_name):
+        count = 0
+        for frame_number, weight in self.__allFrameKeys([curve]):
+            key = vmd.ShapeKeyFrameKey()
+            key.frame_number = frame_number - self.__frame_start
+            key.weight = weight[0]
+            count += 1
+            yield key
+        logging.info('(mesh) frames:%5d  name: %s', count, key_name)
 
 
     def __exportCameraAnimation(self, cameraObj):
+        """ Yield the frame keys of the camera. """
         if cameraObj is None:
-            return None
+            return
         if not MMDCamera.isMMDCamera(cameraObj):
             logging.warning('[WARNING] camera "%s" is not MMDCamera', cameraObj.name)
-            return None
+            return
 
         cam_rig = MMDCamera(cameraObj)
         mmd_cam = cam_rig.object()
         camera = cam_rig.camera()
 
-        vmd_cam_anim = vmd.CameraAnimation()
-
+        count = 0
         data = list(mmd_cam.location) + list(mmd_cam.rotation_euler)
         data.append(mmd_cam.mmd_camera.angle)
         data.append(mmd_cam.mmd_camera.is_perspective)
@@ -322,24 +328,24 @@ class VMDExporter:
                 iF[0][0], iF[1][0], iF[0][1], iF[1][1],
                 ]
 
-            vmd_cam_anim.append(key)
-        logging.info('(camera) frames:%5d  name: %s', len(vmd_cam_anim), mmd_cam.name)
-        return vmd_cam_anim
+            count += 1
+            yield key
+        logging.info('(camera) frames:%5d  name: %s', count, mmd_cam.name)
 
 
     def __exportLampAnimation(self, lampObj):
+        """ Yield the frame keys of the lamp. """
         if lampObj is None:
-            return None
+            return
         if not MMDLamp.isMMDLamp(lampObj):
             logging.warning('[WARNING] lamp "%s" is not MMDLamp', lampObj.name)
-            return None
+            return
 
         lamp_rig = MMDLamp(lampObj)
         mmd_lamp = lamp_rig.object()
         lamp = lamp_rig.lamp()
 
-        vmd_lamp_anim = vmd.LampAnimation()
-
+        count = 0
         data = list(lamp.data.color) + list(lamp.location)
         lamp_curves = [_FCurve(i) for i in data] # r, g, b, x, y, z
 
@@ -360,9 +366,9 @@ class VMDExporter:
             key.frame_number = frame_number - self.__frame_start
             key.color = [r[0], g[0], b[0]]
             key.direction = [-x[0], -z[0], -y[0]]
-            vmd_lamp_anim.append(key)
-        logging.info('(lamp) frames:%5d  name: %s', len(vmd_lamp_anim), mmd_lamp.name)
-        return vmd_lamp_anim
+            count += 1
+            yield key
+        logging.info('(lamp) frames:%5d  name: %s', count, mmd_lamp.name)
 
 
     def export(self, **args):
@@ -382,18 +388,18 @@ class VMDExporter:
             self.__bone_converter_cls = vmd.importer.BoneConverterPoseMode
 
         if armature or mesh:
-            vmdFile = vmd.File()
-            vmdFile.header = vmd.Header()
-            vmdFile.header.model_name = args.get('model_name', '')
-            vmdFile.boneAnimation = self.__exportBoneAnimation(armature)
-            vmdFile.shapeKeyAnimation = self.__exportMorphAnimation(mesh)
-            vmdFile.save(filepath=filepath)
+            header = vmd.Header()
+            header.model_name = args.get('model_name', '')
+            with vmd.FileWriter(filepath, header) as writer:
+                for name, frame_keys in self.__exportBoneAnimation(armature):
+                    writer.writeBoneTrack(name, frame_keys)
+                for name, frame_keys in self.__exportMorphAnimation(mesh):
+                    writer.writeShapeKeyTrack(name, frame_keys)
 
         elif camera or lamp:
-            vmdFile = vmd.File()
-            vmdFile.header = vmd.Header()
-            vmdFile.header.model_name = u'カメラ・照明'
-            vmdFile.cameraAnimation = self.__exportCameraAnimation(camera)
-            vmdFile.lampAnimation = self.__exportLampAnimation(lamp)
-            vmdFile.save(filepath=filepath)
+            header = vmd.Header()
+            header.model_name = u'カメラ・照明'
+            with vmd.FileWriter(filepath, header) as writer:
+                writer.writeCameraKeys(self.__exportCameraAnimation(camera))
+                writer.writeLampKeys(self.__exportLampAnimation(lamp))
 
@@ -12,13 +12,17 @@ from bpy.types import OperatorFileListElement
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 
 from mmd_tools import auto_scene_setup
+from mmd_tools import bpyutils
 from mmd_tools.utils import makePmxBoneMap
 from mmd_tools.core.camera import MMDCamera
 from mmd_tools.core.lamp import MMDLamp
+from mmd_tools.core.pipeline import Pipeline
+from mmd_tools.core.profiler import Profiler
 from mmd_tools.translations import DictionaryEnum
 
 import mmd_tools.core.pmd.importer as pmd_importer
 import mmd_tools.core.pmx.importer as pmx_importer
+from mmd_tools.core.pmx.cache import MemoryCache, ModelCache
 import mmd_tools.core.pmx.exporter as pmx_exporter
 import mmd_tools.core.vmd.importer as vmd_importer
 import mmd_tools.core.vmd.exporter as vmd_exporter
@@ -45,6 +49,33 @@ def log_handler(log_level, filepath=None):
     return handler
 
 
+class ProfileReport:
+    """ Profile the import/export of filepath if enabled.
+
+    The report is saved as filepath + suffix and into a text block of the
+    same name, also when the import/export fails.
+    """
+    def __init__(self, enabled, filepath, suffix, trace_memory=False):
+        self.__profiler = Profiler(os.path.basename(filepath), trace_memory) if enabled else None
+        self.__filepath = filepath + suffix
+        self.__text_name = os.path.basename(filepath) + suffix
+
+    def __enter__(self):
+        if self.__profiler:
+            self.__profiler.__enter__()
+        return self.__profiler
+
+    def __exit__(self, type, value, traceback):
+        if self.__profiler is None:
+            return
+        self.__profiler.__exit__(type, value, traceback)
+        try:
+            self.__profiler.save(self.__filepath)
+        except (IOError, OSError) as e:
+            logging.warning(' * Failed to save profile "%s": %s', self.__filepath, e)
+        self.__profiler.saveText(self.__text_name)
+
+
 def _update_types(cls, prop):
     types = cls.types.copy()
 
@@ -147,46 +178,87 @@ class ImportPmx(Operator, ImportHelper):
         description='Create a log file',
         default=False,
         )
+    profile = bpy.props.BoolProperty(
+        name='Create a profile',
+        description='Record the time of each step into a JSON file and a text block',
+        default=False,
+        )
+    profile_memory = bpy.props.BoolProperty(
+        name='Profile memory',
+        description='Also record the memory allocated by each step (much slower, the times are less accurate)',
+        default=False,
+        )
 
     def execute(self, context):
         try:
             self.__translator = DictionaryEnum.get_translator(self.dictionary)
             if self.directory:
-                for f in self.files:
-                    self.filepath = os.path.join(self.directory, f.name)
-                    self._do_execute(context)
+                filepaths = [os.path.join(self.directory, f.name) for f in self.files]
             elif self.filepath:
-                self._do_execute(context)
+                filepaths = [self.filepath]
+            else:
+                filepaths = []
+            logging.getLogger().setLevel(self.log_level)
+            # the next file is loaded and cleaned while the current one is built
+            model_cache = self.__model_cache()
+            with Pipeline(self.__prepare, [self.__import_args(i, model_cache) for i in filepaths]) as pipeline:
+                for args, prepared in pipeline:
+                    self.filepath = args['filepath']
+                    self._do_execute(context, prepared)
         except Exception as e:
             err_msg = traceback.format_exc()
             self.report({'ERROR'}, err_msg)
         return {'FINISHED'}
 
-    def _do_execute(self, context):
+    @staticmethod
+    def __importer_class(filepath):
+        if re.search('\.pmd$', filepath, flags=re.I):
+            return pmd_importer.PMDImporter
+        return pmx_importer.PMXImporter
+
+    @staticmethod
+    def __model_cache():
+        cache_folder = bpyutils.addon_preferences('model_cache_folder', '')
+        if not cache_folder:
+            return None
+        cache_size = bpyutils.addon_preferences('model_cache_size', 1024)
+        return ModelCache(bpy.path.abspath(cache_folder), cache_size*1024*1024)
+
+    def __import_args(self, filepath, model_cache):
+        return dict(
+            filepath=filepath,
+            types=self.types,
+            scale=self.scale,
+            clean_model=self.clean_model,
+            remove_doubles=self.remove_doubles,
+            fix_IK_links=self.fix_IK_links,
+            rename_LR_bones=self.rename_bones,
+            use_underscore=self.use_underscore,
+            translator=self.__translator,
+            use_mipmap=self.use_mipmap,
+            sph_blend_factor=self.sph_blend_factor,
+            spa_blend_factor=self.spa_blend_factor,
+            model_cache=model_cache,
+            )
+
+    def __prepare(self, args):
+        # runs in a worker thread, so it must not touch Blender data
+        return self.__importer_class(args['filepath']).prepare(**args)
+
+    def _do_execute(self, context, prepared=None):
         logger = logging.getLogger()
         logger.setLevel(self.log_level)
         if self.save_log:
             handler = log_handler(self.log_level, filepath=self.filepath + '.mmd_tools.import.log')
             logger.addHandler(handler)
         try:
-            importer_cls = pmx_importer.PMXImporter
-            if re.search('\.pmd$', self.filepath, flags=re.I):
-                importer_cls = pmd_importer.PMDImporter
-
-            importer_cls().execute(
-                filepath=self.filepath,
-                types=self.types,
-                scale=self.scale,
-                clean_model=self.clean_model,
-                remove_doubles=self.remove_doubles,
-                fix_IK_links=self.fix_IK_links,
-                rename_LR_bones=self.rename_bones,
-                use_underscore=self.use_underscore,
-                translator=self.__translator,
-                use_mipmap=self.use_mipmap,
-                sph_blend_factor=self.sph_blend_factor,
-                spa_blend_factor=self.spa_blend_factor,
-                )
+            importer_cls = self.__importer_class(self.filepath)
+            if prepared is not None:
+                args = prepared.result()
+            else:
+                args = self.__import_args(self.filepath, self.__model_cache())
+            with ProfileReport(self.profile, self.filepath, '.mmd_tools.import.profile.json', self.profile_memory):
+                importer_cls().execute(**args)
             self.report({'INFO'}, 'Imported MMD model from "%s"'%self.filepath)
         except Exception as e:
             err_msg = traceback.format_exc()
@@ -416,6 +488,18 @@ class ImportVpd(Operator, ImportHelper):
         return {'FINISHED'}
 
 
+_export_mesh_cache = None
+
+def export_mesh_cache():
+    """ Return the cache of the processed meshes of incremental pmx exports in this session. """
+    global _export_mesh_cache
+    cache_size = bpyutils.addon_preferences('export_cache_size', 256)*1024*1024
+    if _export_mesh_cache is None:
+        _export_mesh_cache = MemoryCache(cache_size)
+    _export_mesh_cache.max_size = cache_size
+    return _export_mesh_cache
+
+
 class ExportPmx(Operator, ExportHelper):
     bl_idname = 'mmd_tools.export_pmx'
     bl_label = 'Export PMX file (.pmx)'
@@ -474,6 +558,21 @@ class ExportPmx(Operator, ExportHelper):
         description='Create a log file',
         default=False,
         )
+    profile = bpy.props.BoolProperty(
+        name='Create a profile',
+        description='Record the time of each step into a JSON file and a text block',
+        default=False,
+        )
+    profile_memory = bpy.props.BoolProperty(
+        name='Profile memory',
+        description='Also record the memory allocated by each step (much slower, the times are less accurate)',
+        default=False,
+        )
+    incremental = bpy.props.BoolProperty(
+        name='Incremental',
+        description='Reuse the meshes of previous exports in this session which did not change',
+        default=False,
+        )
 
     @classmethod
     def poll(cls, context):
@@ -523,19 +622,21 @@ class ExportPmx(Operator, ExportHelper):
             meshes = rig.meshes()
             if self.visible_meshes_only:
                 meshes = (x for x in meshes if x in context.visible_objects)
-            pmx_exporter.export(
-                filepath=self.filepath,
-                scale=self.scale,
-                root=rig.rootObject(),
-                armature=rig.armature(),
-                meshes=meshes,
-                rigid_bodies=rig.rigidBodies(),
-                joints=rig.joints(),
-                copy_textures=self.copy_textures,
-                sort_materials=self.sort_materials,
-                sort_vertices=self.sort_vertices,
-                disable_specular=self.disable_specular,
-                )
+            with ProfileReport(self.profile, self.filepath, '.mmd_tools.export.profile.json', self.profile_memory):
+                pmx_exporter.export(
+                    filepath=self.filepath,
+                    scale=self.scale,
+                    root=rig.rootObject(),
+                    armature=rig.armature(),
+                    meshes=meshes,
+                    rigid_bodies=rig.rigidBodies(),
+                    joints=rig.joints(),
+                    copy_textures=self.copy_textures,
+                    sort_materials=self.sort_materials,
+                    sort_vertices=self.sort_vertices,
+                    disable_specular=self.disable_specular,
+                    mesh_cache=export_mesh_cache() if self.incremental else None,
+                    )
             self.report({'INFO'}, 'Exported MMD model "%s" to "%s"'%(root.name, self.filepath))
         except Exception as e:
             err_msg = traceback.format_exc()
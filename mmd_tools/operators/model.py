@@ -5,6 +5,7 @@ from bpy.types import Operator
 
 from mmd_tools import bpyutils
 from mmd_tools.core.bone import FnBone
+from mmd_tools.core.profiler import Profiler
 from mmd_tools.translations import DictionaryEnum
 import mmd_tools.core.model as mmd_model
 
@@ -28,10 +29,26 @@ class BuildRig(Operator):
     bl_description = 'Translate physics of selected object into format usable by Blender'
     bl_options = {'PRESET'}
 
+    profile = bpy.props.BoolProperty(
+        name='Create a profile',
+        description='Record the time of each step into the text block "mmd_tools.build.profile.json"',
+        default=False,
+        )
+    profile_memory = bpy.props.BoolProperty(
+        name='Profile memory',
+        description='Also record the memory allocated by each step (much slower, the times are less accurate)',
+        default=False,
+        )
+
     def execute(self, context):
         root = mmd_model.Model.findRoot(context.active_object)
         rig = mmd_model.Model(root)
-        rig.build()
+        if self.profile:
+            with Profiler(root.name, self.profile_memory) as profiler:
+                rig.build()
+            profiler.saveText('mmd_tools.build.profile.json')
+        else:
+            rig.build()
         context.scene.objects.active = root
         return {'FINISHED'}
 
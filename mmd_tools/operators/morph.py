@@ -8,7 +8,7 @@ import mmd_tools.core.model as mmd_model
 from mmd_tools import bpyutils
 from mmd_tools import utils
 from mmd_tools.utils import ItemOp, ItemMoveOp
-from mmd_tools.core.material import FnMaterial
+from mmd_tools.core.material import BatchUpdate, FnMaterial
 from mmd_tools.core.exceptions import MaterialNotFoundError, DivisionError
 
 #Util functions
@@ -256,30 +256,31 @@ class CreateWorkMaterial(Operator):
         work_mmd_mat.material_id = -1
 
         # Apply the offsets
-        if mat_data.offset_type == "MULT":
-            diffuse_offset = multiply_vector_components(base_mmd_mat.diffuse_color, mat_data.diffuse_color[0:3])
-            specular_offset = multiply_vector_components(base_mmd_mat.specular_color, mat_data.specular_color)
-            edge_offset = multiply_vector_components(base_mmd_mat.edge_color, mat_data.edge_color)
-            ambient_offset = multiply_vector_components(base_mmd_mat.ambient_color, mat_data.ambient_color)
-            work_mmd_mat.diffuse_color = diffuse_offset
-            work_mmd_mat.alpha *= mat_data.diffuse_color[3]
-            work_mmd_mat.specular_color = specular_offset
-            work_mmd_mat.shininess *= mat_data.shininess
-            work_mmd_mat.ambient_color = ambient_offset
-            work_mmd_mat.edge_color = edge_offset
-            work_mmd_mat.edge_weight *= mat_data.edge_weight
-        elif mat_data.offset_type == "ADD":
-            diffuse_offset = Vector(base_mmd_mat.diffuse_color) + Vector(mat_data.diffuse_color[0:3])
-            specular_offset = Vector(base_mmd_mat.specular_color) + Vector(mat_data.specular_color)
-            edge_offset = Vector(base_mmd_mat.edge_color) + Vector(mat_data.edge_color)
-            ambient_offset = Vector(base_mmd_mat.ambient_color) + Vector(mat_data.ambient_color)
-            work_mmd_mat.diffuse_color = list(diffuse_offset)
-            work_mmd_mat.alpha += mat_data.diffuse_color[3]
-            work_mmd_mat.specular_color = list(specular_offset)
-            work_mmd_mat.shininess += mat_data.shininess
-            work_mmd_mat.ambient_color = list(ambient_offset)
-            work_mmd_mat.edge_color = list(edge_offset)
-            work_mmd_mat.edge_weight += mat_data.edge_weight
+        with BatchUpdate():
+            if mat_data.offset_type == "MULT":
+                diffuse_offset = multiply_vector_components(base_mmd_mat.diffuse_color, mat_data.diffuse_color[0:3])
+                specular_offset = multiply_vector_components(base_mmd_mat.specular_color, mat_data.specular_color)
+                edge_offset = multiply_vector_components(base_mmd_mat.edge_color, mat_data.edge_color)
+                ambient_offset = multiply_vector_components(base_mmd_mat.ambient_color, mat_data.ambient_color)
+                work_mmd_mat.diffuse_color = diffuse_offset
+                work_mmd_mat.alpha *= mat_data.diffuse_color[3]
+                work_mmd_mat.specular_color = specular_offset
+                work_mmd_mat.shininess *= mat_data.shininess
+                work_mmd_mat.ambient_color = ambient_offset
+                work_mmd_mat.edge_color = edge_offset
+                work_mmd_mat.edge_weight *= mat_data.edge_weight
+            elif mat_data.offset_type == "ADD":
+                diffuse_offset = Vector(base_mmd_mat.diffuse_color) + Vector(mat_data.diffuse_color[0:3])
+                specular_offset = Vector(base_mmd_mat.specular_color) + Vector(mat_data.specular_color)
+                edge_offset = Vector(base_mmd_mat.edge_color) + Vector(mat_data.edge_color)
+                ambient_offset = Vector(base_mmd_mat.ambient_color) + Vector(mat_data.ambient_color)
+                work_mmd_mat.diffuse_color = list(diffuse_offset)
+                work_mmd_mat.alpha += mat_data.diffuse_color[3]
+                work_mmd_mat.specular_color = list(specular_offset)
+                work_mmd_mat.shininess += mat_data.shininess
+                work_mmd_mat.ambient_color = list(ambient_offset)
+                work_mmd_mat.edge_color = list(edge_offset)
+                work_mmd_mat.edge_weight += mat_data.edge_weight
 
         return { 'FINISHED' }
 
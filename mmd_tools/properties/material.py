@@ -10,47 +10,51 @@ from mmd_tools.core.model import Model
 from mmd_tools import utils
 
 
+def _updateMaterial(prop, update_name):
+    if not material.BatchUpdate.defer(prop.id_data, update_name):
+        getattr(FnMaterial(prop.id_data), update_name)()
+
 def _updateAmbientColor(prop, context):
-    FnMaterial(prop.id_data).update_ambient_color()
+    _updateMaterial(prop, 'update_ambient_color')
 
 def _updateDiffuseColor(prop, context):
-    FnMaterial(prop.id_data).update_diffuse_color()
+    _updateMaterial(prop, 'update_diffuse_color')
 
 def _updateAlpha(prop, context):
-    FnMaterial(prop.id_data).update_alpha()
+    _updateMaterial(prop, 'update_alpha')
 
 def _updateSpecularColor(prop, context):
-    FnMaterial(prop.id_data).update_specular_color()
+    _updateMaterial(prop, 'update_specular_color')
 
 def _updateShininess(prop, context):
-    FnMaterial(prop.id_data).update_shininess()
+    _updateMaterial(prop, 'update_shininess')
 
 def _updateIsDoubleSided(prop, context):
-    FnMaterial(prop.id_data).update_is_double_sided()
+    _updateMaterial(prop, 'update_is_double_sided')
 
 def _updateSphereMapType(prop, context):
-    FnMaterial(prop.id_data).update_sphere_texture_type()
+    _updateMaterial(prop, 'update_sphere_texture_type')
 
 def _updateToonTexture(prop, context):
-    FnMaterial(prop.id_data).update_toon_texture()
+    _updateMaterial(prop, 'update_toon_texture')
 
 def _updateDropShadow(prop, context):
-    FnMaterial(prop.id_data).update_drop_shadow()
+    _updateMaterial(prop, 'update_drop_shadow')
 
 def _updateSelfShadowMap(prop, context):
-    FnMaterial(prop.id_data).update_self_shadow_map()
+    _updateMaterial(prop, 'update_self_shadow_map')
 
 def _updateSelfShadow(prop, context):
-    FnMaterial(prop.id_data).update_self_shadow()
+    _updateMaterial(prop, 'update_self_shadow')
 
 def _updateEnabledToonEdge(prop, context):
-    FnMaterial(prop.id_data).update_enabled_toon_edge()
+    _updateMaterial(prop, 'update_enabled_toon_edge')
 
 def _updateEdgeColor(prop, context):
-    FnMaterial(prop.id_data).update_edge_color()
+    _updateMaterial(prop, 'update_edge_color')
 
 def _updateEdgeWeight(prop, context):
-    FnMaterial(prop.id_data).update_edge_weight()
+    _updateMaterial(prop, 'update_edge_weight')
 
 def _getNameJ(prop):
     return prop.get('name_j', '')
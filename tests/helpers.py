@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from mmd_tools.core import pmx
+
+
+def make_model(count=6, morphs=False):
+    """ Return a small pmx.Model with count vertices, one material and one bone.
+
+    With morphs, a vertex morph, a bone morph and a display item of the
+    vertex morph are added.
+    """
+    model = pmx.Model()
+    model.name = model.name_e = 'model'
+    for i in range(count):
+        v = pmx.Vertex()
+        v.co = [float(i), 0.5*i, -1.0*i]
+        v.normal = [0.0, 1.0, 0.0]
+        v.uv = [0.1*i, 0.2]
+        w = v.weight = pmx.BoneWeight()
+        w.type = pmx.BoneWeight.BDEF1
+        w.bones = [0]
+        model.vertices.append(v)
+    model.faces = [[i, i + 1, i + 2] for i in range(0, count - 2, 3)]
+    m = pmx.Material()
+    m.name = m.name_e = 'material'
+    m.diffuse = [1.0, 1.0, 1.0, 1.0]
+    m.specular = [0.0, 0.0, 0.0]
+    m.ambient = [0.5, 0.5, 0.5]
+    m.edge_color = [0.0, 0.0, 0.0, 1.0]
+    m.vertex_count = len(model.faces) * 3
+    model.materials.append(m)
+    b = pmx.Bone()
+    b.name = b.name_e = 'bone'
+    b.location = [0.0, 0.0, 0.0]
+    model.bones.append(b)
+    if not morphs:
+        return model
+
+    m = pmx.VertexMorph(name='vertex', name_e='vertex', category=1)
+    for i in (1, 4):
+        o = pmx.VertexMorphOffset()
+        o.index = i
+        o.offset = [0.5, 0.0, -0.25*i]
+        m.offsets.append(o)
+    model.morphs.append(m)
+    m = pmx.BoneMorph(name='bone', name_e='bone', category=4)
+    o = pmx.BoneMorphOffset()
+    o.index = 0
+    o.location_offset = [1.0, 2.0, 3.0]
+    o.rotation_offset = [0.0, 0.0, 0.0, 1.0]
+    m.offsets.append(o)
+    model.morphs.append(m)
+    model.display[1].data.append((1, 0))
+    return model
+
+
+def _vertex(i, weight_type, additional_uvs):
+    v = pmx.Vertex()
+    v.co = [0.5*i, 1.0, -0.25*i]
+    v.normal = [0.0, 0.0, 1.0]
+    v.uv = [0.125*i, 0.5]
+    v.additional_uvs = [[0.25*j, 0.5, 0.75, 1.0] for j in range(additional_uvs)]
+    v.edge_scale = 0.5 + i % 2
+    w = v.weight = pmx.BoneWeight()
+    w.type = weight_type
+    if weight_type == pmx.BoneWeight.BDEF1:
+        w.bones = [i % 3]
+        w.weights = []
+    elif weight_type == pmx.BoneWeight.BDEF2:
+        w.bones = [0, 1]
+        w.weights = [0.25]
+    elif weight_type == pmx.BoneWeight.BDEF4:
+        w.bones = [0, 1, 2, -1]
+        w.weights = [0.5, 0.25, 0.25, 0.0]
+    else:
+        w.bones = [1, 2]
+        w.weights = pmx.BoneWeightSDEF(0.75, [0.0, 1.0, 0.0], [0.5, 1.0, 0.0], [-0.5, 1.0, 0.0])
+    return v
+
+def make_full_model(additional_uvs=2):
+    """ Return a model which uses every kind of record of the format. """
+    model = pmx.Model()
+    model.name = 'ラウンドトリップ'
+    model.name_e = 'round trip'
+    model.comment = 'コメント'
+    model.comment_e = 'comment'
+
+    weight_types = (pmx.BoneWeight.BDEF1, pmx.BoneWeight.BDEF2, pmx.BoneWeight.BDEF4, pmx.BoneWeight.SDEF)
+    model.vertices = [_vertex(i, weight_types[i % 4], additional_uvs) for i in range(12)]
+    model.faces = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 11]]
+
+    for path in ('tex.png', 'sphere.spa', 'toon.bmp'):
+        t = pmx.Texture()
+        t.path = path
+        model.textures.append(t)
+
+    for i in range(2):
+        m = pmx.Material()
+        m.name = '材質%d'%i
+        m.name_e = 'material%d'%i
+        m.diffuse = [1.0, 0.5, 0.25, 1.0]
+        m.specular = [0.125, 0.125, 0.125]
+        m.shininess = 5.0
+        m.ambient = [0.5, 0.5, 0.5]
+        m.is_double_sided = bool(i)
+        m.enabled_toon_edge = True
+        m.edge_color = [0.0, 0.0, 0.0, 1.0]
+        m.edge_size = 1.5
+        m.texture = 0
+        m.sphere_texture = 1 if i else -1
+        m.sphere_texture_mode = 2 if i else 0
+        m.is_shared_toon_texture = not i
+        m.toon_texture = 2 if i else 3
+        m.comment = 'memo'
+        m.vertex_count = 6
+        model.materials.append(m)
+
+    for i in range(4):
+        b = pmx.Bone()
+        b.name = 'ボーン%d'%i
+        b.name_e = 'bone%d'%i
+        b.location = [0.0, float(i), 0.0]
+        b.parent = i - 1 if i else None
+        b.displayConnection = i + 1 if i < 3 else [0.0, 1.0, 0.0]
+        model.bones.append(b)
+    b = model.bones[1]
+    b.hasAdditionalRotate = True
+    b.hasAdditionalLocation = True
+    b.additionalTransform = (0, 0.5)
+    b.axis = [1.0, 0.0, 0.0]
+    b = model.bones[2]
+    b.localCoordinate = pmx.Coordinate([1.0, 0.0, 0.0], [0.0, 0.0, 1.0])
+    b.externalTransKey = 7
+    b.transAfterPhis = True
+    b.transform_order = 1
+    b = model.bones[3]
+    b.isIK = True
+    b.target = 2
+    b.loopCount = 40
+    b.rotationConstraint = 0.5
+    for target, limited in ((1, True), (0, False)):
+        link = pmx.IKLink()
+        link.target = target
+        if limited:
+            link.minimumAngle = [-1.0, 0.0, 0.0]
+            link.maximumAngle = [-0.5, 0.0, 0.0]
+        b.ik_links.append(link)
+
+    m = pmx.VertexMorph('頂点', 'vertex', 1)
+    for i in (1, 5, 9):
+        o = pmx.VertexMorphOffset()
+        o.index = i
+        o.offset = [0.0, 0.25*i, 0.0]
+        m.offsets.append(o)
+    model.morphs.append(m)
+    m = pmx.UVMorph('UV', 'uv', 4, type_index=4)
+    for i in (0, 2):
+        o = pmx.UVMorphOffset()
+        o.index = i
+        o.offset = [0.5, 0.0, 0.0, 0.25]
+        m.offsets.append(o)
+    model.morphs.append(m)
+    m = pmx.BoneMorph('ボーン', 'bone', 2)
+    o = pmx.BoneMorphOffset()
+    o.index = 1
+    o.location_offset = [0.0, 1.0, 0.0]
+    o.rotation_offset = [0.0, 0.0, 0.0, 1.0]
+    m.offsets.append(o)
+    model.morphs.append(m)
+    m = pmx.MaterialMorph('材質', 'material', 3)
+    o = pmx.MaterialMorphOffset()
+    o.index = 1
+    o.offset_type = pmx.MaterialMorphOffset.TYPE_ADD
+    o.diffuse_offset = [0.0, 0.0, 0.0, -1.0]
+    o.specular_offset = [0.0, 0.0, 0.0]
+    o.shininess_offset = 0.0
+    o.ambient_offset = [0.0, 0.0, 0.0]
+    o.edge_color_offset = [0.0, 0.0, 0.0, 0.0]
+    o.edge_size_offset = 0.0
+    o.texture_factor = [0.0, 0.0, 0.0, 0.0]
+    o.sphere_texture_factor = [0.0, 0.0, 0.0, 0.0]
+    o.toon_texture_factor = [0.0, 0.0, 0.0, 0.0]
+    m.offsets.append(o)
+    model.morphs.append(m)
+    m = pmx.GroupMorph('グループ', 'group', 4)
+    for i in range(2):
+        o = pmx.GroupMorphOffset()
+        o.morph = i
+        o.factor = 0.5
+        m.offsets.append(o)
+    model.morphs.append(m)
+
+    model.display[0].data.append((0, 0))
+    model.display[1].data.extend((1, i) for i in range(len(model.morphs)))
+    d = pmx.Display()
+    d.name = d.name_e = 'frame'
+    d.data = [(0, 1), (0, 2)]
+    model.display.append(d)
+
+    for i in range(2):
+        r = pmx.Rigid()
+        r.name = '剛体%d'%i
+        r.name_e = 'rigid%d'%i
+        r.bone = i if i else None
+        r.collision_group_number = i
+        r.collision_group_mask = 0xfffe
+        r.type = pmx.Rigid.TYPE_CAPSULE
+        r.size = [0.5, 1.0, 0.0]
+        r.location = [0.0, float(i), 0.0]
+        r.rotation = [0.0, 0.0, 0.5]
+        r.mass = 2.0
+        r.velocity_attenuation = 0.5
+        r.rotation_attenuation = 0.5
+        r.bounce = 0.0
+        r.friction = 0.5
+        r.mode = i
+        model.rigids.append(r)
+
+    j = pmx.Joint()
+    j.name = 'ジョイント'
+    j.name_e = 'joint'
+    j.src_rigid = 0
+    j.dest_rigid = 1
+    j.location = [0.0, 0.5, 0.0]
+    j.rotation = [0.0, 0.0, 0.0]
+    j.minimum_location = [0.0, 0.0, 0.0]
+    j.maximum_location = [0.0, 0.0, 0.0]
+    j.minimum_rotation = [-0.5, -0.5, -0.5]
+    j.maximum_rotation = [0.5, 0.5, 0.5]
+    j.spring_constant = [0.0, 0.0, 0.0]
+    j.spring_rotation_constant = [10.0, 10.0, 10.0]
+    model.joints.append(j)
+    return model
+
+
+class TempDirTestCase(unittest.TestCase):
+    """ A test case with a temporary folder, which is removed after each test. """
+
+    def setUp(self):
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def temp_path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def write_file(self, name, data):
+        """ Write data to a file of the temporary folder and return its path. """
+        filepath = self.temp_path(name)
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        return filepath
+
+    def read_file(self, filepath):
+        with open(filepath, 'rb') as f:
+            return f.read()
+
+    def save_pmx(self, model, name, **kwargs):
+        """ Save model to a file of the temporary folder and return its path and bytes. """
+        filepath = self.temp_path(name)
+        pmx.save(filepath, model, **kwargs)
+        return filepath, self.read_file(filepath)
+
+    def reload_pmx(self, model, name):
+        """ Save model and load the file again. """
+        return pmx.load(self.save_pmx(model, name)[0])
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from helpers import TempDirTestCase, make_model
+from mmd_tools.core import batch
+from mmd_tools.core import pmx
+
+
+class TestBatch(TempDirTestCase):
+
+    def __files(self):
+        filepath, data = self.save_pmx(make_model(count=12), 'ok.pmx')
+        # the file ends before the last face
+        truncated = self.write_file('truncated.pmx', data[:data.index(bytes([11, 10, 9]))])
+        invalid = self.write_file('invalid.pmx', b'not a model')
+        return [filepath, truncated, invalid]
+
+    def __check(self, results, keep_models):
+        ok, truncated, invalid = results
+        names = ('ok.pmx', 'truncated.pmx', 'invalid.pmx')
+        self.assertEqual([r.path for r in results], [self.temp_path(i) for i in names])
+
+        self.assertTrue(ok.ok)
+        self.assertEqual(ok.errors, [])
+        self.assertEqual(list(ok.counts.items()), [('vertices', 12), ('faces', 4), ('materials', 1), ('bones', 1),
+                                                   ('morphs', 0), ('rigids', 0), ('joints', 0)])
+
+        self.assertTrue(truncated.loaded)
+        self.assertFalse(truncated.ok)
+        self.assertEqual(len(truncated.errors), 1)
+        self.assertIn('Corrupted file', truncated.errors[0])
+        self.assertEqual((truncated.counts['vertices'], truncated.counts['faces'], truncated.counts['materials']), (12, 3, 0))
+
+        self.assertFalse(invalid.loaded)
+        self.assertFalse(invalid.ok)
+        self.assertIn('Failed to load', invalid.errors[-1])
+        self.assertEqual(len(invalid.counts), 0)
+        self.assertIsNone(invalid.model)
+
+        if keep_models:
+            self.assertIsInstance(ok.model, pmx.Model)
+            self.assertEqual([list(f) for f in ok.model.faces], [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 11]])
+            self.assertEqual(len(truncated.model.faces), 3)
+        else:
+            self.assertIsNone(ok.model)
+            self.assertIsNone(truncated.model)
+
+    def test_load(self):
+        paths = self.__files()
+        for max_workers in (1, 2):
+            for keep_models in (True, False):
+                with self.subTest(max_workers=max_workers, keep_models=keep_models):
+                    self.__check(batch.load(paths, max_workers, keep_models=keep_models), keep_models)
+
+    def test_find_files(self):
+        os.makedirs(self.temp_path(os.path.join('models', 'b')))
+        for name in ('b/2.PMD', 'b/1.pmx', 'a.pmx', 'readme.txt'):
+            self.write_file(os.path.join('models', name), b'')
+        single = self.write_file('single.vmd', b'')
+        files = list(batch.find_files([self.temp_path('models'), single]))
+        expected = [self.temp_path(os.path.join('models', *i.split('/'))) for i in ('a.pmx', 'b/1.pmx', 'b/2.PMD')]
+        self.assertEqual(files, expected + [single])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import unittest
+
+from mmd_tools.core.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_max_pending(self):
+        pulled = []
+        def _items():
+            for i in range(6):
+                pulled.append(i)
+                yield i
+
+        for max_pending, max_workers in ((1, 1), (2, 2), (3, 1)):
+            del pulled[:]
+            results = []
+            with Pipeline(lambda i: i * 10, _items(), max_pending, max_workers) as pipeline:
+                for item, prepared in pipeline:
+                    # the current item and at most max_pending items after it
+                    self.assertEqual(len(pulled), min(6, item + 1 + max_pending))
+                    results.append((item, prepared.result()))
+            self.assertEqual(results, [(i, i * 10) for i in range(6)])
+
+    def test_log_records_replayed_in_order(self):
+        def _prepare(i):
+            logging.info('prepare %d', i)
+            logging.warning('prepared %d', i)
+            return i
+
+        with self.assertLogs(level='INFO') as logs:
+            with Pipeline(_prepare, range(4), max_pending=2, max_workers=2) as pipeline:
+                for item, prepared in pipeline:
+                    logging.info('build %d', prepared.result())
+        expected = []
+        for i in range(4):
+            expected += ['INFO:root:prepare %d'%i, 'WARNING:root:prepared %d'%i, 'INFO:root:build %d'%i]
+        self.assertEqual(logs.output, expected)
+
+    def test_exception(self):
+        def _prepare(i):
+            logging.error('failed %d', i)
+            if i == 1:
+                raise ValueError('item %d'%i)
+            return i
+
+        results = []
+        with self.assertLogs(level='ERROR') as logs:
+            with Pipeline(_prepare, range(3), max_pending=2) as pipeline:
+                for item, prepared in pipeline:
+                    try:
+                        results.append(prepared.result())
+                    except ValueError as e:
+                        results.append(str(e))
+        self.assertEqual(results, [0, 'item 1', 2])
+        self.assertEqual(logs.output, ['ERROR:root:failed %d'%i for i in range(3)])
+
+    def test_exit_cancels_pending_items(self):
+        started = [threading.Event() for i in range(6)]
+        release = threading.Event()
+        def _prepare(i):
+            started[i].set()
+            if i == 1:
+                release.wait(5)
+            return i
+
+        filters = list(logging.getLogger().filters)
+        with Pipeline(_prepare, range(6), max_pending=3, max_workers=1) as pipeline:
+            for item, prepared in pipeline:
+                self.assertEqual(prepared.result(), 0)
+                # items 2 and 3 wait for the only worker, which is busy with item 1
+                self.assertTrue(started[1].wait(5))
+                threading.Timer(0.1, release.set).start()
+                break
+        self.assertEqual([i for i, e in enumerate(started) if e.is_set()], [0, 1])
+        self.assertEqual(logging.getLogger().filters, filters)
+
+    def test_without_with_statement(self):
+        with self.assertRaises(RuntimeError):
+            for item, prepared in Pipeline(lambda i: i, range(2)):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import unittest
+
+from helpers import TempDirTestCase
+from mmd_tools.core import pmd
+
+
+def _str(size, text):
+    data = text.encode('shift_jis')
+    return data + b'\0' * (size - len(data))
+
+def _pmd_bytes(model):
+    """ Return the bytes of a pmd file of a pmd.Model, packed with struct. """
+    data = [b'Pmd', struct.pack('<f', 1.0), _str(20, model.name), _str(256, model.comment)]
+    data.append(struct.pack('<I', len(model.vertices)))
+    data.append(pmd.Vertex.toRecords(model.vertices).tobytes())
+    data.append(struct.pack('<I', len(model.faces) * 3))
+    for f in model.faces:
+        data.append(struct.pack('<3H', *reversed(f)))
+    data.append(struct.pack('<I', len(model.materials)))
+    for m in model.materials:
+        path = '*'.join(i for i in (m.texture_path, m.sphere_path) if i)
+        data.append(struct.pack('<4ff3f3fbBI', *(m.diffuse + [m.shininess] + m.specular + m.ambient +
+                                                [m.toon_index, m.edge_flag, m.vertex_count])))
+        data.append(_str(20, path))
+    data.append(struct.pack('<H', len(model.bones)))
+    for b in model.bones:
+        data.append(_str(20, b.name))
+        data.append(struct.pack('<HHB', b.parent & 0xffff, b.tail_bone & 0xffff, b.type))
+        data.append(struct.pack('<h' if b.type == 9 else '<H', b.ik_bone))
+        data.append(struct.pack('<3f', *b.position))
+    data.append(struct.pack('<H', len(model.iks)))
+    for ik in model.iks:
+        data.append(struct.pack('<HHBHf', ik.bone, ik.target_bone, ik.ik_chain, ik.iterations, ik.control_weight))
+        data.append(struct.pack('<%dH'%ik.ik_chain, *ik.ik_child_bones))
+    data.append(struct.pack('<H', len(model.morphs)))
+    for m in model.morphs:
+        data.append(_str(20, m.name))
+        data.append(struct.pack('<IB', len(m.data), m.type))
+        data.append(pmd.MorphData.toRecords(m.data).tobytes())
+    data.append(struct.pack('<B', len(model.facial_disp_morphs)))
+    data.append(struct.pack('<%dH'%len(model.facial_disp_morphs), *model.facial_disp_morphs))
+    names = list(model.bone_disp_lists.keys())
+    data.append(struct.pack('<B', len(names)))
+    data.extend(_str(50, i) for i in names)
+    items = [(b, names.index(k) + 1) for k, v in model.bone_disp_lists.items() for b in v]
+    data.append(struct.pack('<I', len(items)))
+    data.extend(struct.pack('<HB', *i) for i in items)
+
+    data.append(struct.pack('<B', 1))
+    data.append(_str(20, model.name_e))
+    data.append(_str(256, model.comment_e))
+    data.extend(_str(20, b.name_e) for b in model.bones)
+    data.extend(_str(20, m.name_e) for m in model.morphs[1:])
+    data.extend(_str(50, i) for i in model.bone_disp_names[1])
+    data.extend(_str(100, i) for i in model.toon_textures)
+
+    data.append(struct.pack('<I', len(model.rigid_bodies)))
+    for r in model.rigid_bodies:
+        data.append(_str(20, r.name))
+        data.append(struct.pack('<HBHB', r.bone & 0xffff, r.collision_group_number, r.collision_group_mask, r.type))
+        data.append(struct.pack('<9f5fB', *(r.size + r.location + r.rotation + [r.mass, r.velocity_attenuation,
+                                          r.rotation_attenuation, r.bounce, r.friction, r.mode])))
+    data.append(struct.pack('<I', len(model.joints)))
+    for j in model.joints:
+        data.append(_str(20, j.name))
+        data.append(struct.pack('<II', j.src_rigid, j.dest_rigid))
+        data.append(struct.pack('<24f', *(j.location + j.rotation + j.minimum_location + j.maximum_location +
+                                          j.minimum_rotation + j.maximum_rotation + j.spring_constant +
+                                          j.spring_rotation_constant)))
+    return b''.join(data)
+
+def _make_model():
+    model = pmd.Model()
+    model.name = 'モデル'
+    model.name_e = 'model'
+    model.comment = 'コメント'
+    model.comment_e = 'comment'
+    for i in range(6):
+        v = pmd.Vertex()
+        v.position = [0.5*i, 1.0, 0.0]
+        v.normal = [0.0, 0.0, -1.0]
+        v.uv = [0.25*i, 0.5]
+        v.bones = [0, i % 3]
+        v.weight = 100 - 10*i
+        v.enable_edge = i % 2
+        model.vertices.append(v)
+    model.faces = [(0, 1, 2), (3, 4, 5)]
+    for texture, sphere in (('tex.png', 'sphere.spa'), ('', '')):
+        m = pmd.Material()
+        m.diffuse = [1.0, 0.5, 0.25, 1.0]
+        m.shininess = 5.0
+        m.specular = [0.125, 0.125, 0.125]
+        m.ambient = [0.5, 0.5, 0.5]
+        m.toon_index = 2
+        m.edge_flag = 1
+        m.vertex_count = 3
+        m.texture_path = texture
+        m.sphere_path = sphere
+        m.sphere_mode = 2 if sphere else 1
+        model.materials.append(m)
+    model.bones = [] # not set by Model()
+    for i, (bone_type, ik_bone) in enumerate(((0, 0), (0, 0), (2, 0), (9, -1))):
+        b = pmd.Bone()
+        b.name = 'ボーン%d'%i
+        b.name_e = 'bone%d'%i
+        b.parent = i - 1
+        b.tail_bone = i + 1 if i < 3 else -1
+        b.type = bone_type
+        b.ik_bone = ik_bone
+        b.position = [0.0, float(i), 0.0]
+        model.bones.append(b)
+    ik = pmd.IK()
+    ik.bone = 2
+    ik.target_bone = 1
+    ik.ik_chain = 1
+    ik.iterations = 15
+    ik.control_weight = 0.5
+    ik.ik_child_bones = [0]
+    model.iks.append(ik)
+    for name, name_e, morph_type, indices in (('base', '', 0, (1, 4)), ('まばたき', 'blink', 1, (0, 1))):
+        m = pmd.VertexMorph()
+        m.name = name
+        m.name_e = name_e
+        m.type = morph_type
+        for index in indices:
+            d = pmd.MorphData()
+            d.index = index
+            d.offset = [0.0, 0.25*index, 0.0]
+            m.data.append(d)
+        model.morphs.append(m)
+    model.facial_disp_morphs = [1]
+    model.bone_disp_lists['センター'] = [0, 1]
+    model.bone_disp_lists['足'] = [2]
+    model.bone_disp_names = [['センター', '足'], ['center', 'legs']]
+    model.toon_textures = ['toon%02d.bmp'%(i + 1) for i in range(10)]
+    for i in range(2):
+        r = pmd.RigidBody()
+        r.name = '剛体%d'%i
+        r.bone = i if i else -1
+        r.collision_group_number = i
+        r.collision_group_mask = 0xfffe
+        r.type = 2
+        r.size = [0.5, 1.0, 0.0]
+        r.location = [0.0, float(i), 0.0]
+        r.rotation = [0.0, 0.0, 0.5]
+        r.mass = 2.0
+        r.velocity_attenuation = 0.5
+        r.rotation_attenuation = 0.5
+        r.bounce = 0.0
+        r.friction = 0.5
+        r.mode = i
+        model.rigid_bodies.append(r)
+    j = pmd.Joint()
+    j.name = 'ジョイント'
+    j.src_rigid = 0
+    j.dest_rigid = 1
+    j.location = [0.0, 0.5, 0.0]
+    j.rotation = [0.0, 0.0, 0.0]
+    j.minimum_location = [0.0, 0.0, 0.0]
+    j.maximum_location = [0.0, 0.0, 0.0]
+    j.minimum_rotation = [-0.5, -0.5, -0.5]
+    j.maximum_rotation = [0.5, 0.5, 0.5]
+    j.spring_constant = [0.0, 0.0, 0.0]
+    j.spring_rotation_constant = [10.0, 10.0, 10.0]
+    model.joints.append(j)
+    return model
+
+
+class TestPMD(TempDirTestCase):
+    """ pmd files can only be loaded, so the loaded models are packed again by _pmd_bytes(). """
+
+    def __load(self, data):
+        return pmd.load(self.write_file('model.pmd', data))
+
+    def test_round_trip(self):
+        data = _pmd_bytes(_make_model())
+        self.assertEqual(_pmd_bytes(self.__load(data)), data)
+
+    def test_loaded_values(self):
+        model = self.__load(_pmd_bytes(_make_model()))
+        self.assertEqual(model.name, 'モデル')
+        self.assertEqual(len(model.vertices), 6)
+        self.assertEqual(model.vertices[5].position, [2.5, 1.0, 0.0])
+        self.assertEqual(model.vertices[5].weight, 50)
+        self.assertEqual(model.faces, [(0, 1, 2), (3, 4, 5)])
+        self.assertEqual((model.materials[0].texture_path, model.materials[0].sphere_path), ('tex.png', 'sphere.spa'))
+        self.assertEqual(model.materials[0].sphere_mode, 2)
+        self.assertEqual([b.parent for b in model.bones], [-1, 0, 1, 2])
+        self.assertEqual(model.bones[3].ik_bone, -1)
+        self.assertEqual([(d.index, d.offset) for d in model.morphs[1].data], [(0, [0.0, 0.0, 0.0]), (1, [0.0, 0.25, 0.0])])
+        self.assertEqual(model.morphs[1].name_e, 'blink')
+        self.assertEqual(list(model.bone_disp_lists.items()), [('センター', [0, 1]), ('足', [2])])
+        self.assertEqual(model.rigid_bodies[0].bone, -1)
+        self.assertEqual(model.joints[0].dest_rigid, 1)
+
+    def test_truncated_file(self):
+        """ The records before the end of a truncated file are kept, like the records of a corrupted file. """
+        data = _pmd_bytes(_make_model())
+        with pmd.FileReadStream(self.write_file('source.pmd', data)) as fs:
+            pmd.Header().load(fs)
+            header_size = fs.tell()
+        faces_end = header_size + 4 + 6*pmd.Vertex.DTYPE.itemsize + 4 + 2*6
+        vertices, faces = [], []
+        for size in range(header_size, faces_end + 1):
+            with self.assertLogs(level='ERROR'):
+                model = self.__load(data[:size])
+            vertices.append([v.position for v in model.vertices])
+            faces.append(model.faces)
+
+        expected = _make_model()
+        expected_vertices = [v.position for v in expected.vertices]
+        # every number of complete records is loaded from some size
+        self.assertEqual(sorted(set(len(i) for i in vertices)), list(range(7)))
+        self.assertEqual(sorted(set(len(i) for i in faces)), list(range(3)))
+        for i, j in zip(vertices, faces):
+            self.assertEqual(i, expected_vertices[:len(i)])
+            self.assertEqual(j, expected.faces[:len(j)])
+            self.assertTrue(len(j) == 0 or len(i) == 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from helpers import TempDirTestCase, make_model
+from mmd_tools.core.pmx import bulk
+from mmd_tools.core.pmx.cleaner import PMXCleaner
+
+
+class TestVertexList(TempDirTestCase):
+
+    def test_vertex_list(self):
+        model = self.reload_pmx(make_model(), 'list.pmx')
+        self.assertIsInstance(model.vertices, bulk.VertexList)
+        self.assertIsNotNone(model.vertices.data())
+        self.assertEqual(len(model.vertices), 6)
+
+    def test_edited_vertices_in_vertex_data(self):
+        model = self.reload_pmx(make_model(), 'edit.pmx')
+        model.vertices[4].co = [7.0, 8.0, 9.0]
+        self.assertIsNone(model.vertices.data())
+        data = bulk.vertex_data(model.vertices)
+        self.assertEqual(data.co[4].tolist(), [7.0, 8.0, 9.0])
+        self.assertEqual(data.co[1].tolist(), [1.0, 0.5, -1.0])
+
+    def test_edited_vertices_saved(self):
+        model = self.reload_pmx(make_model(), 'save.pmx')
+        model.vertices[2].co = [7.0, 8.0, 9.0]
+        model.vertices[2].uv = [0.25, 0.75]
+        result = self.reload_pmx(model, 'save2.pmx')
+        self.assertEqual(list(result.vertices[2].co), [7.0, 8.0, 9.0])
+        self.assertEqual(list(result.vertices[2].uv), [0.25, 0.75])
+        self.assertEqual(list(result.vertices[3].co), [3.0, 1.5, -3.0])
+
+    def test_edited_vertices_cleaned(self):
+        model = self.reload_pmx(make_model(), 'clean.pmx')
+        model.vertices[4].co = list(model.vertices[1].co)
+        vertex_map = PMXCleaner.remove_doubles(model, mesh_only=True)
+        self.assertIsNotNone(vertex_map)
+        self.assertEqual(vertex_map[4][0], 1)
+        self.assertEqual(vertex_map[1][0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import unittest
+
+import numpy as np
+
+from helpers import TempDirTestCase, make_model
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import cache
+
+
+class TestModelCache(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.__cache = cache.ModelCache(self.temp_path('cache'))
+
+    def __source(self):
+        return self.save_pmx(make_model(morphs=True), 'source.pmx')[0]
+
+    def test_round_trip(self):
+        model = pmx.load(self.__source())
+        key = self.__cache.key(model.filepath, (True, True, False))
+        self.assertIsNone(self.__cache.load(key))
+        self.__cache.save(key, model, [(0, 0), (1, 0)])
+        cached, vertex_map = self.__cache.load(key)
+        self.assertEqual(vertex_map, [(0, 0), (1, 0)])
+        self.assertIsInstance(cached.header, pmx.Header)
+        self.assertIsInstance(cached.morphs[0], pmx.VertexMorph)
+        self.assertEqual([o.index for o in cached.morphs[0].offsets], [1, 4])
+        self.assertEqual(self.save_pmx(cached, 'cached.pmx')[1], self.save_pmx(model, 'model.pmx')[1])
+
+    def test_key(self):
+        filepath = self.__source()
+        key = self.__cache.key(filepath, (True,))
+        self.assertEqual(key, self.__cache.key(filepath, (True,)))
+        self.assertNotEqual(key, self.__cache.key(filepath, (False,)))
+        self.assertEqual(len(cache.ModelCache.sourceHash()), 40)
+
+    def test_pickled_entry(self):
+        model = pmx.load(self.__source())
+        key = self.__cache.key(model.filepath, ())
+        self.__cache.save(key, model)
+        path = os.path.join(self.__cache.folder, key + cache.ModelCache.SUFFIX)
+        with np.load(path) as data:
+            arrays = dict(data)
+        arrays['model'] = np.frombuffer(pickle.dumps(pmx.Model()), dtype=np.uint8)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+        self.assertIsNone(self.__cache.load(key))
+        self.assertFalse(os.path.exists(path))
+
+    def test_unknown_class(self):
+        with self.assertRaises(TypeError):
+            cache._encode(object())
+        with self.assertRaises(KeyError):
+            cache._decode({'class':'Popen', 'fields':{}})
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def test_get(self):
+        c = cache.MemoryCache(max_size=100)
+        c.put('a', 'entry a', 10)
+        self.assertEqual(c.get('a'), 'entry a')
+        self.assertIsNone(c.get('b'))
+        self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_evict_least_recently_used(self):
+        # (operation, key, size, number of entries, total size, keys not in the cache)
+        steps = (
+            ('put', 'a', 40, 1, 40, ''),
+            ('put', 'b', 40, 2, 80, ''),
+            ('get', 'a', None, 2, 80, ''),
+            ('put', 'c', 40, 2, 80, 'b'), # b was used least recently
+            ('put', 'd', 100, 1, 100, 'ac'),
+            ('put', 'e', 101, 1, 100, 'e'), # larger than the cache
+            ('put', 'd', 30, 1, 30, ''), # replaces the old entry of d
+            ('discard', 'd', None, 0, 0, 'd'),
+            )
+        c = cache.MemoryCache(max_size=100)
+        for op, key, size, count, total, missing in steps:
+            if op == 'put':
+                c.put(key, 'entry ' + key, size)
+            elif op == 'get':
+                c.get(key)
+            else:
+                c.discard(key)
+            with self.subTest(step=(op, key, size)):
+                self.assertEqual((len(c), c.size()), (count, total))
+                for k in missing:
+                    self.assertIsNone(c.get(k))
+
+    def test_owner(self):
+        c = cache.MemoryCache(max_size=100)
+        c.put('a1', 'entry a1', 10, owner='a')
+        c.put('b1', 'entry b1', 10, owner='b')
+        c.put('a2', 'entry a2', 20, owner='a')
+        self.assertIsNone(c.get('a1'))
+        self.assertEqual(c.get('a2'), 'entry a2')
+        self.assertEqual(c.get('b1'), 'entry b1')
+        self.assertEqual(c.size(), 30)
+        c.discard('a2')
+        c.put('a3', 'entry a3', 10, owner='a')
+        self.assertEqual(len(c), 2)
+        c.clear()
+        self.assertEqual((len(c), c.size()), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+from helpers import TempDirTestCase
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx.cleaner import PMXCleaner
+
+
+class _BaselineCleaner:
+    """ The cleaner as it was before the array implementation, the reference for the tests. """
+
+    @classmethod
+    def clean(cls, pmx_model, mesh_only):
+        pmx_faces = pmx_model.faces
+        pmx_vertices = pmx_model.vertices
+
+        cls.__clean_pmx_faces(pmx_faces, pmx_model.materials, lambda f: frozenset(f))
+
+        index_map = {v:v for f in pmx_faces for v in f}
+        is_index_clean = len(index_map) == len(pmx_vertices)
+        if not is_index_clean:
+            new_vertex_count = 0
+            for v in sorted(index_map):
+                if v != new_vertex_count:
+                    pmx_vertices[new_vertex_count] = pmx_vertices[v]
+                    index_map[v] = new_vertex_count
+                new_vertex_count += 1
+            del pmx_vertices[new_vertex_count:]
+            for f in pmx_faces:
+                f[:] = [index_map[v] for v in f]
+
+        if mesh_only:
+            return
+
+        if not is_index_clean:
+            def __update_index(x):
+                x.index = index_map.get(x.index, None)
+                return x.index is not None
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+
+    @classmethod
+    def remove_doubles(cls, pmx_model, mesh_only):
+        pmx_vertices = pmx_model.vertices
+
+        vertex_map = [None] * len(pmx_vertices)
+        for i, v in enumerate(pmx_vertices):
+            vertex_map[i] = [tuple(v.co)]
+        if not mesh_only:
+            for m in pmx_model.morphs:
+                if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
+                    continue
+                for x in m.offsets:
+                    vertex_map[x.index].append(tuple(x.offset))
+        keys = {}
+        for i, v in enumerate(vertex_map):
+            k = tuple(v)
+            if k in keys:
+                vertex_map[i] = keys[k]
+            else:
+                vertex_map[i] = keys[k] = (i, len(keys))
+        if len(vertex_map) == len(keys):
+            return None
+
+        face_key_func = lambda f: frozenset({vertex_map[x][0]:tuple(pmx_vertices[x].uv) for x in f}.items())
+        cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, face_key_func)
+
+        if not mesh_only:
+            def __update_index(x):
+                indices = vertex_map[x.index]
+                x.index = indices[1] if x.index == indices[0] else None
+                return x.index is not None
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+        return vertex_map
+
+    @staticmethod
+    def __clean_pmx_faces(pmx_faces, pmx_materials, face_key_func):
+        new_face_count = 0
+        face_iter = iter(pmx_faces)
+        for mat in pmx_materials:
+            used_faces = set()
+            new_vertex_count = 0
+            for i in range(int(mat.vertex_count/3)):
+                f = next(face_iter)
+                f_key = face_key_func(f)
+                if len(f_key) != 3 or f_key in used_faces:
+                    continue
+                used_faces.add(f_key)
+                pmx_faces[new_face_count] = list(f)
+                new_face_count += 1
+                new_vertex_count += 3
+            mat.vertex_count = new_vertex_count
+        del pmx_faces[new_face_count:]
+
+    @staticmethod
+    def __clean_pmx_morphs(pmx_morphs, index_update_func):
+        for m in pmx_morphs:
+            if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
+                continue
+            m.offsets = [x for x in m.offsets if index_update_func(x)]
+
+
+def _random_model(rng):
+    """ Return a small model with doubled vertices, unused vertices and repeated faces. """
+    model = pmx.Model()
+    model.name = model.name_e = 'cleaner'
+    positions = [[0.5*rng.randint(0, 3), 0.0, 0.5*rng.randint(0, 1)] for i in range(rng.randint(2, 8))]
+    uvs = [[0.25*i, 0.5] for i in range(rng.randint(1, 3))]
+    vertex_count = rng.randint(4, 40)
+    for i in range(vertex_count):
+        v = pmx.Vertex()
+        v.co = list(rng.choice(positions))
+        v.normal = [0.0, 1.0, 0.0]
+        v.uv = list(rng.choice(uvs))
+        v.weight = pmx.BoneWeight()
+        v.weight.bones = [0]
+        model.vertices.append(v)
+
+    used = rng.sample(range(vertex_count), rng.randint(3, vertex_count))
+    faces = [[rng.choice(used) for j in range(3)] for i in range(rng.randint(1, 30))]
+    faces += [list(f) for f in rng.sample(faces, len(faces)//3)] # repeated faces
+    model.faces = faces
+    cuts = sorted(rng.randint(0, len(faces)) for i in range(rng.randint(0, 2)))
+    for start, end in zip([0] + cuts, cuts + [len(faces)]):
+        m = pmx.Material()
+        m.name = m.name_e = 'material%d'%len(model.materials)
+        m.diffuse = [1.0, 1.0, 1.0, 1.0]
+        m.specular = [0.0, 0.0, 0.0]
+        m.ambient = [0.5, 0.5, 0.5]
+        m.edge_color = [0.0, 0.0, 0.0, 1.0]
+        m.vertex_count = (end - start) * 3
+        model.materials.append(m)
+
+    b = pmx.Bone()
+    b.name = b.name_e = 'bone'
+    b.location = [0.0, 0.0, 0.0]
+    model.bones.append(b)
+
+    for i in range(rng.randint(0, 4)):
+        if i % 2:
+            m = pmx.UVMorph('uv%d'%i, 'uv%d'%i, 4, type_index=3)
+            offset_class, size = pmx.UVMorphOffset, 4
+        else:
+            m = pmx.VertexMorph('vertex%d'%i, 'vertex%d'%i, 1)
+            offset_class, size = pmx.VertexMorphOffset, 3
+        for index in rng.sample(range(vertex_count), rng.randint(0, vertex_count)):
+            o = offset_class()
+            o.index = index
+            o.offset = [0.25*rng.randint(0, 1)] * size
+            m.offsets.append(o)
+        model.morphs.append(m)
+    o = pmx.BoneMorphOffset()
+    o.index = 0
+    o.location_offset = [1.0, 0.0, 0.0]
+    o.rotation_offset = [0.0, 0.0, 0.0, 1.0]
+    m = pmx.BoneMorph('bone', 'bone', 4)
+    m.offsets.append(o)
+    model.morphs.append(m)
+    return model
+
+def _state(model, vertex_map):
+    vertex_map = None if vertex_map is None else [tuple(i) for i in vertex_map]
+    return (
+        [tuple(f) for f in model.faces],
+        [m.vertex_count for m in model.materials],
+        [(tuple(v.co), tuple(v.uv)) for v in model.vertices],
+        [[(o.index, tuple(o.offset)) for o in m.offsets] for m in model.morphs if isinstance(m, (pmx.VertexMorph, pmx.UVMorph))],
+        vertex_map,
+        )
+
+
+class TestPMXCleaner(TempDirTestCase):
+
+    def __check(self, clean_model, remove_doubles, mesh_only, cases=100):
+        rng = random.Random(0)
+        for case in range(cases):
+            filepath = self.save_pmx(_random_model(rng), 'cleaner.pmx')[0]
+            expected = pmx.load(filepath)
+            expected.vertices = list(expected.vertices)
+            model = pmx.load(filepath)
+
+            results = []
+            for cleaner, m in ((_BaselineCleaner, expected), (PMXCleaner, model)):
+                vertex_map = None
+                if clean_model:
+                    cleaner.clean(m, mesh_only)
+                if remove_doubles:
+                    vertex_map = cleaner.remove_doubles(m, mesh_only)
+                results.append(_state(m, vertex_map))
+            self.assertEqual(results[1], results[0], 'case %d'%case)
+
+    def test_clean(self):
+        self.__check(True, False, False)
+
+    def test_clean_mesh_only(self):
+        self.__check(True, False, True)
+
+    def test_remove_doubles(self):
+        self.__check(False, True, False)
+
+    def test_clean_and_remove_doubles(self):
+        self.__check(True, True, False)
+
+    def test_clean_and_remove_doubles_mesh_only(self):
+        self.__check(True, True, True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import exporter
+
+
+def _scan_corners(groups, values, tolerances):
+    """ Split the corners by a scan over them, the reference of _split_corners(). """
+    values = [np.asarray(v, dtype=np.float32).reshape(len(groups), np.shape(v)[-1]).tolist() for v in values]
+    splits = {}
+    corner_splits = []
+    first_corners = []
+    for corner, group in enumerate(groups.tolist()):
+        vals = [v[corner] for v in values]
+        candidates = splits.setdefault(group, [])
+        for split, split_vals in candidates:
+            if all(sum((a - b)**2 for a, b in zip(x, y)) < tol*tol for x, y, tol in zip(vals, split_vals, tolerances)):
+                corner_splits.append(split)
+                break
+        else:
+            candidates.append((len(first_corners), vals))
+            corner_splits.append(len(first_corners))
+            first_corners.append(corner)
+    return corner_splits, first_corners
+
+
+class TestSplitCorners(unittest.TestCase):
+
+    def __check(self, groups, values, tolerances):
+        corner_splits, first_corners = exporter._split_corners(groups, values, tolerances)
+        self.assertEqual((corner_splits.tolist(), first_corners.tolist()), _scan_corners(groups, values, tolerances))
+
+    def test_no_corners(self):
+        corner_splits, first_corners = exporter._split_corners(np.zeros(0, dtype=np.int64),
+                                                                [np.zeros((0, 2)), np.zeros((0, 3))], (0.001, 0.01))
+        self.assertEqual(len(corner_splits), 0)
+        self.assertEqual(len(first_corners), 0)
+
+    def test_random(self):
+        rng = np.random.RandomState(0)
+        for case in range(200):
+            count = rng.randint(0, 60)
+            groups = rng.randint(0, rng.randint(1, 8), count)
+            # few distinct values, some of them moved within or just beyond the tolerances
+            uvs = rng.randint(0, 3, (count, 2)) * 0.5 + rng.choice([0.0, 0.0004, 0.0015], (count, 2))
+            normals = rng.randint(-1, 2, (count, 3)) * 0.5 + rng.choice([0.0, -0.0, 0.004, 0.02], (count, 3))
+            with self.subTest(case=case):
+                self.__check(groups, [uvs, normals], (0.001, 0.01))
+                self.__check(groups, [uvs], (0.001,))
+
+
+class TestBoneWeights(unittest.TestCase):
+    # vertex groups 0-4 are bones 0-4, group 5 is not a bone
+    GROUP_BONES = np.array([0, 1, 2, 3, 4, -1])
+
+    BDEF1 = pmx.BoneWeight.BDEF1
+    BDEF2 = pmx.BoneWeight.BDEF2
+    BDEF4 = pmx.BoneWeight.BDEF4
+
+    # (vertex groups as (group, weight), weight type, bones, weights)
+    CASES = (
+        ([], BDEF1, [0, -1, -1, -1], [1.0, 0.0, 0.0, 0.0]),
+        ([(1, 0.5)], BDEF1, [1, -1, -1, -1], [1.0, 0.0, 0.0, 0.0]),
+        ([(1, 0.0), (5, 0.7), (2, 0.3)], BDEF1, [2, -1, -1, -1], [1.0, 0.0, 0.0, 0.0]),
+        ([(5, 0.5)], BDEF1, [0, -1, -1, -1], [1.0, 0.0, 0.0, 0.0]),
+        ([(1, 0.6), (2, 0.2)], BDEF2, [1, 2, -1, -1], [0.75, 0.25, 0.0, 0.0]),
+        ([(3, 0.25), (1, 0.25), (2, 0.5)], BDEF4, [3, 1, 2, 0], [0.25, 0.25, 0.5, 0.0]),
+        ([(0, 0.1), (1, 0.4), (2, 0.2), (3, 0.3), (4, 0.5)], BDEF4, [1, 2, 3, 4], [0.4/1.4, 0.2/1.4, 0.3/1.4, 0.5/1.4]),
+        ([(4, 0.5), (0, 0.5), (1, 0.5), (2, 0.5), (3, 0.5)], BDEF4, [4, 0, 1, 2], [0.25, 0.25, 0.25, 0.25]),
+        ([(0, 1.0), (1, 1.0), (5, 1.0), (2, 1.0), (3, 2.0)], BDEF4, [0, 1, 2, 3], [0.2, 0.2, 0.2, 0.4]),
+        )
+
+    def test_cases(self):
+        items = [(v, g, w) for v, case in enumerate(self.CASES) for g, w in case[0]]
+        vertices, groups, weights = (np.array(i) for i in zip(*items))
+        r = exporter._bone_weights(vertices.astype(np.int64), groups.astype(np.int64), weights.astype(np.float32),
+                                   len(self.CASES), self.GROUP_BONES)
+        for v, (vertex_groups, weight_type, bones, weights) in enumerate(self.CASES):
+            with self.subTest(vertex_groups=vertex_groups):
+                self.assertEqual(r.weight_type[v], weight_type)
+                self.assertEqual(r.bones[v].tolist(), bones)
+                np.testing.assert_allclose(r.weights[v], weights, rtol=1e-6)
+
+    def test_no_vertices(self):
+        empty = np.zeros(0, dtype=np.int64)
+        r = exporter._bone_weights(empty, empty, np.zeros(0, dtype=np.float32), 0, self.GROUP_BONES)
+        self.assertEqual((len(r.weight_type), r.bones.shape, r.weights.shape), (0, (0, 4), (0, 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
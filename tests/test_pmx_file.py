@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from helpers import TempDirTestCase, make_full_model, make_model
+from mmd_tools.core import pmx
+
+
+class TestPMXFile(TempDirTestCase):
+
+    def __save(self, model, name, add_uv_count):
+        return self.save_pmx(model, name, add_uv_count=add_uv_count)
+
+    def test_round_trip(self):
+        for add_uv_count in (0, 2):
+            filepath, data = self.__save(make_full_model(add_uv_count), 'source.pmx', add_uv_count)
+            model = pmx.load(filepath)
+            self.assertEqual(model.header.additional_uvs, add_uv_count)
+            self.assertEqual(self.__save(model, 'result.pmx', add_uv_count)[1], data)
+
+    def test_round_trip_of_vertex_objects(self):
+        filepath, data = self.__save(make_full_model(), 'source.pmx', 2)
+        model = pmx.load(filepath)
+        model.vertices = list(model.vertices)
+        self.assertEqual(self.__save(model, 'result.pmx', 2)[1], data)
+
+    def test_loaded_values(self):
+        model = pmx.load(self.__save(make_full_model(), 'source.pmx', 2)[0])
+        self.assertEqual(model.name, 'ラウンドトリップ')
+        self.assertEqual(len(model.vertices), 12)
+        v = model.vertices[3]
+        self.assertEqual(v.weight.type, pmx.BoneWeight.SDEF)
+        self.assertEqual(list(v.weight.weights.r0), [0.5, 1.0, 0.0])
+        self.assertEqual(list(v.additional_uvs[1]), [0.25, 0.5, 0.75, 1.0])
+        self.assertEqual([list(f) for f in model.faces], [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 11]])
+        self.assertEqual([b.parent for b in model.bones], [-1, 0, 1, 2])
+        self.assertEqual([l.target for l in model.bones[3].ik_links], [1, 0])
+        self.assertEqual([type(m) for m in model.morphs],
+                         [pmx.VertexMorph, pmx.UVMorph, pmx.BoneMorph, pmx.MaterialMorph, pmx.GroupMorph])
+        self.assertEqual(model.display[2].data, [(0, 1), (0, 2)])
+        self.assertEqual(model.joints[0].spring_rotation_constant, [10.0, 10.0, 10.0])
+
+    def test_truncated_file(self):
+        """ The records before the end of a truncated file are kept, like the records of a corrupted file. """
+        filepath, data = self.__save(make_model(count=12), 'source.pmx', 0)
+        with pmx.FileReadStream(filepath) as fs:
+            pmx.Header().load(fs)
+            header_size = fs.tell()
+        vertices, faces = [], []
+        for size in range(header_size, len(data)):
+            with self.assertLogs(level='ERROR'):
+                model = pmx.load(self.write_file('truncated.pmx', data[:size]))
+            vertices.append([tuple(v.co) for v in model.vertices])
+            faces.append([tuple(f) for f in model.faces])
+
+        expected = make_model(count=12)
+        expected_vertices = [tuple(v.co) for v in expected.vertices]
+        expected_faces = [tuple(f) for f in expected.faces]
+        # every number of complete records is loaded from some size
+        self.assertEqual(sorted(set(len(i) for i in vertices)), list(range(13)))
+        self.assertEqual(sorted(set(len(i) for i in faces)), list(range(5)))
+        for i, j in zip(vertices, faces):
+            self.assertEqual(i, expected_vertices[:len(i)])
+            self.assertEqual(j, expected_faces[:len(j)])
+            self.assertTrue(len(j) == 0 or len(i) == 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
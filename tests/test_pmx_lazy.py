@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from helpers import TempDirTestCase, make_full_model, make_model
+from mmd_tools.core import pmx
+from mmd_tools.core.pmx import cache
+from mmd_tools.core.pmx import lazy
+from mmd_tools.core.pmx.cleaner import PMXCleaner
+
+
+class TestLazyModel(TempDirTestCase):
+
+    def __check_sections(self, filepath):
+        expected = pmx.load(filepath)
+        model = lazy.load(filepath)
+        for name, skip in lazy.LazyModel.SECTIONS:
+            # cache._encode() converts the records to plain data which can be compared
+            self.assertEqual(cache._encode(getattr(model, name)), cache._encode(getattr(expected, name)), name)
+        self.assertEqual((model.name, model.comment_e), (expected.name, expected.comment_e))
+
+    def test_sections(self):
+        filepath = self.save_pmx(make_full_model(), 'source.pmx', add_uv_count=2)[0]
+        model = lazy.load(filepath)
+        self.assertFalse(any(model.isLoaded(name) for name, skip in lazy.LazyModel.SECTIONS))
+        self.assertEqual(len(model.bones), 4)
+        self.assertTrue(model.isLoaded('bones'))
+        self.assertFalse(model.isLoaded('morphs'))
+        self.__check_sections(filepath)
+
+    def test_truncated_file(self):
+        data = self.save_pmx(make_full_model(additional_uvs=0), 'source.pmx')[1]
+        with pmx.FileReadStream(self.temp_path('source.pmx')) as fs:
+            pmx.Header().load(fs)
+            header_size = fs.tell()
+        # every third size cuts each section at least once
+        for size in range(header_size, len(data), 3):
+            with self.subTest(size=size), self.assertLogs(level='ERROR'):
+                self.__check_sections(self.write_file('truncated.pmx', data[:size]))
+
+    def test_cleaner(self):
+        model = make_model(count=13, morphs=True) # the last vertex is not used
+        model.vertices[5].co = list(model.vertices[2].co)
+        filepath = self.save_pmx(model, 'source.pmx')[0]
+        results = []
+        for m in (pmx.load(filepath), lazy.load(filepath)):
+            PMXCleaner.clean(m, mesh_only=False)
+            vertex_map = PMXCleaner.remove_doubles(m, mesh_only=False)
+            results.append((vertex_map, self.save_pmx(m, 'result.pmx')[1]))
+        self.assertIsNotNone(results[0][0])
+        self.assertEqual(results[1], results[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
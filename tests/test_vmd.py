@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import unittest
+
+from helpers import TempDirTestCase
+from mmd_tools.core import vmd
+
+
+def _vmd_bytes(bones=None, shape_keys=None, cameras=(), lamps=()):
+    """ Return the bytes of a vmd file, packed with struct.
+
+    bones and shape_keys are lists of (name, [frame numbers]).
+    """
+    data = [struct.pack('<30s20s', vmd.Header.VMD_SIGN, 'モデル'.encode('shift_jis'))]
+    bones = bones or []
+    data.append(struct.pack('<L', sum(len(frames) for name, frames in bones)))
+    for name, frames in bones:
+        for i in frames:
+            data.append(struct.pack('<15sL3f4f64b', name.encode('shift_jis'), i,
+                                    0.5*i, 1.0, -2.0, 0.0, 0.0, 0.0, 1.0, *([20, 107]*32)))
+    shape_keys = shape_keys or []
+    data.append(struct.pack('<L', sum(len(frames) for name, frames in shape_keys)))
+    for name, frames in shape_keys:
+        for i in frames:
+            data.append(struct.pack('<15sLf', name.encode('shift_jis'), i, 0.25*i))
+    data.append(struct.pack('<L', len(cameras)))
+    for i in cameras:
+        data.append(struct.pack('<Lf3f3f24bLb', i, -45.0, 0.0, 10.0, 0.0, 0.1, 0.2, 0.3, *([20]*24 + [30, 0])))
+    data.append(struct.pack('<L', len(lamps)))
+    for i in lamps:
+        data.append(struct.pack('<L3f3f', i, 0.6, 0.6, 0.6, -0.5, -1.0, 0.5))
+    return b''.join(data)
+
+
+class TestVmd(TempDirTestCase):
+
+    def __load(self, filepath):
+        f = vmd.File()
+        f.load(filepath=filepath)
+        return f
+
+    def test_edited_keys_saved(self):
+        filepath = self.write_file('edit.vmd', _vmd_bytes(bones=[('センター', [0, 10, 20])], shape_keys=[('まばたき', [5])]))
+        f = self.__load(filepath)
+        keys = f.boneAnimation['センター']
+        keys[1].frame_number = 12345
+        keys[2].location = [1.0, 2.0, 3.0]
+        f.shapeKeyAnimation['まばたき'][0].weight = 1.0
+        self.assertEqual(keys.frame_number.tolist(), [0, 12345, 20])
+
+        output = self.temp_path('edit_out.vmd')
+        f.save(filepath=output)
+        result = self.__load(output)
+        keys = result.boneAnimation['センター']
+        self.assertEqual([k.frame_number for k in keys], [0, 12345, 20])
+        self.assertEqual(list(keys[2].location), [1.0, 2.0, 3.0])
+        self.assertEqual(result.shapeKeyAnimation['まばたき'][0].weight, 1.0)
+
+    def test_edited_camera_keys_saved(self):
+        filepath = self.write_file('camera.vmd', _vmd_bytes(cameras=[0, 30]))
+        f = self.__load(filepath)
+        for k in f.cameraAnimation:
+            k.distance = -10.0
+        output = self.temp_path('camera_out.vmd')
+        f.save(filepath=output)
+        result = self.__load(output)
+        self.assertEqual([k.distance for k in result.cameraAnimation], [-10.0, -10.0])
+
+    def test_round_trip(self):
+        data = _vmd_bytes(bones=[('センター', [0, 10, 20]), ('左足ＩＫ', [5, 6])], shape_keys=[('まばたき', [5, 30])],
+                          cameras=[0, 15], lamps=[0, 40])
+        f = self.__load(self.write_file('source.vmd', data))
+        output = self.temp_path('result.vmd')
+        f.save(filepath=output)
+        self.assertEqual(self.read_file(output), data)
+
+    def test_failed_writer_leaves_no_file(self):
+        output = self.temp_path('failed.vmd')
+        def _keys():
+            yield vmd.ShapeKeyFrameKey.fromRecord(0, 1.0)
+            raise RuntimeError('export failed')
+        with self.assertRaises(RuntimeError):
+            with vmd.FileWriter(output) as writer:
+                writer.writeShapeKeyTrack('まばたき', _keys())
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+        self.write_file('failed.vmd', b'previous')
+        with self.assertRaises(RuntimeError):
+            with vmd.FileWriter(output) as writer:
+                writer.writeShapeKeyTrack('まばたき', _keys())
+        self.assertEqual(self.read_file(output), b'previous')
+        self.assertEqual(os.listdir(self.temp_dir), ['failed.vmd'])
+
+    def test_writer(self):
+        output = self.temp_path('writer.vmd')
+        with vmd.FileWriter(output) as writer:
+            writer.writeShapeKeyTrack('まばたき', [vmd.ShapeKeyFrameKey.fromRecord(3, 0.75)])
+        result = self.__load(output)
+        self.assertEqual([(k.frame_number, k.weight) for k in result.shapeKeyAnimation['まばたき']], [(3, 0.75)])
+        self.assertEqual(os.listdir(self.temp_dir), ['writer.vmd'])
+
+
+if __name__ == '__main__':
+    unittest.main()